@@ -0,0 +1,88 @@
+"""Микробенчмарки представлений API и Directory.get_latest_version."""
+from django.urls import reverse
+
+from conftest import ELEMENTS, VERSIONS, run
+
+
+def test_directory_list(benchmark, client, caches):
+    url = reverse("refbook-directory")
+    response = run(benchmark, caches, lambda: client.get(url))
+    assert response.status_code == 200
+
+
+def test_directory_list_on_date(benchmark, client, caches):
+    url = reverse("refbook-directory")
+    data = {"date": "2000-01-01", "with_version": "1"}
+    response = run(benchmark, caches, lambda: client.get(url, data=data))
+    assert response.status_code == 200
+
+
+def test_elements_current_version(benchmark, client, directory, caches):
+    url = reverse("refbook-elements", args=[directory.id])
+    response = run(benchmark, caches, lambda: client.get(url))
+    assert len(response.json()["elements"]) == ELEMENTS
+
+
+def test_elements_page(benchmark, client, directory, caches):
+    url = reverse("refbook-elements", args=[directory.id])
+    data = {"version": "1.0", "limit": 1000, "after": "0000100"}
+    response = run(benchmark, caches, lambda: client.get(url, data=data))
+    assert response.status_code == 200
+
+
+def test_elements_stream(benchmark, client, directory, caches):
+    url = reverse("refbook-elements", args=[directory.id])
+
+    def stream():
+        response = client.get(url, data={"stream": "ndjson"})
+        return b"".join(response.streaming_content)
+
+    content = run(benchmark, caches, stream)
+    assert content.count(b"\n") == ELEMENTS
+
+
+def test_check_element(benchmark, client, directory, caches):
+    url = reverse("check-element", args=[directory.id])
+    data = {"code": "0000201", "value": "Значение 201", "version": "1.0"}
+    response = run(benchmark, caches, lambda: client.get(url, data=data))
+    assert response.status_code == 200
+
+
+def test_check_element_batch(benchmark, client, directory, caches):
+    url = reverse("check-element", args=[directory.id])
+    items = [
+        {"code": f"{number:07}", "value": f"Значение {number}", "version": "1.0"}
+        for number in range(1, 1000, 10)
+    ]
+    response = run(
+        benchmark,
+        caches,
+        lambda: client.post(url, {"items": items}, format="json"),
+    )
+    assert all(result["found"] for result in response.json()["results"])
+
+
+def test_diff(benchmark, client, directory, caches):
+    url = reverse("refbook-diff", args=[directory.id])
+    data = {"from": "1.0", "to": "2.0"}
+    response = run(benchmark, caches, lambda: client.get(url, data=data))
+    assert response.json()["changed"]
+
+
+def test_get_latest_version(benchmark, directory, caches):
+    version = run(benchmark, caches, directory.get_latest_version)
+    assert version.version == f"{VERSIONS}.0"
+
+
+def test_search(benchmark, client, directory, caches):
+    url = reverse("refbook-element-search", args=[directory.id])
+
+    def search():
+        # Запрос меняется, чтобы не измерять кэш готовых ответов.
+        search.number += 1
+        limit = search.number % 1000 + 1
+        return client.get(url, data={"q": "редакции", "limit": limit})
+
+    search.number = 0
+    response = run(benchmark, caches, search)
+    assert response.json()["elements"]
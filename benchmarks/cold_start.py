@@ -0,0 +1,96 @@
+"""Время запуска процесса и накладные расходы на запрос для профилей настроек.
+
+Для каждого профиля (по умолчанию medical_site.settings и
+medical_site.settings_api) несколько раз запускает отдельный процесс,
+который выполняет django.setup(), создаёт WSGI-приложение и обрабатывает
+первый запрос. Затем в одном процессе измеряет среднее время запроса к
+дешёвому адресу (/metrics), то есть в основном стоимость промежуточных слоёв
+и маршрутизации.
+
+    python benchmarks/cold_start.py --runs 5 --requests 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT = Path(__file__).resolve().parent.parent / "medical_site"
+PROFILES = ("medical_site.settings", "medical_site.settings_api")
+
+
+def child(path: str, requests: int) -> None:
+    sys.path.insert(0, str(PROJECT))
+    started = time.perf_counter()
+
+    import django
+
+    django.setup()
+
+    from django.core.wsgi import get_wsgi_application
+    from django.test import RequestFactory
+
+    application = get_wsgi_application()
+    factory = RequestFactory(SERVER_NAME="localhost")
+    application.get_response(factory.get(path))
+    boot = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        application.get_response(factory.get(path))
+    per_request = (time.perf_counter() - started) / requests if requests else 0.0
+
+    print(
+        json.dumps(
+            {
+                "boot": boot,
+                "per_request": per_request,
+                "modules": len(sys.modules),
+            }
+        )
+    )
+
+
+def measure(profile: str, path: str, requests: int = 0) -> dict:
+    command = [sys.executable, __file__, "--child", "--path", path]
+    command += ["--requests", str(requests)]
+    output = subprocess.run(
+        command,
+        env=dict(os.environ, DJANGO_SETTINGS_MODULE=profile),
+        check=True,
+        capture_output=True,
+        text=True,
+        timeout=300,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profiles", nargs="+", default=list(PROFILES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--path", default="/metrics")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.path, args.requests)
+        return
+
+    print(f"{'профиль':<28}{'запуск, мс':>12}{'запрос, мкс':>14}{'модулей':>10}")
+    for profile in args.profiles:
+        runs = [measure(profile, args.path) for _ in range(args.runs)]
+        warm = measure(profile, args.path, args.requests)
+        boot = statistics.median(run["boot"] for run in runs)
+        print(
+            f"{profile:<28}{boot * 1000:>12.1f}"
+            f"{warm['per_request'] * 1_000_000:>14.1f}{warm['modules']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
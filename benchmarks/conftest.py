@@ -0,0 +1,66 @@
+"""Общие фикстуры микробенчмарков.
+
+Синтетические справочники создаются один раз на сессию командой
+generate_refbooks; размер задаётся переменными окружения BENCH_DIRECTORIES,
+BENCH_VERSIONS и BENCH_ELEMENTS.
+"""
+import os
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from rest_framework.test import APIClient
+
+from refbooks.element_index import element_index
+from refbooks.models import Directory
+from refbooks.version_resolver import version_resolver
+
+DIRECTORIES = int(os.environ.get("BENCH_DIRECTORIES", 10))
+VERSIONS = int(os.environ.get("BENCH_VERSIONS", 3))
+ELEMENTS = int(os.environ.get("BENCH_ELEMENTS", 10_000))
+
+
+@pytest.fixture(scope="session")
+def django_db_setup(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        call_command(
+            "generate_refbooks",
+            directories=DIRECTORIES,
+            versions=VERSIONS,
+            elements=ELEMENTS,
+            stdout=open(os.devnull, "w"),
+        )
+
+
+@pytest.fixture
+def directory(db):
+    return Directory.objects.get(code="bench-0")
+
+
+@pytest.fixture
+def client(db):
+    return APIClient()
+
+
+def clear_caches():
+    """Сбрасывает кэши процесса, чтобы измерить обработку запроса «с нуля»."""
+    cache.clear()
+    element_index.clear()
+    version_resolver.clear()
+
+
+@pytest.fixture(params=["cold", "warm"])
+def caches(request, db):
+    """Режим измерения: cold — кэши сбрасываются перед каждым запросом."""
+    clear_caches()
+    return request.param
+
+
+def run(benchmark, caches, function):
+    """Измеряет ``function`` с прогревом или со сбросом кэшей перед вызовом."""
+    if caches == "cold":
+        return benchmark.pedantic(
+            function, setup=clear_caches, rounds=20, warmup_rounds=1
+        )
+    function()
+    return benchmark(function)
@@ -0,0 +1,74 @@
+"""Нагрузочный тест HTTP API справочников.
+
+Отправляет запросы к запущенному серверу с заданным числом одновременных
+клиентов и печатает RPS и задержки (p50/p99). Используется для сравнения
+WSGI- и ASGI-режимов, например:
+
+    python benchmarks/load_test.py http://127.0.0.1:8000/refbooks/1/check_element?code=J00&value=Хирург -c 64 -n 5000
+"""
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fetch(url: str, timeout: float) -> tuple[float, int]:
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        status = error.code
+    except OSError:
+        status = 0
+    return time.perf_counter() - started, status
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(url: str, concurrency: int, requests: int, timeout: float) -> dict:
+    url = urllib.parse.quote(url, safe=":/?&=%+")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: fetch(url, timeout), range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies = [latency for latency, _ in results]
+    errors = sum(1 for _, status in results if not 200 <= status < 500)
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("url")
+    parser.add_argument("-c", "--concurrency", type=int, default=32)
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--output", help="Сохранить результат в JSON-файл")
+    args = parser.parse_args()
+
+    result = run(args.url, args.concurrency, args.requests, args.timeout)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
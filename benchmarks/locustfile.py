@@ -0,0 +1,79 @@
+"""Нагрузочный сценарий API справочников для locust.
+
+Данные создаются командой generate_refbooks, сервер запускается отдельно:
+
+    cd medical_site && python manage.py generate_refbooks --elements 10000
+    python manage.py runserver  # или gunicorn / uvicorn
+    locust -f benchmarks/locustfile.py --host http://127.0.0.1:8000 \\
+        --headless -u 64 -r 16 -t 1m --json > benchmarks/results/locust.json
+
+Locust выводит RPS и перцентили задержек (p50, p99) по каждому запросу.
+"""
+import random
+
+from locust import HttpUser, between, task
+
+
+class RefbooksUser(HttpUser):
+    wait_time = between(0, 0.1)
+
+    def on_start(self):
+        refbooks = self.client.get("/refbooks/", name="/refbooks/").json()["refbooks"]
+        self.refbooks = [refbook["id"] for refbook in refbooks]
+        if not self.refbooks:
+            raise RuntimeError("Нет справочников: выполните generate_refbooks")
+        self.codes = {}
+        for refbook in self.refbooks:
+            page = self.client.get(
+                f"/refbooks/{refbook}/elements/",
+                params={"limit": 100},
+                name="/refbooks/[id]/elements/?limit",
+            ).json()
+            self.codes[refbook] = [
+                (element["element_code"], element["element_value"])
+                for element in page["elements"]
+            ]
+
+    @task(10)
+    def check_element(self):
+        refbook = random.choice(self.refbooks)
+        code, value = random.choice(self.codes[refbook])
+        self.client.get(
+            f"/refbooks/{refbook}/check_element",
+            params={"code": code, "value": value},
+            name="/refbooks/[id]/check_element",
+        )
+
+    @task(3)
+    def elements(self):
+        refbook = random.choice(self.refbooks)
+        self.client.get(
+            f"/refbooks/{refbook}/elements/", name="/refbooks/[id]/elements/"
+        )
+
+    @task(3)
+    def elements_page(self):
+        refbook = random.choice(self.refbooks)
+        code, _ = random.choice(self.codes[refbook])
+        self.client.get(
+            f"/refbooks/{refbook}/elements/",
+            params={"limit": 1000, "after": code},
+            name="/refbooks/[id]/elements/?limit",
+        )
+
+    @task(2)
+    def directories(self):
+        self.client.get(
+            "/refbooks/",
+            params={"date": "2020-01-01", "with_version": "1"},
+            name="/refbooks/?date",
+        )
+
+    @task(1)
+    def diff(self):
+        refbook = random.choice(self.refbooks)
+        self.client.get(
+            f"/refbooks/{refbook}/diff",
+            params={"from": "1.0"},
+            name="/refbooks/[id]/diff",
+        )
@@ -0,0 +1,87 @@
+"""Сравнение сериализации списка элементов: ElementSerializer и values_list.
+
+Измеряет только кодирование ответа ElementView (без обращения к БД): прежний
+путь строит экземпляры моделей, прогоняет их через ElementSerializer и
+JSONRenderer, быстрый — кодирует кортежи (код, значение) функцией dump_json.
+
+    python benchmarks/serialization.py --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "medical_site"))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "medical_site.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from refbooks import export  # noqa: E402
+from refbooks.models import Element  # noqa: E402
+from refbooks.serializers import ElementSerializer  # noqa: E402
+
+
+def serializer_path(rows: list) -> bytes:
+    elements = [
+        Element(element_code=code, element_value=value) for code, value in rows
+    ]
+    data = {"elements": ElementSerializer(elements, many=True).data}
+    return JSONRenderer().render(data)
+
+
+def fast_path(rows: list) -> bytes:
+    elements = [{"element_code": code, "element_value": value} for code, value in rows]
+    return export.dump_json({"elements": elements})
+
+
+def measure(function, rows: list, repeat: int) -> float:
+    return min(timeit.repeat(lambda: function(rows), number=1, repeat=repeat))
+
+
+def run(sizes: list, repeat: int) -> list:
+    results = []
+    for size in sizes:
+        rows = [(f"E{number:07}", f"Значение {number}") for number in range(size)]
+        assert serializer_path(rows) == fast_path(rows)
+        serializer = measure(serializer_path, rows, repeat)
+        fast = measure(fast_path, rows, repeat)
+        results.append(
+            {
+                "elements": size,
+                "encoder": "orjson" if export.orjson else "json",
+                "serializer_ms": round(serializer * 1000, 2),
+                "fast_ms": round(fast * 1000, 2),
+                "speedup": round(serializer / fast, 1),
+            }
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Сохранить результат в JSON-файл")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.repeat)
+    for result in results:
+        print(
+            "{elements:>8} элементов  ElementSerializer {serializer_ms:>9} мс  "
+            "{encoder} {fast_ms:>8} мс  x{speedup}".format(**result)
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
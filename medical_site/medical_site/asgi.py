@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "medical_site.settings")
 
 application = get_asgi_application()
+
+from refbooks.activation import start_in_process  # noqa: E402
+
+start_in_process()
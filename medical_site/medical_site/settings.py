@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "refbooks.middleware.RequestMetricsMiddleware",
+    "refbooks.middleware.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -82,6 +85,16 @@ DATABASES = {
         "NAME": BASE_DIR / "db.sqlite3",
     }
 }
+# Параметры соединений SQLite. Для PostgreSQL используйте профиль
+# medical_site.settings_production.
+REFBOOKS_SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -64000,
+    "mmap_size": 268435456,
+    "temp_store": "MEMORY",
+}
 
 
 # Password validation
@@ -126,5 +139,107 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 SWAGGER_SETTINGS = {
-    "DEFAULT_INFO": "refbooks.urls.swagger_info",
+    "DEFAULT_INFO": "medical_site.urls.swagger_info",
+}
+
+# Refbooks
+# Индекс элементов для проверки (CheckElementView): предельное суммарное число
+# элементов в памяти процесса и время жизни загруженной версии в секундах.
+REFBOOKS_ELEMENT_INDEX_MAX_ELEMENTS = 1_000_000
+REFBOOKS_ELEMENT_INDEX_TTL = 300
+# Максимальное число элементов в пакетной проверке (POST check_element).
+REFBOOKS_CHECK_BATCH_MAX_ITEMS = 10_000
+# Время жизни шкалы версий справочника в памяти процесса, секунды.
+REFBOOKS_RESOLVER_TTL = 300
+# Постраничная и потоковая выгрузка элементов (ElementView).
+REFBOOKS_ELEMENTS_MAX_PAGE_SIZE = 10_000
+REFBOOKS_EXPORT_CHUNK_SIZE = 2000
+# Cache-Control max-age для ответов с явно указанной версией и для текущих данных.
+REFBOOKS_VERSIONED_MAX_AGE = 86400
+REFBOOKS_CURRENT_MAX_AGE = 60
+# Время хранения различий между версиями в кэше, секунды.
+REFBOOKS_DIFF_CACHE_TIMEOUT = 86400
+# Асинхронные представления чтения для запуска под ASGI (uvicorn).
+REFBOOKS_ASYNC_VIEWS = os.environ.get("REFBOOKS_ASYNC_VIEWS") == "1"
+
+# Общий кэш процессов (готовые ответы API, различия версий). По умолчанию
+# используется кэш в памяти процесса; для нескольких процессов gunicorn
+# задайте, например, DJANGO_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# и DJANGO_CACHE_LOCATION=redis://127.0.0.1:6379/1.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("DJANGO_CACHE_LOCATION", ""),
+    }
+}
+# Кэш готовых JSON-ответов: имя кэша, время хранения ответа и время, в течение
+# которого одновременные запросы ждут построения ответа другим процессом.
+REFBOOKS_PAYLOAD_CACHE = "default"
+REFBOOKS_PAYLOAD_CACHE_TIMEOUT = 3600
+REFBOOKS_PAYLOAD_LOCK_TIMEOUT = 10
+# Метрики запросов (/metrics, заголовок Server-Timing) и журнал медленных
+# запросов refbooks.slow: порог в секундах и число сохраняемых SQL-запросов.
+REFBOOKS_SERVER_TIMING = True
+REFBOOKS_SLOW_REQUEST_SECONDS = 1.0
+REFBOOKS_SLOW_REQUEST_MAX_QUERIES = 50
+# Снимки элементов опубликованных версий (mmap-файлы), общие для процессов.
+# Если каталог не задан, элементы читаются из БД.
+REFBOOKS_SNAPSHOT_DIR = os.environ.get("REFBOOKS_SNAPSHOT_DIR")
+REFBOOKS_SNAPSHOT_OPEN_FILES = 128
+# Предельное суммарное число элементов в индексах поиска в памяти процесса
+# (используются, если БД не PostgreSQL).
+REFBOOKS_SEARCH_INDEX_MAX_ELEMENTS = 1_000_000
+# Предельное суммарное число кодов в шкалах истории элементов в памяти процесса.
+REFBOOKS_HISTORY_MAX_CODES = 1_000_000
+# Число элементов на странице формы версии в административном интерфейсе.
+REFBOOKS_ADMIN_INLINE_PER_PAGE = 100
+# Подготовка версий к началу действия (refbooks.activation): за сколько секунд
+# до начала суток строить снимки, ответы и индексы (не больше
+# REFBOOKS_ELEMENT_INDEX_TTL, иначе индекс процесса устареет раньше времени),
+# наибольший интервал проверок и запуск потока в каждом процессе приложения.
+REFBOOKS_ACTIVATION_LEAD_SECONDS = 120
+REFBOOKS_ACTIVATION_INTERVAL = 300
+REFBOOKS_ACTIVATION_THREAD = os.environ.get("REFBOOKS_ACTIVATION_THREAD") == "1"
+# Минимальный размер ответа, который сжимается (gzip, brotli, zstd).
+REFBOOKS_COMPRESS_MIN_BYTES = 1024
+# Описание API (drf_yasg): построение схемы в процессе и время хранения
+# построенной схемы в кэше. Профиль settings_api отключает построение и
+# отдаёт схему из файла REFBOOKS_SCHEMA_FILE.
+REFBOOKS_API_SCHEMA = True
+REFBOOKS_SCHEMA_CACHE_TIMEOUT = 3600
+REFBOOKS_SCHEMA_FILE = None
+# Ограничение частоты запросов (refbooks.throttling): ёмкость ведра и
+# скорость пополнения для каждого клиента по группам представлений,
+# известные ключи API (заголовок X-API-Key) с именами клиентов и лимиты
+# отдельных клиентов. Вёдра хранятся в памяти процесса (не более
+# REFBOOKS_THROTTLE_MAX_CLIENTS) или в кэше REFBOOKS_THROTTLE_CACHE.
+# REFBOOKS_THROTTLE_NUM_PROXIES — число доверенных прокси-серверов перед
+# приложением: 0 — адрес клиента берётся из REMOTE_ADDR, а X-Forwarded-For,
+# который может подделать клиент, не учитывается.
+REFBOOKS_THROTTLE_RATES = {
+    "check": "100/s",
+    "export": "60/min",
+    "directory": "120/min",
 }
+REFBOOKS_THROTTLE_API_KEYS = {}
+REFBOOKS_THROTTLE_CLIENT_RATES = {}
+REFBOOKS_THROTTLE_MAX_CLIENTS = 100_000
+REFBOOKS_THROTTLE_CACHE = None
+REFBOOKS_THROTTLE_NUM_PROXIES = int(os.environ.get("REFBOOKS_THROTTLE_NUM_PROXIES", 0))
+# Фоновые задачи (refbooks.jobs): исполнитель (thread — пул потоков процесса
+# приложения, worker — команда refbook_worker), число потоков пула, каталог
+# файлов результатов (общий для узлов), пауза refbook_worker при пустой
+# очереди, время хранения выполненных задач, интервал записи сигнала и
+# прогресса выполняющейся задачи и время без сигнала, после которого задача
+# считается завершённой с ошибкой (в секундах). В SQLite сигнал не пишется
+# во время транзакции импорта, поэтому там это время должно превышать
+# длительность самого долгого импорта.
+REFBOOKS_JOBS_BACKEND = os.environ.get("REFBOOKS_JOBS_BACKEND", "thread")
+REFBOOKS_JOBS_THREADS = 2
+REFBOOKS_JOBS_DIR = os.environ.get("REFBOOKS_JOBS_DIR")
+REFBOOKS_JOBS_POLL_SECONDS = 2.0
+REFBOOKS_JOBS_RETENTION_SECONDS = 7 * 86400
+REFBOOKS_JOBS_HEARTBEAT_SECONDS = 10
+REFBOOKS_JOBS_LEASE_SECONDS = 300
@@ -0,0 +1,55 @@
+"""
+Профиль настроек для узлов, обслуживающих только чтение API справочников.
+
+Запуск: DJANGO_SETTINGS_MODULE=medical_site.settings_api. Параметры БД и
+прочие настройки окружения берутся из профиля settings_production, если
+задан DJANGO_SECRET_KEY, иначе — из настроек по умолчанию.
+
+По сравнению с полным профилем:
+    - нет административного интерфейса, сессий, сообщений и аутентификации
+      (API не использует ни сессии, ни пользователей);
+    - нет фоновых задач (refbooks/jobs): импорт изменяет справочники;
+    - промежуточные слои — только метрики, сжатие и общие (CommonMiddleware);
+    - drf_yasg не импортируется; схему строят заранее командой
+      ``python manage.py generate_swagger swagger.json`` в полном профиле
+      и указывают путь к файлу в REFBOOKS_SCHEMA_FILE;
+    - ответы только в JSON (без Browsable API и его шаблонов).
+
+Время запуска процесса и накладные расходы на запрос для профилей
+сравниваются скриптом benchmarks/cold_start.py.
+"""
+import os
+
+if os.environ.get("DJANGO_SECRET_KEY"):
+    from .settings_production import *  # noqa: F401,F403
+else:
+    from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    "refbooks.apps.RefbooksConfig",
+    "rest_framework",
+]
+
+MIDDLEWARE = [
+    middleware
+    for middleware in MIDDLEWARE  # noqa: F405
+    if middleware.startswith("refbooks.")
+]
+MIDDLEWARE.insert(
+    MIDDLEWARE.index("refbooks.middleware.CompressionMiddleware") + 1,
+    "django.middleware.common.CommonMiddleware",
+)
+
+ROOT_URLCONF = "medical_site.urls_api"
+
+TEMPLATES = []
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": ["rest_framework.renderers.JSONRenderer"],
+    "DEFAULT_AUTHENTICATION_CLASSES": [],
+    "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.AllowAny"],
+    "UNAUTHENTICATED_USER": None,
+}
+
+REFBOOKS_API_SCHEMA = False
+REFBOOKS_SCHEMA_FILE = os.environ.get("REFBOOKS_SCHEMA_FILE")
@@ -0,0 +1,92 @@
+"""
+Профиль настроек для эксплуатации: PostgreSQL и параметры из окружения.
+
+Запуск: DJANGO_SETTINGS_MODULE=medical_site.settings_production.
+
+Переменные окружения:
+    DJANGO_SECRET_KEY          секретный ключ (обязательно)
+    DJANGO_ALLOWED_HOSTS       имена хостов через запятую
+    DJANGO_DB_NAME, DJANGO_DB_USER, DJANGO_DB_PASSWORD,
+    DJANGO_DB_HOST, DJANGO_DB_PORT
+                               основная БД PostgreSQL
+    DJANGO_DB_CONN_MAX_AGE     время жизни постоянного соединения, секунды
+    DJANGO_DB_POOL_MIN_SIZE, DJANGO_DB_POOL_MAX_SIZE
+                               пул соединений psycopg (Django 5.1 и новее)
+    DJANGO_DB_REPLICA_HOSTS    хосты реплик через запятую (host или host:port)
+
+Django 4.2 не содержит пула соединений: каждый поток процесса держит
+собственное постоянное соединение (CONN_MAX_AGE), исправность которого
+проверяется перед обработкой запроса (CONN_HEALTH_CHECKS). Чтобы число
+соединений с PostgreSQL не росло с числом процессов и потоков, между
+приложением и БД ставится PgBouncer в режиме pool_mode=transaction;
+в этом случае задайте DJANGO_DB_DISABLE_SERVER_SIDE_CURSORS=1.
+"""
+import os
+
+import django
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+SECRET_KEY = os.environ["DJANGO_SECRET_KEY"]
+
+ALLOWED_HOSTS = [
+    host.strip()
+    for host in os.environ.get("DJANGO_ALLOWED_HOSTS", "").split(",")
+    if host.strip()
+]
+
+
+def database(host: str, port: str) -> dict:
+    config = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("DJANGO_DB_NAME", "medical_site"),
+        "USER": os.environ.get("DJANGO_DB_USER", "medical_site"),
+        "PASSWORD": os.environ.get("DJANGO_DB_PASSWORD", ""),
+        "HOST": host,
+        "PORT": port,
+        "CONN_MAX_AGE": int(os.environ.get("DJANGO_DB_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        "DISABLE_SERVER_SIDE_CURSORS": (
+            os.environ.get("DJANGO_DB_DISABLE_SERVER_SIDE_CURSORS") == "1"
+        ),
+        "OPTIONS": {"connect_timeout": 5},
+    }
+    pool_size = os.environ.get("DJANGO_DB_POOL_MAX_SIZE")
+    if pool_size and django.VERSION >= (5, 1):
+        # Пул соединений несовместим с постоянными соединениями.
+        config["CONN_MAX_AGE"] = 0
+        config["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DJANGO_DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(pool_size),
+        }
+    return config
+
+
+DATABASES = {
+    "default": database(
+        os.environ.get("DJANGO_DB_HOST", "localhost"),
+        os.environ.get("DJANGO_DB_PORT", "5432"),
+    ),
+}
+
+# Реплики только для чтения: запросы GET к API справочников читают данные
+# с реплик (refbooks.routers.ReplicaRouter), запись идёт в default.
+REFBOOKS_READ_REPLICAS = []
+for number, address in enumerate(
+    filter(None, os.environ.get("DJANGO_DB_REPLICA_HOSTS", "").split(","))
+):
+    host, _, port = address.strip().partition(":")
+    alias = f"replica_{number}"
+    DATABASES[alias] = database(host, port or DATABASES["default"]["PORT"])
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    REFBOOKS_READ_REPLICAS.append(alias)
+
+if REFBOOKS_READ_REPLICAS:
+    DATABASE_ROUTERS = ["refbooks.routers.ReplicaRouter"]
+    MIDDLEWARE = [  # noqa: F405
+        MIDDLEWARE[0],  # noqa: F405
+        "refbooks.middleware.ReadReplicaMiddleware",
+        *MIDDLEWARE[1:],  # noqa: F405
+    ]
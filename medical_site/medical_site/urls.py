@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from django.urls import re_path
@@ -22,29 +23,38 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
 
+swagger_info = openapi.Info(
+    title="API Medical Terminology",
+    default_version="v1",
+    description="Сервис терминологии, который хранит коды данных и их контекст",
+    terms_of_service="https://www.google.com/policies/terms/",
+    contact=openapi.Contact(email="contact@snippets.local"),
+    license=openapi.License(name="BSD License"),
+)
+
 schema_view = get_schema_view(
-    openapi.Info(
-        title="API Medical Terminology",
-        default_version="v1",
-        description="Сервис терминологии, который хранит коды данных и их контекст",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="contact@snippets.local"),
-        license=openapi.License(name="BSD License"),
-    ),
+    swagger_info,
     public=True,
     permission_classes=(permissions.AllowAny,),
 )
+schema_cache_timeout = getattr(settings, "REFBOOKS_SCHEMA_CACHE_TIMEOUT", 3600)
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("", include("refbooks.urls")),
     path(
-        "swagger<format>/", schema_view.without_ui(cache_timeout=0), name="schema-json"
+        "swagger<format>/",
+        schema_view.without_ui(cache_timeout=schema_cache_timeout),
+        name="schema-json",
     ),
     path(
         "swagger/",
-        schema_view.with_ui("swagger", cache_timeout=0),
+        schema_view.with_ui("swagger", cache_timeout=schema_cache_timeout),
         name="schema-swagger-ui",
     ),
-    path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
+    path(
+        "redoc/",
+        schema_view.with_ui("redoc", cache_timeout=schema_cache_timeout),
+        name="schema-redoc",
+    ),
 ]
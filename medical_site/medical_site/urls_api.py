@@ -0,0 +1,26 @@
+"""
+URL configuration for read-only API nodes (medical_site.settings_api).
+
+Только чтение справочников и метрики: без административного интерфейса,
+фоновых задач (импорт изменяет справочники) и построения схемы Swagger.
+Заранее построенная схема (REFBOOKS_SCHEMA_FILE) отдаётся как файл.
+"""
+from django.conf import settings
+from django.http import FileResponse, Http404
+from django.urls import include, path
+
+from refbooks.urls import read_urlpatterns
+
+
+def schema_file(request):
+    if not settings.REFBOOKS_SCHEMA_FILE:
+        raise Http404("Схема API не построена")
+    return FileResponse(
+        open(settings.REFBOOKS_SCHEMA_FILE, "rb"), content_type="application/json"
+    )
+
+
+urlpatterns = [
+    path("", include(read_urlpatterns)),
+    path("swagger.json", schema_file, name="schema-json"),
+]
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "medical_site.settings")
 
 application = get_wsgi_application()
+
+from refbooks.activation import start_in_process  # noqa: E402
+
+start_in_process()
@@ -0,0 +1,183 @@
+"""Подготовка версий справочников к началу действия.
+
+Версии часто загружаются заранее, с будущей датой начала действия. В начале
+этих суток действующей становится новая версия, и все кэши текущих данных
+(ответы API, снимки, индексы проверки и поиска) оказываются пустыми.
+Планировщик заранее, за REFBOOKS_ACTIVATION_LEAD_SECONDS до начала действия,
+строит для таких версий снимки и кэшируемые ответы и загружает индексы
+процесса. Сами ответы переключаются на новую версию ровно в начале суток:
+действующая версия определяется по текущей дате, а max-age ответов для
+текущей версии не выходит за момент смены версии.
+
+Планировщик запускается командой ``refbook_activations`` или потоком
+в каждом процессе приложения (REFBOOKS_ACTIVATION_THREAD). Индексы
+в памяти процесса прогреваются только потоком; команда готовит общие
+для процессов снимки и ответы в кэше.
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .conditional import fingerprint_etag
+from .element_index import element_index
+from .export import dump_json, element_list
+from .history import history_index
+from .models import Version
+from .payload_cache import payload_cache, payload_key
+from .search import search_indexes
+from .snapshots import snapshot_store
+from .version_resolver import VersionRef, activation_time, version_resolver
+
+logger = logging.getLogger("refbooks.activation")
+
+
+def upcoming_versions(now: datetime, lead: timedelta) -> list:
+    """Версии, которые начнут действовать в ближайшие ``lead`` после ``now``.
+
+    :return: Пары (идентификатор справочника, версия) в порядке дат начала
+    :rtype: list[tuple[int, VersionRef]]
+    """
+    today = timezone.localdate(now)
+    last_day = timezone.localdate(now + lead)
+    versions = (
+        Version.objects.filter(start_date__gt=today, start_date__lte=last_day)
+        .order_by("start_date", "id")
+        .values_list("directory_id", *VersionRef._fields)
+    )
+    return [(row[0], VersionRef(*row[1:])) for row in versions]
+
+
+def next_activation(now: datetime) -> Optional[datetime]:
+    """Ближайший момент начала действия какой-либо версии после ``now``."""
+    start_date = (
+        Version.objects.filter(start_date__gt=timezone.localdate(now))
+        .order_by("start_date")
+        .values_list("start_date", flat=True)
+        .first()
+    )
+    return activation_time(start_date) if start_date is not None else None
+
+
+def prewarm(directory_id: int, version: VersionRef, local: bool = True) -> None:
+    """Готовит кэши версии, которая скоро станет действующей.
+
+    :param local: Загрузить также индексы в памяти текущего процесса
+    """
+    if snapshot_store.directory is not None:
+        path = snapshot_store.path(version.id, version.revision)
+        if not path.exists():
+            snapshot_store.build(version.id, version.revision)
+
+    # Ответ ElementView без параметров: ключ совпадает с тем, что построит
+    # представление, когда версия станет текущей.
+    etag = fingerprint_etag(("elements", version.id, version.revision), [], "json")
+    payload_cache.get_or_build(
+        payload_key(etag, "application/json"),
+        lambda: dump_json({"elements": element_list(version.id)}),
+    )
+
+    if local:
+        version_resolver.versions(directory_id)
+        element_index.get(directory_id, version.version)
+        if connection.vendor != "postgresql":
+            search_indexes.get(version)
+        history_index.timeline(directory_id)
+
+
+class ActivationScheduler:
+    """Прогревает кэши версий перед началом их действия.
+
+    :param lead: За сколько до начала действия готовить версию
+    :param interval: Наибольший интервал между проверками новых версий
+    :param local: Прогревать также индексы в памяти процесса
+    """
+
+    def __init__(self, lead: timedelta, interval: float, local: bool = True):
+        self.lead = lead
+        self.interval = interval
+        self.local = local
+        self.prepared = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self, now: Optional[datetime] = None) -> float:
+        """Готовит версии, начало действия которых ближе ``lead``.
+
+        :return: Через сколько секунд выполнить следующую проверку
+        :rtype: float
+        """
+        now = now or timezone.now()
+        for directory_id, version in upcoming_versions(now, self.lead):
+            key = (version.id, version.revision)
+            if key in self.prepared:
+                continue
+            try:
+                prewarm(directory_id, version, local=self.local)
+            except Exception:
+                logger.exception("Не удалось подготовить версию %s", version.id)
+                continue
+            self.prepared.add(key)
+            logger.info(
+                "Подготовлена версия %s справочника %s к %s",
+                version.version,
+                directory_id,
+                version.start_date,
+            )
+
+        upcoming = next_activation(now)
+        if upcoming is None:
+            return self.interval
+        until = (upcoming - self.lead - now).total_seconds()
+        return min(self.interval, until) if until > 0 else self.interval
+
+    def run_forever(self) -> None:
+        while not self._stop.is_set():
+            try:
+                delay = self.run_once()
+            except Exception:
+                logger.exception("Ошибка планировщика версий")
+                delay = self.interval
+            finally:
+                close_old_connections()
+            self._stop.wait(max(delay, 1))
+
+    def start(self) -> threading.Thread:
+        """Запускает планировщик в фоновом потоке процесса."""
+        self._thread = threading.Thread(
+            target=self.run_forever, name="refbooks-activation", daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def scheduler(local: bool = True) -> ActivationScheduler:
+    return ActivationScheduler(
+        lead=timedelta(
+            seconds=getattr(settings, "REFBOOKS_ACTIVATION_LEAD_SECONDS", 120)
+        ),
+        interval=getattr(settings, "REFBOOKS_ACTIVATION_INTERVAL", 300),
+        local=local,
+    )
+
+
+def start_in_process() -> Optional[ActivationScheduler]:
+    """Запускает поток планировщика, если включён REFBOOKS_ACTIVATION_THREAD.
+
+    Вызывается из wsgi.py и asgi.py, то есть в каждом рабочем процессе
+    (gunicorn без ``--preload``).
+    """
+    if not getattr(settings, "REFBOOKS_ACTIVATION_THREAD", False):
+        return None
+    activation_scheduler = scheduler()
+    activation_scheduler.start()
+    return activation_scheduler
@@ -1,13 +1,49 @@
+from datetime import date
 from typing import Optional, Type
 
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.utils import timezone
 from .models import Directory, Version, Element
-from django.core.exceptions import ObjectDoesNotExist
+from .version_resolver import VersionRef, version_resolver
 
 
-class ElementInline(admin.StackedInline):
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    """Формы только для одной страницы связанных объектов.
+
+    Номер страницы передаётся параметром ``page_param`` адреса страницы
+    изменения; форма отправляется на тот же адрес, поэтому сохраняются
+    объекты той же страницы.
+    """
+
+    page_number = 1
+    per_page = 100
+    page_param = "page"
+
+    def get_queryset(self):
+        if not hasattr(self, "page"):
+            paginator = Paginator(super().get_queryset(), self.per_page)
+            self.page = paginator.get_page(self.page_number)
+            self._queryset = self.page.object_list
+        return self._queryset
+
+
+class ElementInline(admin.TabularInline):
     model: Element = Element
     extra = 0
+    formset = PaginatedInlineFormSet
+    template = "admin/refbooks/paginated_tabular.html"
+    ordering = ("element_code",)
+    page_param = "elements_page"
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.page_number = request.GET.get(self.page_param, 1)
+        formset.page_param = self.page_param
+        formset.per_page = getattr(settings, "REFBOOKS_ADMIN_INLINE_PER_PAGE", 100)
+        return formset
 
 
 class VersionInline(admin.StackedInline):
@@ -27,38 +63,52 @@ class DirectoryAdmin(admin.ModelAdmin):
     list_display_links: tuple[str] = ("code", "name")
     inlines: list[Type[VersionInline]] = [VersionInline]
 
-    def search_current_version(self, obj):
-        current_version = obj.version_set.latest("version")
-        return current_version
+    def get_queryset(self, request):
+        # Действующая версия всех строк списка — подзапросом в том же запросе.
+        return (
+            super()
+            .get_queryset(request)
+            .with_effective_version(timezone.localdate())
+        )
 
-    def get_current_version(self, obj) -> Type[Version]:
+    def search_current_version(self, obj) -> Optional[VersionRef]:
+        return version_resolver.effective(obj.pk)
+
+    def get_current_version(self, obj) -> Optional[str]:
+        if hasattr(obj, "current_version"):
+            return obj.current_version
         current_version = self.search_current_version(obj)
-        version = current_version.version
-        return version
+        if current_version is None:
+            return None
+        return current_version.version
 
     get_current_version.short_description = "Текущая версия"
+    get_current_version.admin_order_field = "current_version"
 
-    def get_version_start_date(self, obj) -> Optional[str]:
+    def get_version_start_date(self, obj) -> Optional[date]:
+        if hasattr(obj, "current_version"):
+            return obj.start_date
         current_version = self.search_current_version(obj)
-        try:
-            version_start_date = current_version.start_date
-            return version_start_date
-        except ObjectDoesNotExist:
+        if current_version is None:
             return None
+        return current_version.start_date
 
     get_version_start_date.short_description = "Дата начала действия версии"
+    get_version_start_date.admin_order_field = "start_date"
 
 
 @admin.register(Version)
 class VersionAdmin(admin.ModelAdmin):
     list_display: tuple[str] = ("directory_code", "directory", "version", "start_date")
     list_display_links: tuple[str] = ("version",)
+    list_select_related: tuple[str] = ("directory",)
     inlines: list[Type[ElementInline]] = [ElementInline]
 
     def directory_code(self, obj) -> str:
         return obj.directory.code
 
     directory_code.short_description = "Код справочника"
+    directory_code.admin_order_field = "directory__code"
 
 
 @admin.register(Element)
@@ -70,3 +120,6 @@ class ElementAdmin(admin.ModelAdmin):
         "element_value"
     )
     list_display_links: tuple[str] = ("element_value",)
+    list_select_related: tuple[str] = ("directory_version__directory",)
+    # Выбор версии из списка всех версий заменён полем идентификатора.
+    raw_id_fields: tuple[str] = ("directory_version",)
@@ -1,7 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RefbooksConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "refbooks"
     verbose_name = "Справочники"
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .search import create_search_indexes
+
+        post_migrate.connect(create_search_indexes, sender=self)
@@ -0,0 +1,263 @@
+"""Асинхронные представления чтения для запуска под ASGI.
+
+Повторяют DirectoryView, ElementView и CheckElementView, но не занимают
+поток на время запроса: текущая версия, индекс элементов и снимки версий
+берутся из памяти, а обращения к БД выполняются через асинхронный интерфейс
+ORM. Элементы, как и в ElementView, отдаются и в формате столбцов
+(ColumnarJSONRenderer). Включаются настройкой REFBOOKS_ASYNC_VIEWS.
+"""
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import NotAcceptable, Throttled
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .conditional import (
+    adirectory_cache_validators,
+    element_cache_validators,
+    not_modified,
+    set_cache_headers,
+)
+from .element_index import element_index
+from .export import (
+    STREAM_CONTENT_TYPES,
+    aelement_page,
+    astream_elements,
+    dump_json,
+    element_list,
+    element_rows,
+    split_page,
+)
+from .models import Directory
+from .params import (
+    InvalidParameter,
+    parse_date,
+    parse_directory_cursor,
+    parse_limit,
+    parse_stream,
+)
+from .renderers import ColumnarJSONRenderer
+from .serializers import CheckElementBatchSerializer, CheckElementSerializer
+from .snapshots import snapshot_store
+from .throttling import TokenBucketThrottle, set_rate_limit_headers
+from .validation import check_elements
+from .version_resolver import version_resolver
+
+
+def json_response(data, status: int = 200) -> HttpResponse:
+    # Тело совпадает с ответом синхронных представлений (JSONRenderer DRF).
+    return HttpResponse(dump_json(data), status=status, content_type="application/json")
+
+
+def negotiate_renderer(request, renderers: list):
+    """Выбирает формат ответа, как APIView, и запоминает его в ``request``.
+
+    От выбранного формата зависит ETag (make_etag); при неподдерживаемом
+    Accept используется первый формат.
+    """
+    try:
+        renderer, _ = DefaultContentNegotiation().select_renderer(
+            Request(request), renderers
+        )
+    except NotAcceptable:
+        renderer = renderers[0]
+    request.accepted_renderer = renderer
+    return renderer
+
+
+def rendered_response(request, data) -> HttpResponse:
+    """Ответ в формате, выбранном negotiate_renderer()."""
+    renderer = request.accepted_renderer
+    prepare = getattr(renderer, "prepare", None)
+    response = json_response(prepare(data) if prepare is not None else data)
+    response["Content-Type"] = renderer.media_type
+    return response
+
+
+class AsyncAPIView(View):
+    throttle_scope = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Как и APIView, API не использует сессии, поэтому CSRF не проверяется.
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        throttle = TokenBucketThrottle()
+        if not throttle.allow_request(request, self):
+            # Тело и заголовок Retry-After — как у исключения Throttled в DRF.
+            wait = throttle.wait()
+            detail = str(Throttled(wait).detail)
+            response = json_response({"detail": detail}, status=429)
+            response.headers["Retry-After"] = str(math.ceil(wait))
+        else:
+            response = await super().dispatch(request, *args, **kwargs)
+        set_rate_limit_headers(request, response)
+        return response
+
+
+class AsyncDirectoryView(AsyncAPIView):
+    """Асинхронная версия DirectoryView."""
+
+    throttle_scope = "directory"
+
+    async def get(self, request):
+        with_version = "with_version" in request.GET
+        try:
+            date = parse_date(request.GET.get("date"))
+            limit = parse_limit(request.GET.get("limit"))
+            after = parse_directory_cursor(request.GET.get("after"))
+        except InvalidParameter as error:
+            return json_response({"error": str(error)}, status=400)
+
+        etag, last_modified, max_age = await adirectory_cache_validators(request)
+        response = not_modified(request, etag, last_modified, max_age)
+        if response is not None:
+            return response
+
+        directories = Directory.objects.listing(date, with_version, after)
+        if limit is None:
+            data = {"refbooks": [row async for row in directories]}
+        else:
+            rows = [row async for row in directories[: limit + 1]]
+            rows, next_cursor = split_page(rows, limit, cursor=lambda row: row["id"])
+            data = {"refbooks": rows, "next": next_cursor}
+        return set_cache_headers(json_response(data), etag, last_modified, max_age)
+
+
+class AsyncElementView(AsyncAPIView):
+    """Асинхронная версия ElementView."""
+
+    throttle_scope = "export"
+    renderer_classes = [JSONRenderer, ColumnarJSONRenderer]
+
+    async def get(self, request, id):
+        version_param = request.GET.get("version")
+        after = request.GET.get("after")
+        try:
+            limit = parse_limit(request.GET.get("limit"))
+            stream = parse_stream(request.GET.get("stream"))
+        except InvalidParameter as error:
+            return json_response({"error": str(error)}, status=400)
+        negotiate_renderer(request, [renderer() for renderer in self.renderer_classes])
+
+        if not await version_resolver.adirectory_exists(id):
+            return json_response({"error": "Справочник не найден"}, status=404)
+
+        if version_param:
+            version = await version_resolver.aget(id, version_param)
+            if version is None:
+                return json_response(
+                    {"error": "Версия не найдена для указанного справочника"},
+                    status=404,
+                )
+        else:
+            version = await version_resolver.aeffective(id)
+            if version is None:
+                return json_response(
+                    {"error": "Не найдено версий для указанного справочника"},
+                    status=404,
+                )
+
+        expires = None
+        if not version_param:
+            expires = await version_resolver.anext_activation(id)
+        etag, last_modified, max_age = element_cache_validators(
+            request, version, explicit=bool(version_param), expires=expires
+        )
+        response = not_modified(request, etag, last_modified, max_age)
+        if response is not None:
+            return response
+
+        snapshot = await snapshot_store.aget(version)
+        if stream:
+            response = StreamingHttpResponse(
+                astream_elements(version.id, stream, after, snapshot),
+                content_type=STREAM_CONTENT_TYPES[stream],
+            )
+            response["Content-Disposition"] = (
+                f'attachment; filename="refbook-{id}-{version.version}.{stream}"'
+            )
+        elif limit is not None:
+            elements, next_cursor = await aelement_page(
+                version.id, limit, after, snapshot
+            )
+            response = rendered_response(
+                request, {"elements": elements, "next": next_cursor}
+            )
+        else:
+            if snapshot is not None:
+                elements = element_list(version.id, snapshot)
+            else:
+                elements = [
+                    {"element_code": code, "element_value": value}
+                    async for code, value in element_rows(version.id)
+                ]
+            response = rendered_response(request, {"elements": elements})
+
+        return set_cache_headers(response, etag, last_modified, max_age)
+
+
+class AsyncCheckElementView(AsyncAPIView):
+    """Асинхронная версия CheckElementView."""
+
+    throttle_scope = "check"
+
+    async def get(self, request, id):
+        serializer = CheckElementSerializer(data=request.GET)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=400)
+        code = serializer.validated_data["code"]
+        value = serializer.validated_data["value"]
+        version = serializer.validated_data.get("version")
+
+        if not await version_resolver.adirectory_exists(id):
+            return json_response({"error": "Справочник не найден"}, status=404)
+
+        if version:
+            current_version = await version_resolver.aget(id, version)
+            if current_version is None:
+                return json_response({"error": "Версия не найдена"}, status=404)
+        else:
+            current_version = await version_resolver.aeffective(id)
+            if current_version is None:
+                return json_response(
+                    {"error": "Не найдено версий для указанного справочника"},
+                    status=404,
+                )
+
+        snapshot = await snapshot_store.aget(current_version)
+        if snapshot is not None:
+            found = snapshot.contains(code, value)
+        else:
+            found = await element_index.acontains(
+                id, current_version.version, code, value
+            )
+        if found:
+            return json_response({"message": "Элемент найден"})
+        return json_response(
+            {"error": "Элемент не найден в указанной версии"}, status=400
+        )
+
+    async def post(self, request, id):
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return json_response({"error": "Тело запроса должно быть JSON"}, status=400)
+
+        serializer = CheckElementBatchSerializer(data=data)
+        if not serializer.is_valid():
+            return json_response(serializer.errors, status=400)
+
+        # Пакетная проверка группирует запросы к БД и выполняется в пуле потоков.
+        results = await sync_to_async(check_elements)(
+            serializer.validated_data["items"], directory_id=id
+        )
+        return json_response({"results": results})
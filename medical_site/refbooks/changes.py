@@ -0,0 +1,204 @@
+"""Журнал изменений справочников и лента изменений для зеркал.
+
+Изменения справочников, версий и элементов записываются в таблицу Change
+в той же транзакции, что и сами данные (outbox): запись журнала фиксируется
+или откатывается вместе с изменением и не теряется при сбое процесса.
+При удалении версии или справочника записывается только их удаление:
+элементы удаляются вместе с версией, отдельных записей для них нет.
+
+Номер изменения ``seq`` выдаётся не при вставке, а функцией sequence()
+уже зафиксированным записям, по порядку их вставки и всегда больше всех
+ранее выданных номеров. Выдача номеров сериализована (одна инструкция
+UPDATE в SQLite, рекомендательная блокировка в PostgreSQL), поэтому номера
+растут в порядке фиксации: запись транзакции, которая началась раньше,
+а зафиксирована позже, получает номер больше уже отданных, и курсор
+клиента её не пропускает. Номера могут идти с пропусками.
+
+sequence() вызывается на основной БД после фиксации записывающей транзакции
+(transaction.on_commit), а записи, оставшиеся без номера из-за сбоя между
+фиксацией и нумерацией, нумеруются следующей записью журнала или
+обслуживанием очереди задач (refbooks.jobs.maintain). Чтение ленты ничего
+не изменяет и может выполняться на реплике.
+
+Зеркало применяет изменения по порядку ``seq`` и запоминает номер из
+заголовка X-Changes-Until как курсор следующего запроса. Стоимость запроса
+пропорциональна числу изменений после курсора, а не объёму справочников.
+"""
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .export import dump_json
+from .models import Change, Directory, Element, Version
+
+CHANGE_FIELDS = ("seq", "model", "action", "object_id", "data")
+# Ключ рекомендательной блокировки PostgreSQL для выдачи номеров изменений.
+SEQUENCE_LOCK = 0x7265_6662
+
+
+def directory_data(directory: Directory) -> dict:
+    return {
+        "code": directory.code,
+        "name": directory.name,
+        "description": directory.description,
+    }
+
+
+def version_data(version: Version) -> dict:
+    return {
+        "directory": version.directory_id,
+        "version": version.version,
+        "start_date": version.start_date,
+    }
+
+
+def element_data(element: Element) -> dict:
+    return {
+        "version": element.directory_version_id,
+        "element_code": element.element_code,
+        "element_value": element.element_value,
+    }
+
+
+MODELS = {
+    Directory: (Change.DIRECTORY, directory_data),
+    Version: (Change.VERSION, version_data),
+    Element: (Change.ELEMENT, element_data),
+}
+
+
+def record(instances: Iterable, action: str = Change.SAVE) -> None:
+    """Записывает изменения объектов в текущей транзакции.
+
+    Вне транзакции (autocommit) запись журнала выполняется отдельной
+    инструкцией сразу после изменения; административный интерфейс
+    и импорт изменяют данные в транзакции.
+
+    :param instances: Справочники, версии или элементы
+    :param action: Change.SAVE или Change.DELETE
+    """
+    rows = []
+    for instance in instances:
+        model, data = MODELS[type(instance)]
+        rows.append((model, instance.pk, data(instance)))
+    _write(rows, action)
+
+
+def record_version_elements(version_id: int) -> None:
+    """Записывает сохранение всех элементов версии в текущей транзакции.
+
+    Для загрузки версии через bulk_create, которая не отправляет сигналы:
+    элементы читаются из БД порциями, а не удерживаются в памяти.
+    """
+    elements = (
+        Element.objects.filter(directory_version_id=version_id)
+        .order_by("element_code")
+        .iterator(chunk_size=_chunk_size())
+    )
+    batch = []
+    for element in elements:
+        batch.append((Change.ELEMENT, element.pk, element_data(element)))
+        if len(batch) >= _chunk_size():
+            _write(batch, Change.SAVE)
+            batch = []
+    _write(batch, Change.SAVE)
+
+
+def _write(rows: list, action: str) -> None:
+    if not rows:
+        return
+    now = timezone.now()
+    using = router.db_for_write(Change)
+    Change.objects.using(using).bulk_create(
+        (
+            Change(
+                model=model,
+                action=action,
+                object_id=object_id,
+                data=data,
+                created_at=now,
+            )
+            for model, object_id, data in rows
+        ),
+        batch_size=_chunk_size(),
+    )
+    # Ошибка нумерации не должна доходить до записавшего: данные уже
+    # зафиксированы, а номера выдаст следующий вызов sequence().
+    transaction.on_commit(sequence, using=using, robust=True)
+
+
+def sequence() -> int:
+    """Выдаёт номера зафиксированным изменениям, у которых их ещё нет.
+
+    Номер — идентификатор записи со сдвигом, при котором наименьший новый
+    номер больше наибольшего выданного. Подзапросы в UPDATE вычисляются один
+    раз, а сама инструкция выполняется под блокировкой записи.
+
+    :return: Число пронумерованных изменений
+    :rtype: int
+    """
+    using = router.db_for_write(Change)
+    changes = Change.objects.using(using)
+    last = changes.filter(seq__isnull=False).order_by("-seq").values("seq")[:1]
+    first = changes.filter(seq__isnull=True).order_by("id").values("id")[:1]
+    offset = Greatest(
+        Coalesce(Subquery(last), Value(0)) - Subquery(first) + 1, Value(0)
+    )
+    with transaction.atomic(using=using):
+        connection = connections[using]
+        if connection.vendor == "postgresql":
+            # В READ COMMITTED следующая инструкция видит все записи,
+            # зафиксированные до получения блокировки.
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [SEQUENCE_LOCK])
+        return changes.filter(seq__isnull=True).update(seq=F("id") + offset)
+
+
+def changes_until(since: int, limit: Optional[int] = None) -> int:
+    """Номер, до которого включительно отдаются изменения после ``since``.
+
+    Только читает журнал: изменения, ещё не пронумерованные sequence(),
+    получат номера больше возвращённого.
+    """
+    until = (
+        Change.objects.filter(seq__isnull=False)
+        .order_by("-seq")
+        .values_list("seq", flat=True)
+        .first()
+    )
+    until = max(until or 0, since)
+    if limit is not None:
+        last = (
+            Change.objects.filter(seq__gt=since, seq__lte=until)
+            .order_by("seq")
+            .values_list("seq", flat=True)[limit - 1 : limit]
+        )
+        until = next(iter(last), until)
+    return until
+
+
+def stream_changes(since: int, until: int) -> Iterator[bytes]:
+    """Изменения с номерами в (since, until] в формате NDJSON."""
+    changes = (
+        Change.objects.filter(seq__gt=since, seq__lte=until)
+        .order_by("seq")
+        .values_list(*CHANGE_FIELDS)
+    )
+    for seq, model, action, object_id, data in changes.iterator(_chunk_size()):
+        yield dump_json(
+            {
+                "seq": seq,
+                "model": model,
+                "action": action,
+                "id": object_id,
+                "data": data,
+            }
+        ) + b"\n"
+
+
+def _chunk_size() -> int:
+    return getattr(settings, "REFBOOKS_EXPORT_CHUNK_SIZE", 2000)
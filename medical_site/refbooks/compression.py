@@ -0,0 +1,86 @@
+"""Сжатие ответов API: gzip, а при установленных пакетах — brotli и zstd.
+
+Кодировка выбирается по заголовку Accept-Encoding с учётом q-значений;
+при равном приоритете предпочитается более плотная. Ответы, отдаваемые
+из общего кэша (payload_cache), сжимаются один раз: сжатый вариант
+сохраняется в кэше рядом с исходным телом, и последующие запросы получают
+его без повторного сжатия.
+"""
+import gzip
+import zlib
+from typing import Callable, Optional
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+# Уровни сжатия для ответов, сжимаемых при каждом запросе, и для вариантов,
+# которые сжимаются один раз и хранятся в кэше.
+LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+PRECOMPRESS_LEVELS = {"zstd": 12, "br": 9, "gzip": 9}
+
+
+def available_encodings() -> tuple:
+    """Поддерживаемые кодировки в порядке предпочтения."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return tuple(encodings)
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Кодировка для заголовка Accept-Encoding или None, если сжатие не принято.
+
+    :return: zstd, br, gzip или None
+    :rtype: str or None
+    """
+    weights = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for encoding in available_encodings():
+        weight = weights.get(encoding, wildcard)
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(content: bytes, encoding: str, precompress: bool = False) -> bytes:
+    level = (PRECOMPRESS_LEVELS if precompress else LEVELS)[encoding]
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(content)
+    if encoding == "br":
+        return brotli.compress(content, quality=level)
+    return gzip.compress(content, compresslevel=level, mtime=0)
+
+
+def compressor(encoding: str) -> tuple[Callable, Callable]:
+    """Потоковый компрессор: функции сжатия очередной части и завершения."""
+    level = LEVELS[encoding]
+    if encoding == "zstd":
+        stream = zstandard.ZstdCompressor(level=level).compressobj()
+        return stream.compress, stream.flush
+    if encoding == "br":
+        stream = brotli.Compressor(quality=level)
+        return stream.process, stream.finish
+    stream = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return stream.compress, stream.flush
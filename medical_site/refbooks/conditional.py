@@ -0,0 +1,148 @@
+import hashlib
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponseBase
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils import timezone
+from django.utils.http import http_date, quote_etag
+
+from .payload_cache import payload_cache
+from .version_resolver import VersionRef, activation_time
+
+
+def make_etag(request, *parts) -> str:
+    """Сильный ETag представления ответа.
+
+    Помимо ``parts`` учитывает параметры запроса и формат, выбранный при
+    согласовании содержимого, чтобы разные представления имели разные ETag.
+    """
+    renderer = getattr(request, "accepted_renderer", None)
+    query = sorted(request.GET.lists())
+    return fingerprint_etag(parts, query, getattr(renderer, "format", None))
+
+
+def fingerprint_etag(parts: tuple, query: list, format: Optional[str]) -> str:
+    """ETag по частям ответа, параметрам запроса и формату.
+
+    Позволяет получить ETag ответа без самого запроса, например, чтобы
+    заранее построить ответ для кэша.
+    """
+    fingerprint = repr((parts, query, format))
+    return quote_etag(hashlib.sha1(fingerprint.encode()).hexdigest())
+
+
+def current_max_age(expires: Optional[date] = None) -> int:
+    """max-age ответа для текущих данных.
+
+    :param expires: Дата, с которой начнёт действовать другая версия;
+        ответ не кэшируется дольше этого момента
+    """
+    max_age = getattr(settings, "REFBOOKS_CURRENT_MAX_AGE", 60)
+    if expires is None:
+        return max_age
+    seconds = (activation_time(expires) - timezone.now()).total_seconds()
+    return max(0, min(max_age, int(seconds)))
+
+
+def element_cache_validators(
+    request, version: VersionRef, explicit: bool, expires: Optional[date] = None
+) -> tuple[str, datetime, int]:
+    """ETag, Last-Modified и max-age для элементов версии справочника.
+
+    Ответ с явно указанной версией меняется только вместе с её элементами,
+    поэтому кэшируется надолго; ответ для текущей версии — коротко и не
+    дольше даты ``expires``, с которой текущей станет другая версия.
+    """
+    max_age = (
+        getattr(settings, "REFBOOKS_VERSIONED_MAX_AGE", 86400)
+        if explicit
+        else current_max_age(expires)
+    )
+    etag = make_etag(request, "elements", version.id, version.revision)
+    return etag, version.updated_at, max_age
+
+
+def diff_cache_validators(
+    request,
+    from_version: VersionRef,
+    to_version: VersionRef,
+    explicit: bool,
+    expires: Optional[date] = None,
+) -> tuple[str, datetime, int]:
+    """ETag, Last-Modified и max-age для различий между версиями."""
+    max_age = (
+        getattr(settings, "REFBOOKS_VERSIONED_MAX_AGE", 86400)
+        if explicit
+        else current_max_age(expires)
+    )
+    etag = make_etag(
+        request,
+        "diff",
+        from_version.id,
+        from_version.revision,
+        to_version.id,
+        to_version.revision,
+    )
+    return etag, max(from_version.updated_at, to_version.updated_at), max_age
+
+
+def directory_cache_validators(request) -> tuple[str, Optional[datetime], int]:
+    """ETag и max-age для списка справочников, без Last-Modified.
+
+    ETag строится по поколению кэша ответов, которое увеличивают сигналы
+    сохранения и удаления справочников и версий, поэтому проверка не
+    обращается к БД. Текущая дата входит в ETag, так как от неё зависит
+    действующая версия.
+    """
+    return _directory_validators(request, payload_cache.generation())
+
+
+async def adirectory_cache_validators(
+    request,
+) -> tuple[str, Optional[datetime], int]:
+    generation = await sync_to_async(payload_cache.generation)()
+    return _directory_validators(request, generation)
+
+
+def _directory_validators(
+    request, generation: int
+) -> tuple[str, Optional[datetime], int]:
+    etag = make_etag(request, "refbooks", timezone.localdate(), generation)
+    # Действующие версии меняются в начале суток.
+    max_age = current_max_age(timezone.localdate() + timedelta(days=1))
+    return etag, None, max_age
+
+
+def not_modified(
+    request, etag: str, last_modified: Optional[datetime], max_age: int
+) -> Optional[HttpResponseBase]:
+    """Ответ 304/412 на условный запрос или None, если нужен полный ответ."""
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified and int(last_modified.timestamp()),
+    )
+    if response is not None:
+        set_cache_headers(response, etag, last_modified, max_age)
+    return response
+
+
+def set_cache_headers(
+    response: HttpResponseBase,
+    etag: str,
+    last_modified: Optional[datetime],
+    max_age: int,
+) -> HttpResponseBase:
+    response.headers["ETag"] = etag
+    if last_modified is not None:
+        response.headers["Last-Modified"] = http_date(last_modified.timestamp())
+    patch_cache_control(response, public=True, max_age=max_age)
+    patch_vary_headers(response, ("Accept",))
+    return response
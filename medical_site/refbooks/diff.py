@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .export import element_rows
+from .version_resolver import VersionRef
+
+
+def version_diff(from_version: VersionRef, to_version: VersionRef) -> dict:
+    """Различия между элементами двух версий справочника.
+
+    Результат кэшируется по паре версий; ключ включает ревизии элементов,
+    поэтому изменение любой из версий делает прежний результат недоступным.
+    """
+    key = "refbooks:diff:{}:{}:{}:{}".format(
+        from_version.id, from_version.revision, to_version.id, to_version.revision
+    )
+    diff = cache.get(key)
+    if diff is None:
+        diff = compute_diff(from_version.id, to_version.id)
+        cache.set(key, diff, getattr(settings, "REFBOOKS_DIFF_CACHE_TIMEOUT", 86400))
+    return diff
+
+
+def compute_diff(from_version_id: int, to_version_id: int) -> dict:
+    """Сравнивает элементы двух версий по коду элемента.
+
+    :return: Словарь со списками added, removed и changed, упорядоченными по коду
+    :rtype: dict
+    """
+    old = dict(element_rows(from_version_id))
+    new = dict(element_rows(to_version_id))
+    return {
+        "added": [
+            {"element_code": code, "element_value": new[code]}
+            for code in sorted(new.keys() - old.keys())
+        ],
+        "removed": [
+            {"element_code": code, "element_value": old[code]}
+            for code in sorted(old.keys() - new.keys())
+        ],
+        "changed": [
+            {"element_code": code, "old_value": old[code], "new_value": new[code]}
+            for code in sorted(old.keys() & new.keys())
+            if old[code] != new[code]
+        ],
+    }
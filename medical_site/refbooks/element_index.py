@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+
+from .metrics import cache_result
+from .models import Element, Version
+
+
+class _Entry(NamedTuple):
+    version_id: int
+    elements: frozenset
+    loaded_at: float
+
+
+class ElementIndex:
+    """Индекс элементов справочников в памяти процесса.
+
+    Хранит для каждой пары (идентификатор справочника, версия) множество пар
+    (код, значение). Версия загружается при первом обращении, вытеснение
+    выполняется по принципу LRU, а общий объём ограничен суммарным числом
+    элементов во всех загруженных версиях.
+
+    Индекс локален для процесса: сигналы сбрасывают его только в том
+    процессе, где произошла запись, поэтому записи дополнительно
+    устаревают через ``ttl`` секунд.
+    """
+
+    def __init__(self, max_elements: int, ttl: Optional[float] = None):
+        self.max_elements = max_elements
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[int, str], _Entry] = OrderedDict()
+        self._size = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, directory_id: int, version: str) -> Optional[frozenset]:
+        """Возвращает множество пар (код, значение) версии справочника.
+
+        :return: Множество элементов или None, если версия не найдена
+        :rtype: frozenset or None
+        """
+        key = (directory_id, version)
+        entry, generation = self._cached(key)
+        if entry is not None:
+            return entry.elements
+        try:
+            version_id = _version_id(directory_id, version).get()
+        except Version.DoesNotExist:
+            return None
+        elements = frozenset(_elements(version_id))
+        return self._remember(key, generation, version_id, elements)
+
+    async def aget(self, directory_id: int, version: str) -> Optional[frozenset]:
+        key = (directory_id, version)
+        entry, generation = self._cached(key)
+        if entry is not None:
+            return entry.elements
+        try:
+            version_id = await _version_id(directory_id, version).aget()
+        except Version.DoesNotExist:
+            return None
+        elements = frozenset([element async for element in _elements(version_id)])
+        return self._remember(key, generation, version_id, elements)
+
+    def peek(self, version_id: int) -> Optional[frozenset]:
+        """Возвращает элементы версии, только если она уже загружена в индекс."""
+        with self._lock:
+            key = next(
+                (
+                    key
+                    for key, entry in self._entries.items()
+                    if entry.version_id == version_id
+                ),
+                None,
+            )
+            entry = self._lookup(key) if key is not None else None
+        return entry.elements if entry is not None else None
+
+    def contains(
+        self, directory_id: int, version: str, code: str, value: str
+    ) -> Optional[bool]:
+        """Проверяет наличие элемента с кодом и значением в версии справочника.
+
+        :return: True/False или None, если версия не найдена
+        :rtype: bool or None
+        """
+        elements = self.get(directory_id, version)
+        if elements is None:
+            return None
+        return (code, value) in elements
+
+    async def acontains(
+        self, directory_id: int, version: str, code: str, value: str
+    ) -> Optional[bool]:
+        elements = await self.aget(directory_id, version)
+        if elements is None:
+            return None
+        return (code, value) in elements
+
+    def invalidate_directory(self, directory_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if key[0] == directory_id]:
+                self._discard(key)
+
+    def invalidate_version(self, version_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            for key in [
+                key
+                for key, entry in self._entries.items()
+                if entry.version_id == version_id
+            ]:
+                self._discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._size = 0
+
+    def _cached(self, key) -> tuple[Optional[_Entry], int]:
+        with self._lock:
+            entry, generation = self._lookup(key), self._generation
+        cache_result("element_index", "miss" if entry is None else "hit")
+        return entry, generation
+
+    def _remember(self, key, generation: int, version_id: int, elements: frozenset):
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, _Entry(version_id, elements, time.monotonic()))
+        return elements
+
+    def _lookup(self, key) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl is not None and time.monotonic() - entry.loaded_at > self.ttl:
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key, entry: _Entry) -> None:
+        if len(entry.elements) > self.max_elements:
+            return
+        self._discard(key)
+        self._entries[key] = entry
+        self._size += len(entry.elements)
+        while self._size > self.max_elements:
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+
+    def _discard(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.elements)
+
+
+def _version_id(directory_id: int, version: str):
+    return Version.objects.filter(
+        directory_id=directory_id, version=version
+    ).values_list("id", flat=True)
+
+
+def _elements(version_id: int):
+    return (
+        Element.objects.filter(directory_version_id=version_id)
+        .order_by()
+        .values_list("element_code", "element_value")
+    )
+
+
+element_index = ElementIndex(
+    max_elements=getattr(settings, "REFBOOKS_ELEMENT_INDEX_MAX_ELEMENTS", 1_000_000),
+    ttl=getattr(settings, "REFBOOKS_ELEMENT_INDEX_TTL", 300),
+)
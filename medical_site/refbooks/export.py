@@ -0,0 +1,182 @@
+import csv
+import json
+from itertools import islice
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.db.models import QuerySet
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Element
+from .snapshots import Snapshot, snapshot_store
+from .version_resolver import VersionRef
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+ELEMENT_FIELDS = ("element_code", "element_value")
+STREAM_CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def element_rows(version_id: int, after: Optional[str] = None) -> QuerySet:
+    """Кортежи (код, значение) элементов версии в порядке кодов.
+
+    :param after: Код, после которого начинается выборка (курсор)
+    """
+    elements = Element.objects.filter(directory_version_id=version_id)
+    if after is not None:
+        elements = elements.filter(element_code__gt=after)
+    return elements.order_by("element_code").values_list(*ELEMENT_FIELDS)
+
+
+def version_rows(version: VersionRef) -> Iterable:
+    """Пары (код, значение) версии из её снимка, если он есть, иначе из БД."""
+    snapshot = snapshot_store.get(version)
+    return snapshot.rows() if snapshot is not None else element_rows(version.id)
+
+
+def element_list(version_id: int, snapshot: Optional[Snapshot] = None) -> list:
+    """Все элементы версии в виде словарей, как в ответе ElementView.
+
+    :param snapshot: Снимок версии; если указан, элементы читаются из него
+    """
+    rows = snapshot.rows() if snapshot is not None else element_rows(version_id)
+    return [{"element_code": code, "element_value": value} for code, value in rows]
+
+
+def dump_json(data) -> bytes:
+    """Компактный JSON в UTF-8, побайтно совпадающий с выводом JSONRenderer.
+
+    Использует orjson, если он установлен. Даты и прочие типы, которые
+    orjson кодирует иначе, передаются кодировщику DRF.
+    """
+    if orjson is None:
+        content = json.dumps(
+            data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+    else:
+        content = orjson.dumps(
+            data,
+            default=JSONEncoder().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME,
+        )
+    # JSONRenderer экранирует разделители строк, недопустимые в JavaScript.
+    return content.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+        b"\xe2\x80\xa9", b"\\u2029"
+    )
+
+
+def split_page(rows: list, limit: int, cursor) -> tuple[list, Optional[object]]:
+    """Делит выборку из ``limit + 1`` строк на страницу и курсор следующей.
+
+    :param cursor: Функция, возвращающая курсор по последней строке страницы
+    """
+    next_cursor = cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def element_page(
+    version_id: int,
+    limit: int,
+    after: Optional[str] = None,
+    snapshot: Optional[Snapshot] = None,
+) -> tuple[list, Optional[str]]:
+    """Страница элементов версии с курсором по коду элемента.
+
+    :return: Элементы страницы и курсор следующей страницы (или None)
+    :rtype: tuple[list[dict], str or None]
+    """
+    if snapshot is not None:
+        rows = list(islice(snapshot.rows(after), limit + 1))
+    else:
+        rows = list(element_rows(version_id, after)[: limit + 1])
+    return _page(rows, limit)
+
+
+async def aelement_page(
+    version_id: int,
+    limit: int,
+    after: Optional[str] = None,
+    snapshot: Optional[Snapshot] = None,
+) -> tuple[list, Optional[str]]:
+    if snapshot is not None:
+        return element_page(version_id, limit, after, snapshot)
+    rows = [row async for row in element_rows(version_id, after)[: limit + 1]]
+    return _page(rows, limit)
+
+
+def stream_elements(
+    version_id: int,
+    stream_format: str,
+    after: Optional[str] = None,
+    snapshot: Optional[Snapshot] = None,
+) -> Iterator:
+    """Построчная выгрузка элементов версии в формате NDJSON или CSV."""
+    encode = _ENCODERS[stream_format]()
+    if snapshot is not None:
+        rows = snapshot.rows(after)
+    else:
+        rows = element_rows(version_id, after).iterator(chunk_size=_chunk_size())
+    if stream_format == "csv":
+        yield encode(ELEMENT_FIELDS)
+    for row in rows:
+        yield encode(row)
+
+
+async def astream_elements(
+    version_id: int,
+    stream_format: str,
+    after: Optional[str] = None,
+    snapshot: Optional[Snapshot] = None,
+) -> AsyncIterator:
+    """Асинхронная выгрузка; элементы читаются порциями с курсором по коду."""
+    encode = _ENCODERS[stream_format]()
+    chunk_size = _chunk_size()
+    if stream_format == "csv":
+        yield encode(ELEMENT_FIELDS)
+    if snapshot is not None:
+        for row in snapshot.rows(after):
+            yield encode(row)
+        return
+    while True:
+        rows = [row async for row in element_rows(version_id, after)[:chunk_size]]
+        for row in rows:
+            yield encode(row)
+        if len(rows) < chunk_size:
+            break
+        after = rows[-1][0]
+
+
+def _page(rows: list, limit: int) -> tuple[list, Optional[str]]:
+    rows, next_cursor = split_page(rows, limit, cursor=lambda row: row[0])
+    return [dict(zip(ELEMENT_FIELDS, row)) for row in rows], next_cursor
+
+
+def _ndjson_encoder():
+    def encode(row) -> bytes:
+        return dump_json(dict(zip(ELEMENT_FIELDS, row))) + b"\n"
+
+    return encode
+
+
+def _csv_encoder():
+    return csv.writer(_Echo()).writerow
+
+
+class _Echo:
+    """Псевдобуфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+_ENCODERS = {"ndjson": _ndjson_encoder, "csv": _csv_encoder}
+
+
+def _chunk_size() -> int:
+    return getattr(settings, "REFBOOKS_EXPORT_CHUNK_SIZE", 2000)
@@ -0,0 +1,165 @@
+"""История значений элементов справочника по датам.
+
+Для каждого справочника в памяти процесса строится шкала кодов: для кода
+хранятся даты начала версий, в которых его значение менялось, и значения
+с этих дат (None — код в версии отсутствует). Значение кода на дату
+находится бинарным поиском по датам, без соединения версий и элементов.
+
+Шкала строится по версиям из ``version_resolver``. Если с момента
+построения добавились только более поздние версии, в шкалу дописываются
+их изменения; при изменении или удалении уже учтённых версий шкала
+строится заново.
+"""
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Iterable, Optional
+
+from django.conf import settings
+
+from .export import version_rows
+from .metrics import cache_result
+from .version_resolver import VersionRef, version_resolver
+
+
+class CodeTimeline:
+    """Шкала значений кодов одного справочника."""
+
+    def __init__(self):
+        self.versions = []
+        self.codes = {}
+        self._last = {}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def extended(
+        self, versions: list, rows: Callable[[VersionRef], Iterable]
+    ) -> "CodeTimeline":
+        """Новая шкала, дополненная версиями ``versions``.
+
+        Версии должны начинать действовать позже всех учтённых. Текущая шкала
+        не изменяется: её могут одновременно читать другие потоки, а списки
+        изменившихся кодов копируются.
+        """
+        timeline = CodeTimeline()
+        timeline.versions = [*self.versions, *versions]
+        timeline.codes = dict(self.codes)
+        last = self._last
+        for version in versions:
+            current = dict(rows(version))
+            changes = [
+                (code, value)
+                for code, value in current.items()
+                if last.get(code) != value
+            ]
+            changes.extend((code, None) for code in last.keys() - current.keys())
+            for code, value in changes:
+                dates, values = timeline.codes.get(code, ((), ()))
+                timeline.codes[code] = (
+                    [*dates, version.start_date],
+                    [*values, value],
+                )
+            last = current
+        timeline._last = last
+        return timeline
+
+    def value(self, code: str, on_date: date) -> tuple:
+        """Значение кода на дату и дата, с которой оно действует.
+
+        :return: Значение (None, если кода на эту дату нет) и дата начала
+        :rtype: tuple[Optional[str], Optional[date]]
+        """
+        timeline = self.codes.get(code)
+        if timeline is None:
+            return None, None
+        dates, values = timeline
+        position = bisect_right(dates, on_date)
+        if not position or values[position - 1] is None:
+            return None, None
+        return values[position - 1], dates[position - 1]
+
+
+class HistoryIndex:
+    """Шкалы значений кодов справочников, вытесняемые по принципу LRU.
+
+    Объём ограничен суммарным числом кодов во всех шкалах.
+    """
+
+    def __init__(self, max_codes: int):
+        self.max_codes = max_codes
+        self._lock = threading.Lock()
+        self._timelines = OrderedDict()
+        self._size = 0
+
+    def timeline(self, directory_id: int) -> Optional[CodeTimeline]:
+        """Актуальная шкала справочника или None, если справочника нет."""
+        versions = version_resolver.versions(directory_id)
+        if versions is None:
+            return None
+        with self._lock:
+            timeline = self._timelines.get(directory_id)
+            if timeline is not None:
+                self._timelines.move_to_end(directory_id)
+        known = len(timeline.versions) if timeline is not None else 0
+        if timeline is None:
+            cache_result("history", "miss")
+            timeline = CodeTimeline()
+        elif versions[:known] != timeline.versions:
+            # Учтённая версия изменена или удалена, либо добавлена более ранняя.
+            cache_result("history", "rebuild")
+            timeline, known = CodeTimeline(), 0
+        elif known == len(versions):
+            cache_result("history", "hit")
+            return timeline
+        else:
+            cache_result("history", "extend")
+        timeline = timeline.extended(versions[known:], version_rows)
+        self._store(directory_id, timeline)
+        return timeline
+
+    def lookup(self, directory_id: int, codes: Iterable[str], on_date: date):
+        """Значения кодов справочника на дату.
+
+        :return: Список результатов в порядке кодов или None, если справочника нет
+        :rtype: list[dict] or None
+        """
+        timeline = self.timeline(directory_id)
+        if timeline is None:
+            return None
+        results = []
+        for code in codes:
+            value, since = timeline.value(code, on_date)
+            results.append(
+                {
+                    "element_code": code,
+                    "element_value": value,
+                    "found": value is not None,
+                    "since": since,
+                }
+            )
+        return results
+
+    def clear(self) -> None:
+        with self._lock:
+            self._timelines.clear()
+            self._size = 0
+
+    def _store(self, directory_id: int, timeline: CodeTimeline) -> None:
+        with self._lock:
+            previous = self._timelines.pop(directory_id, None)
+            if previous is not None:
+                self._size -= len(previous)
+            if len(timeline) > self.max_codes:
+                return
+            self._timelines[directory_id] = timeline
+            self._size += len(timeline)
+            while self._size > self.max_codes:
+                _, evicted = self._timelines.popitem(last=False)
+                self._size -= len(evicted)
+
+
+history_index = HistoryIndex(
+    max_codes=getattr(settings, "REFBOOKS_HISTORY_MAX_CODES", 1_000_000)
+)
@@ -0,0 +1,207 @@
+import csv
+import json
+import time
+from datetime import date
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional
+from xml.etree import ElementTree
+
+from django.db import transaction
+
+from .changes import record_version_elements
+from .element_index import element_index
+from .models import Directory, Element, Version
+
+CODE_FIELDS = ("element_code", "code")
+VALUE_FIELDS = ("element_value", "value")
+FORMATS = ("csv", "json", "ndjson", "xml")
+
+
+class RefbookImportError(Exception):
+    """Ошибка в данных импортируемой версии справочника."""
+
+
+class ImportResult(NamedTuple):
+    version: Optional[Version]
+    rows: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else float(self.rows)
+
+
+def detect_format(path: Path) -> str:
+    suffix = path.suffix.lower().lstrip(".")
+    if suffix == "jsonl":
+        return "ndjson"
+    if suffix not in FORMATS:
+        raise RefbookImportError(f"Не удалось определить формат файла {path.name}")
+    return suffix
+
+
+def read_elements(path: Path, file_format: str) -> Iterator[tuple[str, str]]:
+    """Потоково читает пары (код, значение) из файла.
+
+    Поддерживаются CSV с заголовком, NDJSON, JSON (массив объектов или
+    ответ ElementView вида {"elements": [...]}) и XML с элементами
+    ``<element code="..." value="..."/>`` или вложенными тегами.
+    """
+    readers = {
+        "csv": _read_csv,
+        "json": _read_json,
+        "ndjson": _read_ndjson,
+        "xml": _read_xml,
+    }
+    return readers[file_format](path)
+
+
+def import_version(
+    directory: Directory,
+    version: str,
+    rows: Iterable[tuple[str, str]],
+    start_date: Optional[date] = None,
+    batch_size: int = 5000,
+    dry_run: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+    progress_every: int = 10_000,
+) -> ImportResult:
+    """Создаёт версию справочника и её элементы пакетами ``bulk_create``.
+
+    Вся загрузка выполняется в одной транзакции. В режиме ``dry_run``
+    данные только проверяются, без записи в БД.
+
+    :raises RefbookImportError: Версия уже существует или данные некорректны
+    """
+    if (
+        directory.pk is not None
+        and Version.objects.filter(directory=directory, version=version).exists()
+    ):
+        raise RefbookImportError(f"Версия {version} справочника уже существует")
+
+    started = time.monotonic()
+    count = 0
+    seen = set()
+    with transaction.atomic():
+        new_version = None
+        if not dry_run:
+            new_version = Version.objects.create(
+                directory=directory, version=version, start_date=start_date
+            )
+        batch = []
+        for code, value in rows:
+            count += 1
+            _validate(count, code, value, seen)
+            if not dry_run:
+                batch.append(
+                    Element(
+                        directory_version=new_version,
+                        element_code=code,
+                        element_value=value,
+                    )
+                )
+                if len(batch) >= batch_size:
+                    Element.objects.bulk_create(batch)
+                    batch = []
+            if progress and count % progress_every == 0:
+                progress(count)
+        if batch:
+            Element.objects.bulk_create(batch)
+        if new_version is not None:
+            # bulk_create не отправляет сигналы, поэтому индекс сбрасывается,
+            # а элементы записываются в журнал изменений явно.
+            transaction.on_commit(
+                lambda: element_index.invalidate_version(new_version.pk)
+            )
+            record_version_elements(new_version.pk)
+    return ImportResult(new_version, count, time.monotonic() - started)
+
+
+def _validate(line: int, code: str, value: str, seen: set) -> None:
+    code_field = Element._meta.get_field("element_code")
+    value_field = Element._meta.get_field("element_value")
+    if not code or not value:
+        raise RefbookImportError(f"Запись {line}: пустой код или значение")
+    if len(code) > code_field.max_length or len(value) > value_field.max_length:
+        raise RefbookImportError(f"Запись {line}: превышена длина кода или значения")
+    if code in seen:
+        raise RefbookImportError(f"Запись {line}: повторяющийся код {code}")
+    seen.add(code)
+
+
+def _pick(record: dict, names: tuple[str, ...]) -> str:
+    # None (null в JSON, недостающий столбец строки CSV) — отсутствующее поле.
+    for name in names:
+        if record.get(name) is not None:
+            return str(record[name]).strip()
+    return ""
+
+
+def _read_csv(path: Path) -> Iterator[tuple[str, str]]:
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        for record in csv.DictReader(file):
+            yield _pick(record, CODE_FIELDS), _pick(record, VALUE_FIELDS)
+
+
+def _read_ndjson(path: Path) -> Iterator[tuple[str, str]]:
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as error:
+                raise RefbookImportError(
+                    f"Строка {number}: некорректный JSON ({error.msg})"
+                ) from error
+            if not isinstance(record, dict):
+                raise RefbookImportError(f"Строка {number}: ожидается объект JSON")
+            yield _pick(record, CODE_FIELDS), _pick(record, VALUE_FIELDS)
+
+
+def _read_json(path: Path, chunk_size: int = 65536) -> Iterator[tuple[str, str]]:
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as file:
+        buffer = ""
+        while "[" not in buffer:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                raise RefbookImportError("В JSON-файле не найден массив элементов")
+            buffer += chunk
+        position = buffer.index("[") + 1
+        eof = False
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if buffer.startswith("]", position):
+                return
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise RefbookImportError("Некорректный JSON-файл")
+                chunk = file.read(chunk_size)
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            yield _pick(record, CODE_FIELDS), _pick(record, VALUE_FIELDS)
+
+
+def _read_xml(path: Path) -> Iterator[tuple[str, str]]:
+    nodes = ElementTree.iterparse(path, events=("end",))
+    while True:
+        try:
+            _, node = next(nodes)
+        except StopIteration:
+            return
+        except ElementTree.ParseError as error:
+            line, _ = error.position
+            raise RefbookImportError(
+                f"Строка {line}: некорректный XML ({error})"
+            ) from error
+        if node.tag != "element":
+            continue
+        record = dict(node.attrib)
+        record.update((child.tag, child.text or "") for child in node)
+        yield _pick(record, CODE_FIELDS), _pick(record, VALUE_FIELDS)
+        node.clear()
@@ -0,0 +1,410 @@
+"""Фоновые задачи: выгрузка и импорт версий справочников, сравнение версий.
+
+Запрос на долгую операцию только создаёт запись Job и сразу возвращает её
+идентификатор; операция выполняется вне обработки запроса, а клиент
+опрашивает состояние задачи и скачивает готовый файл результата.
+
+Задачи выполняет один из исполнителей (REFBOOKS_JOBS_BACKEND):
+    - ``thread`` — пул потоков процесса приложения, которому задача
+      передаётся после фиксации транзакции, в которой она создана;
+    - ``worker`` — отдельные процессы ``python manage.py refbook_worker``,
+      выбирающие ожидающие задачи из БД.
+Задачу забирает тот исполнитель, которому удалось перевести её из pending
+в running условным UPDATE, поэтому исполнители можно запускать параллельно
+без внешнего брокера.
+
+Файлы результатов и загруженные для импорта файлы хранятся в каталоге
+REFBOOKS_JOBS_DIR (общем для узлов, если их несколько).
+
+Пока задача выполняется, отдельный поток со своим соединением с БД раз в
+REFBOOKS_JOBS_HEARTBEAT_SECONDS записывает в строку задачи число
+обработанных элементов и время сигнала heartbeat_at: импорт выполняется в
+одной транзакции, и запись из неё не была бы видна до фиксации. Задача,
+от исполнителя которой сигнала нет дольше REFBOOKS_JOBS_LEASE_SECONDS
+(процесс завершился), считается завершённой с ошибкой. Это, повторную
+передачу пулу потоков ожидающих задач и удаление устаревших результатов
+выполняет maintain(): refbook_worker — при пустой очереди, исполнитель
+``thread`` — в пуле потоков не чаще раза в REFBOOKS_JOBS_POLL_SECONDS.
+"""
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterator, Optional
+from uuid import UUID, uuid4
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connections, transaction
+from django.utils import timezone
+
+from .changes import sequence
+from .diff import version_diff
+from .export import STREAM_CONTENT_TYPES, dump_json, stream_elements
+from .importer import RefbookImportError, import_version, read_elements
+from .models import Directory, Element, Job
+from .version_resolver import version_resolver
+
+logger = logging.getLogger("refbooks.jobs")
+
+CONTENT_TYPES = {**STREAM_CONTENT_TYPES, "json": "application/json"}
+
+
+class JobError(Exception):
+    """Задачу невозможно выполнить с указанными параметрами."""
+
+
+def jobs_dir() -> Path:
+    path = getattr(settings, "REFBOOKS_JOBS_DIR", None)
+    path = Path(path) if path else Path(tempfile.gettempdir()) / "refbooks-jobs"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def submit(kind: str, params: dict) -> Job:
+    """Создаёт задачу и передаёт её исполнителю после фиксации транзакции."""
+    job = Job.objects.create(kind=kind, params=params)
+    if getattr(settings, "REFBOOKS_JOBS_BACKEND", "thread") == "thread":
+        transaction.on_commit(lambda: _enqueue(job.pk))
+        transaction.on_commit(schedule_maintenance)
+    return job
+
+
+def save_upload(upload, file_format: str) -> str:
+    """Сохраняет загруженный для импорта файл в каталоге задач.
+
+    :return: Имя файла в каталоге задач
+    :rtype: str
+    """
+    name = f"upload-{uuid4().hex}.{file_format}"
+    with _write_file(name) as output:
+        for chunk in upload.chunks():
+            output.write(chunk)
+    return name
+
+
+def claim(job_id: UUID) -> Optional[Job]:
+    """Переводит задачу в running, если её ещё не забрал другой исполнитель."""
+    now = timezone.now()
+    claimed = Job.objects.filter(pk=job_id, status=Job.PENDING).update(
+        status=Job.RUNNING, started_at=now, heartbeat_at=now
+    )
+    return Job.objects.get(pk=job_id) if claimed else None
+
+
+def claim_next() -> Optional[Job]:
+    """Забирает самую раннюю ожидающую задачу."""
+    pending = Job.objects.filter(status=Job.PENDING).order_by("created_at")
+    for job_id in pending.values_list("id", flat=True)[:10]:
+        job = claim(job_id)
+        if job is not None:
+            return job
+    return None
+
+
+def run(job_id: UUID) -> Optional[Job]:
+    """Выполняет задачу, если удалось её забрать.
+
+    :return: Завершённая задача или None, если её выполняет другой исполнитель
+    :rtype: Job or None
+    """
+    job = claim(job_id)
+    if job is not None:
+        execute(job)
+    return job
+
+
+def execute(job: Job) -> None:
+    """Выполняет забранную задачу и записывает итог или ошибку."""
+    try:
+        with _heartbeat(job):
+            job.result = HANDLERS[job.kind](job)
+        job.status = Job.DONE
+    except (JobError, RefbookImportError) as error:
+        job.status, job.error = Job.FAILED, str(error)
+    except Exception as error:
+        logger.exception("Ошибка задачи %s", job.pk)
+        job.status, job.error = Job.FAILED, f"Внутренняя ошибка: {error}"
+    job.finished_at = timezone.now()
+    job.save(
+        update_fields=[
+            "status",
+            "result",
+            "error",
+            "progress",
+            "total",
+            "artifact",
+            "finished_at",
+        ]
+    )
+
+
+def report(job: Job, count: int) -> None:
+    """Число обработанных элементов; в БД его записывает поток сигналов."""
+    job.progress = count
+
+
+def artifact_path(job: Job) -> Optional[Path]:
+    return jobs_dir() / job.artifact if job.artifact else None
+
+
+def purge(older_than: timedelta) -> int:
+    """Удаляет завершённые задачи старше ``older_than`` вместе с их файлами."""
+    expired = Job.objects.filter(
+        status__in=[Job.DONE, Job.FAILED],
+        finished_at__lt=timezone.now() - older_than,
+    )
+    count = 0
+    for job in expired.iterator():
+        for name in (job.artifact, job.params.get("upload")):
+            if name:
+                (jobs_dir() / name).unlink(missing_ok=True)
+        job.delete()
+        count += 1
+    return count
+
+
+def reclaim(lease: timedelta) -> int:
+    """Завершает с ошибкой задачи, от исполнителя которых нет сигнала."""
+    now = timezone.now()
+    return Job.objects.filter(
+        status=Job.RUNNING, heartbeat_at__lt=now - lease
+    ).update(
+        status=Job.FAILED,
+        error="Исполнитель задачи прекратил работу",
+        finished_at=now,
+    )
+
+
+def maintain() -> dict:
+    """Обслуживание очереди: зависшие и устаревшие задачи.
+
+    Для исполнителя ``thread`` ожидающие задачи снова передаются пулу
+    потоков: очередь пула теряется при перезапуске процесса. Заодно
+    нумеруются записи журнала изменений, оставшиеся без номера после сбоя
+    (refbooks.changes.sequence).
+
+    :return: Число задач, завершённых с ошибкой, переданных пулу и удалённых,
+        и число пронумерованных изменений
+    :rtype: dict
+    """
+    reclaimed = reclaim(
+        timedelta(seconds=getattr(settings, "REFBOOKS_JOBS_LEASE_SECONDS", 300))
+    )
+    requeued = 0
+    if getattr(settings, "REFBOOKS_JOBS_BACKEND", "thread") == "thread":
+        pending = Job.objects.filter(
+            status=Job.PENDING,
+            created_at__lt=timezone.now() - timedelta(seconds=_poll_seconds()),
+        )
+        for job_id in pending.values_list("id", flat=True):
+            requeued += _enqueue(job_id)
+    purged = purge(
+        timedelta(
+            seconds=getattr(settings, "REFBOOKS_JOBS_RETENTION_SECONDS", 604800)
+        )
+    )
+    return {
+        "reclaimed": reclaimed,
+        "requeued": requeued,
+        "purged": purged,
+        "sequenced": sequence(),
+    }
+
+
+def export_job(job: Job) -> dict:
+    params = job.params
+    version = _version(params["refbook"], params["version"])
+    job.total = Element.objects.filter(directory_version_id=version.id).count()
+    Job.objects.filter(pk=job.pk).update(total=job.total)
+    name = f"{job.pk}.{params['format']}"
+    rows = 0
+    with _write_file(name) as output:
+        chunks = stream_elements(version.id, params["format"])
+        if params["format"] == "csv":
+            output.write(next(chunks).encode())
+        for chunk in chunks:
+            output.write(chunk if isinstance(chunk, bytes) else chunk.encode())
+            rows += 1
+            if rows % _chunk_size() == 0:
+                report(job, rows)
+    report(job, rows)
+    job.artifact = name
+    return {"version": version.version, "rows": rows}
+
+
+def import_job(job: Job) -> dict:
+    params = job.params
+    upload = jobs_dir() / params["upload"]
+    start_date = params.get("start_date")
+    try:
+        with transaction.atomic():
+            directory, _ = Directory.objects.get_or_create(
+                code=params["directory"],
+                defaults={"name": params.get("name") or params["directory"]},
+            )
+            result = import_version(
+                directory,
+                params["version"],
+                read_elements(upload, params["format"]),
+                start_date=date.fromisoformat(start_date) if start_date else None,
+                progress=lambda count: report(job, count),
+                progress_every=_chunk_size(),
+            )
+    finally:
+        upload.unlink(missing_ok=True)
+    report(job, result.rows)
+    job.total = result.rows
+    return {
+        "refbook": directory.pk,
+        "version": params["version"],
+        "rows": result.rows,
+        "seconds": round(result.seconds, 3),
+    }
+
+
+def diff_job(job: Job) -> dict:
+    params = job.params
+    from_version = _version(params["refbook"], params["from"])
+    to_version = _version(params["refbook"], params["to"])
+    diff = version_diff(from_version, to_version)
+    name = f"{job.pk}.json"
+    with _write_file(name) as output:
+        output.write(
+            dump_json({"from": from_version.version, "to": to_version.version, **diff})
+        )
+    job.artifact = name
+    return {key: len(items) for key, items in diff.items()}
+
+
+HANDLERS = {Job.EXPORT: export_job, Job.IMPORT: import_job, Job.DIFF: diff_job}
+
+
+def _version(directory_id: int, name: str):
+    version = version_resolver.get(directory_id, name)
+    if version is None:
+        raise JobError(f"Версия {name} справочника не найдена")
+    return version
+
+
+@contextmanager
+def _write_file(name: str) -> Iterator:
+    """Файл в каталоге задач: появляется под своим именем только целиком."""
+    path = jobs_dir() / name
+    output = tempfile.NamedTemporaryFile(dir=path.parent, prefix=".", delete=False)
+    try:
+        with output:
+            yield output
+        os.replace(output.name, path)
+    except BaseException:
+        os.unlink(output.name)
+        raise
+
+
+@contextmanager
+def _heartbeat(job: Job) -> Iterator:
+    """Поток, который записывает сигнал и прогресс выполняющейся задачи.
+
+    У потока своё соединение с БД, поэтому запись видна и во время
+    транзакции задачи. В SQLite запись ждёт фиксации этой транзакции.
+    """
+    stop = threading.Event()
+    interval = getattr(settings, "REFBOOKS_JOBS_HEARTBEAT_SECONDS", 10)
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(
+                        progress=job.progress, heartbeat_at=timezone.now()
+                    )
+                except DatabaseError:
+                    logger.warning("Не удалось записать сигнал задачи %s", job.pk)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(
+        target=beat, name=f"refbooks-job-heartbeat-{job.pk}", daemon=True
+    )
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _chunk_size() -> int:
+    return getattr(settings, "REFBOOKS_EXPORT_CHUNK_SIZE", 2000)
+
+
+def _poll_seconds() -> float:
+    return getattr(settings, "REFBOOKS_JOBS_POLL_SECONDS", 2.0)
+
+
+def _enqueue(job_id: UUID) -> bool:
+    """Передаёт задачу пулу потоков, если она ещё не в его очереди."""
+    with _executor_lock:
+        if job_id in _queued:
+            return False
+        _queued.add(job_id)
+    executor().submit(_run_in_thread, job_id)
+    return True
+
+
+def _run_in_thread(job_id: UUID) -> None:
+    close_old_connections()
+    try:
+        run(job_id)
+    finally:
+        with _executor_lock:
+            _queued.discard(job_id)
+        connections.close_all()
+
+
+def _maintain_in_thread() -> None:
+    close_old_connections()
+    try:
+        maintain()
+    except Exception:
+        logger.exception("Ошибка обслуживания очереди задач")
+    finally:
+        connections.close_all()
+
+
+def schedule_maintenance() -> None:
+    """Для исполнителя ``thread`` передаёт maintain() пулу потоков.
+
+    Вызывается при создании задачи и опросе её состояния, не чаще раза за
+    REFBOOKS_JOBS_POLL_SECONDS.
+    """
+    global _maintained_at
+    if getattr(settings, "REFBOOKS_JOBS_BACKEND", "thread") != "thread":
+        return
+    with _executor_lock:
+        now = time.monotonic()
+        if _maintained_at is not None and now - _maintained_at < _poll_seconds():
+            return
+        _maintained_at = now
+    executor().submit(_maintain_in_thread)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_maintained_at = None
+_queued = set()
+
+
+def executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "REFBOOKS_JOBS_THREADS", 2),
+                thread_name_prefix="refbooks-job",
+            )
+    return _executor
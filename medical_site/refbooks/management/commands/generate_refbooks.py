@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from refbooks.importer import import_version
+from refbooks.models import Directory
+
+
+def synthetic_elements(version_number: int, count: int):
+    """Пары (код, значение) синтетической версии справочника.
+
+    Каждая следующая версия сдвигает диапазон кодов на десятую часть и меняет
+    каждое десятое значение, чтобы различия между версиями были непустыми.
+    """
+    first = version_number * count // 10
+    for number in range(first, first + count):
+        value = f"Значение {number}"
+        if number % 10 == 0:
+            value += f" (редакция {version_number + 1})"
+        yield f"{number:07}", value
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт синтетические справочники для нагрузочного тестирования: "
+        "N справочников по M версий по K элементов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directories", type=int, default=10)
+        parser.add_argument("--versions", type=int, default=3)
+        parser.add_argument("--elements", type=int, default=1000)
+        parser.add_argument(
+            "--prefix", default="bench", help="Префикс кодов справочников"
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Удалить ранее созданные справочники с тем же префиксом",
+        )
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if options["clear"]:
+            Directory.objects.filter(code__startswith=f"{prefix}-").delete()
+        elif Directory.objects.filter(code__startswith=f"{prefix}-").exists():
+            raise CommandError(
+                f"Справочники с префиксом {prefix} уже существуют, укажите --clear"
+            )
+
+        today = timezone.localdate()
+        versions = options["versions"]
+        rows = 0
+        for directory_number in range(options["directories"]):
+            with transaction.atomic():
+                directory = Directory.objects.create(
+                    code=f"{prefix}-{directory_number}",
+                    name=f"Синтетический справочник {directory_number}",
+                )
+                for version_number in range(versions):
+                    # Последняя версия действует с сегодняшнего дня.
+                    start_date = today - timedelta(
+                        days=365 * (versions - 1 - version_number)
+                    )
+                    result = import_version(
+                        directory,
+                        f"{version_number + 1}.0",
+                        synthetic_elements(version_number, options["elements"]),
+                        start_date=start_date,
+                        batch_size=options["batch_size"],
+                    )
+                    rows += result.rows
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано справочников: {options['directories']}, "
+                f"версий: {options['directories'] * versions}, элементов: {rows}"
+            )
+        )
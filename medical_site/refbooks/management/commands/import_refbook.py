@@ -0,0 +1,94 @@
+from datetime import date
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from refbooks.importer import (
+    FORMATS,
+    RefbookImportError,
+    detect_format,
+    import_version,
+    read_elements,
+)
+from refbooks.models import Directory
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает новую версию справочника из файла CSV, JSON, NDJSON или XML. "
+        "Файл читается потоково, элементы создаются пакетами в одной транзакции."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path, help="Путь к файлу с элементами")
+        parser.add_argument("--directory", required=True, help="Код справочника")
+        parser.add_argument(
+            "--refbook-version", required=True, help="Новая версия справочника"
+        )
+        parser.add_argument(
+            "--start-date", help="Дата начала действия версии, ГГГГ-ММ-ДД"
+        )
+        parser.add_argument(
+            "--name", help="Наименование справочника, если его нужно создать"
+        )
+        parser.add_argument(
+            "--format", choices=FORMATS, help="Формат файла (по расширению)"
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--progress-every", type=int, default=10_000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только проверить файл, ничего не записывая",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.is_file():
+            raise CommandError(f"Файл {path} не найден")
+
+        start_date = None
+        if options["start_date"]:
+            try:
+                start_date = date.fromisoformat(options["start_date"])
+            except ValueError:
+                raise CommandError("Дата должна быть в формате ГГГГ-ММ-ДД")
+
+        try:
+            file_format = options["format"] or detect_format(path)
+            with transaction.atomic():
+                directory = self.get_directory(options)
+                result = import_version(
+                    directory,
+                    options["refbook_version"],
+                    read_elements(path, file_format),
+                    start_date=start_date,
+                    batch_size=options["batch_size"],
+                    dry_run=options["dry_run"],
+                    progress=lambda count: self.stdout.write(f"Обработано {count}"),
+                    progress_every=options["progress_every"],
+                )
+        except RefbookImportError as error:
+            raise CommandError(str(error))
+
+        action = "Проверено" if options["dry_run"] else "Загружено"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{action} {result.rows} элементов за {result.seconds:.2f} с "
+                f"({result.rows_per_second:.0f} строк/с)"
+            )
+        )
+
+    def get_directory(self, options) -> Directory:
+        try:
+            return Directory.objects.get(code=options["directory"])
+        except Directory.DoesNotExist:
+            if not options["name"]:
+                raise CommandError(
+                    f"Справочник {options['directory']} не найден, укажите --name"
+                )
+        directory = Directory(code=options["directory"], name=options["name"])
+        if not options["dry_run"]:
+            directory.save()
+        return directory
@@ -0,0 +1,48 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from refbooks.activation import ActivationScheduler, scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Готовит снимки и кэшированные ответы версий справочников, которые "
+        "скоро начнут действовать. С --loop работает постоянно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Проверять версии постоянно"
+        )
+        parser.add_argument(
+            "--lead",
+            type=int,
+            help="За сколько секунд до начала действия готовить версию",
+        )
+
+    def handle(self, *args, **options):
+        activation_scheduler = scheduler(local=False)
+        if options["lead"] is not None:
+            activation_scheduler.lead = timedelta(seconds=options["lead"])
+        if not options["loop"]:
+            self.run(activation_scheduler)
+            return
+        while True:
+            delay = self.run(activation_scheduler)
+            close_old_connections()
+            time.sleep(max(delay, 1))
+
+    def run(self, activation_scheduler: ActivationScheduler) -> float:
+        prepared = len(activation_scheduler.prepared)
+        delay = activation_scheduler.run_once()
+        prepared = len(activation_scheduler.prepared) - prepared
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Подготовлено версий: {prepared}, следующая проверка "
+                f"через {delay:.0f} с"
+            )
+        )
+        return delay
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from refbooks.models import Element, Version
+from refbooks.snapshots import Snapshot, SnapshotError, snapshot_store
+
+
+class Command(BaseCommand):
+    help = (
+        "Перестраивает или проверяет снимки элементов опубликованных версий "
+        "справочников в каталоге REFBOOKS_SNAPSHOT_DIR и удаляет устаревшие."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action",
+            choices=("rebuild", "verify", "prune"),
+            help="rebuild — записать снимки заново, verify — сравнить с БД, "
+            "prune — удалить снимки удалённых версий и прежних ревизий",
+        )
+        parser.add_argument("--directory", help="Код справочника")
+
+    def handle(self, *args, **options):
+        if snapshot_store.directory is None:
+            raise CommandError("Не задан каталог снимков REFBOOKS_SNAPSHOT_DIR")
+
+        versions = Version.objects.filter(start_date__lte=timezone.localdate())
+        if options["directory"]:
+            versions = versions.filter(directory__code=options["directory"])
+        versions = versions.order_by("id").values_list("id", "revision")
+
+        if options["action"] == "rebuild":
+            for version_id, revision in versions:
+                snapshot_store.build(version_id, revision)
+            snapshot_store.clear()
+            self.stdout.write(
+                self.style.SUCCESS(f"Перестроено снимков: {len(versions)}")
+            )
+        elif options["action"] == "verify":
+            self.verify(versions)
+        else:
+            self.prune(dict(versions), bool(options["directory"]))
+
+    def verify(self, versions):
+        errors = []
+        for version_id, revision in versions:
+            path = snapshot_store.path(version_id, revision)
+            if not path.exists():
+                errors.append(f"{path.name}: снимок отсутствует")
+                continue
+            try:
+                snapshot = Snapshot(path)
+            except SnapshotError as error:
+                errors.append(str(error))
+                continue
+            rows = sorted(
+                Element.objects.filter(directory_version_id=version_id)
+                .order_by()
+                .values_list("element_code", "element_value")
+            )
+            if list(snapshot.rows()) != rows:
+                errors.append(f"{path.name}: элементы не совпадают с БД")
+        for error in errors:
+            self.stderr.write(error)
+        if errors:
+            raise CommandError(f"Ошибок в снимках: {len(errors)}")
+        self.stdout.write(self.style.SUCCESS(f"Проверено снимков: {len(versions)}"))
+
+    def prune(self, revisions: dict, only_listed: bool):
+        removed = 0
+        for path in snapshot_store.files():
+            version_id, _, revision = path.stem.partition("-")
+            version_id, revision = int(version_id), int(revision)
+            if only_listed and version_id not in revisions:
+                continue
+            if revisions.get(version_id) != revision:
+                path.unlink(missing_ok=True)
+                removed += 1
+        snapshot_store.clear()
+        self.stdout.write(self.style.SUCCESS(f"Удалено снимков: {removed}"))
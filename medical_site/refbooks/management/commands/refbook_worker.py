@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from refbooks import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Выполняет фоновые задачи (выгрузка, импорт, сравнение версий) из "
+        "очереди в БД, завершает задачи остановившихся исполнителей и удаляет "
+        "устаревшие результаты. С --once завершается, когда очередь пуста."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once", action="store_true", help="Выполнить ожидающие задачи и выйти"
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=getattr(settings, "REFBOOKS_JOBS_POLL_SECONDS", 2.0),
+            help="Пауза между проверками пустой очереди, секунд",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            job = jobs.claim_next()
+            if job is None:
+                maintained = jobs.maintain()
+                if maintained["reclaimed"]:
+                    self.stdout.write(
+                        f"Задач остановившихся исполнителей: {maintained['reclaimed']}"
+                    )
+                if maintained["purged"]:
+                    self.stdout.write(
+                        f"Удалено устаревших задач: {maintained['purged']}"
+                    )
+                if options["once"]:
+                    return
+                close_old_connections()
+                time.sleep(options["interval"])
+                continue
+            jobs.execute(job)
+            close_old_connections()
+            message = f"Задача {job.pk} ({job.kind}): {job.get_status_display()}"
+            if job.status == job.FAILED:
+                self.stdout.write(self.style.ERROR(f"{message}: {job.error}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,190 @@
+"""Метрики производительности запросов в формате Prometheus.
+
+Метрики хранятся в памяти процесса; под gunicorn каждый процесс отдаёт
+собственные значения, и Prometheus агрегирует их по меткам экземпляра.
+Статистика текущего запроса (число SQL-запросов, время БД и сериализации)
+хранится в контекстной переменной, поэтому учитывается и для запросов
+к БД из пула потоков асинхронных представлений.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+
+
+class RequestStats:
+    """Статистика обработки одного запроса."""
+
+    def __init__(self, max_captured: int):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.timings = {}
+        self.cache = []
+        self.captured = []
+        self.max_captured = max_captured
+
+    def add_query(self, sql: str, seconds: float):
+        self.queries += 1
+        self.db_seconds += seconds
+        if len(self.captured) < self.max_captured:
+            self.captured.append((sql, seconds))
+
+    def add_timing(self, name: str, seconds: float):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar(
+    "refbooks_request_stats", default=None
+)
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """Счётчики и гистограммы с метками и вывод в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def counter(self, name: str, documentation: str):
+        self._help[name] = ("counter", documentation)
+
+    def histogram(self, name: str, documentation: str, buckets: tuple):
+        self._help[name] = ("histogram", documentation, buckets)
+
+    def inc(self, name: str, labels: dict, value: float = 1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: dict, value: float):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self._help[name][2])
+            histogram.observe(value)
+
+    def value(self, name: str, **labels) -> float:
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, (kind, documentation, *_) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (metric, labels), value in sorted(self._counters.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_labels(labels)} {value:g}")
+                    continue
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    bounds = [*map(str, histogram.buckets), "+Inf"]
+                    for bound, count in zip(bounds, histogram.counts):
+                        cumulative += count
+                        bucket_labels = _labels((*labels, ("le", bound)))
+                        lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.sum:g}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"')
+        )
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+registry = Registry()
+registry.counter("refbooks_requests_total", "Число обработанных запросов")
+registry.histogram(
+    "refbooks_request_duration_seconds", "Время обработки запроса", DURATION_BUCKETS
+)
+registry.histogram(
+    "refbooks_request_queries", "Число SQL-запросов на запрос", QUERY_BUCKETS
+)
+registry.histogram(
+    "refbooks_request_db_seconds", "Время SQL-запросов на запрос", DURATION_BUCKETS
+)
+registry.histogram(
+    "refbooks_request_serialize_seconds",
+    "Время сериализации ответа",
+    DURATION_BUCKETS,
+)
+registry.histogram("refbooks_response_bytes", "Размер тела ответа", SIZE_BUCKETS)
+registry.counter("refbooks_cache_requests_total", "Обращения к кэшам по результату")
+registry.counter("refbooks_slow_requests_total", "Число медленных запросов")
+registry.counter(
+    "refbooks_throttled_requests_total", "Число запросов, отклонённых по частоте"
+)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Обёртка выполнения SQL: учитывает запрос в статистике текущего запроса."""
+    stats = current_request.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(sql, time.perf_counter() - started)
+
+
+def install_execute_wrapper(connection):
+    """Подключает обёртку к соединению с БД (однократно)."""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+@contextmanager
+def timer(name: str):
+    """Добавляет время выполнения блока к статистике текущего запроса."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats = current_request.get()
+        if stats is not None:
+            stats.add_timing(name, time.perf_counter() - started)
+
+
+def cache_result(cache: str, result: str):
+    """Учитывает обращение к кэшу (hit, miss, wait и т. п.)."""
+    registry.inc("refbooks_cache_requests_total", {"cache": cache, "result": result})
+    stats = current_request.get()
+    if stats is not None:
+        stats.cache.append(f"{cache}-{result}")
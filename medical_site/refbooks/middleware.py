@@ -0,0 +1,227 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from .compression import compress, compressor, negotiate
+from .metrics import RequestStats, current_request, registry, timer
+from .routers import READ_METHODS, read_only_request
+
+logger = logging.getLogger("refbooks.slow")
+
+
+class RequestMetricsMiddleware:
+    """Измеряет обработку запроса: время, SQL-запросы, сериализацию, размер.
+
+    Значения попадают в метрики Prometheus (/metrics) и в заголовок
+    Server-Timing; медленные запросы записываются в журнал refbooks.slow
+    вместе с выполненными SQL-запросами.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = self.start()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = self.start()
+        token = current_request.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, stats, time.perf_counter() - started)
+
+    def start(self) -> RequestStats:
+        return RequestStats(
+            max_captured=getattr(settings, "REFBOOKS_SLOW_REQUEST_MAX_QUERIES", 50)
+        )
+
+    def finish(self, request, response, stats: RequestStats, seconds: float):
+        match = request.resolver_match
+        endpoint = match.route if match is not None else "unmatched"
+        labels = {"endpoint": endpoint, "method": request.method}
+        registry.inc(
+            "refbooks_requests_total", {**labels, "status": response.status_code}
+        )
+        registry.observe("refbooks_request_duration_seconds", labels, seconds)
+        registry.observe("refbooks_request_queries", labels, stats.queries)
+        registry.observe("refbooks_request_db_seconds", labels, stats.db_seconds)
+        if "serialize" in stats.timings:
+            registry.observe(
+                "refbooks_request_serialize_seconds", labels, stats.timings["serialize"]
+            )
+        # Размер потоковых ответов заранее неизвестен.
+        if not response.streaming:
+            registry.observe("refbooks_response_bytes", labels, len(response.content))
+
+        if getattr(settings, "REFBOOKS_SERVER_TIMING", True):
+            response.headers["Server-Timing"] = server_timing(stats, seconds)
+
+        threshold = getattr(settings, "REFBOOKS_SLOW_REQUEST_SECONDS", 1.0)
+        if threshold is not None and seconds >= threshold:
+            registry.inc("refbooks_slow_requests_total", {"endpoint": endpoint})
+            logger.warning(
+                "Медленный запрос %s %s: %.3f с, SQL-запросов %d (%.3f с)\n%s",
+                request.method,
+                request.get_full_path(),
+                seconds,
+                stats.queries,
+                stats.db_seconds,
+                "\n".join(
+                    f"  [{duration * 1000:.1f} мс] {sql}"
+                    for sql, duration in stats.captured
+                ),
+            )
+        return response
+
+
+def server_timing(stats: RequestStats, seconds: float) -> str:
+    metrics = [
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"',
+        *(
+            f"{name};dur={duration * 1000:.1f}"
+            for name, duration in stats.timings.items()
+        ),
+        *(f"cache;desc={result}" for result in dict.fromkeys(stats.cache)),
+        f"total;dur={seconds * 1000:.1f}",
+    ]
+    return ", ".join(metrics)
+
+
+class ReadReplicaMiddleware:
+    """Отмечает запросы чтения, чтобы ReplicaRouter направил их на реплики."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = read_only_request.set(request.method in READ_METHODS)
+        try:
+            return self.get_response(request)
+        finally:
+            read_only_request.reset(token)
+
+    async def __acall__(self, request):
+        token = read_only_request.set(request.method in READ_METHODS)
+        try:
+            return await self.get_response(request)
+        finally:
+            read_only_request.reset(token)
+
+
+class CompressionMiddleware:
+    """Сжимает ответы в кодировке, выбранной по Accept-Encoding.
+
+    Ответы меньше REFBOOKS_COMPRESS_MIN_BYTES не сжимаются. Ответы из общего
+    кэша (CachedResponse) берут сжатый вариант из кэша, потоковые ответы
+    сжимаются по частям.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+    def process(self, request, response):
+        if response.has_header("Content-Encoding") or not _compressible(response):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate(request.headers.get("Accept-Encoding", ""))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = _acompress_stream(
+                    response.streaming_content, encoding
+                )
+            else:
+                response.streaming_content = _compress_stream(
+                    response.streaming_content, encoding
+                )
+            del response.headers["Content-Length"]
+        else:
+            min_bytes = getattr(settings, "REFBOOKS_COMPRESS_MIN_BYTES", 1024)
+            if len(response.content) < min_bytes:
+                return response
+            if hasattr(response, "encoded"):
+                content = response.encoded(encoding)
+            else:
+                with timer("compress"):
+                    content = compress(response.content, encoding)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers["Content-Length"] = str(len(content))
+
+        # Сжатое тело отличается от исходного побайтно, но не по смыслу.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+        return response
+
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson")
+
+
+def _compressible(response) -> bool:
+    if response.status_code in (204, 304):
+        return False
+    content_type = response.get("Content-Type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES) or "+json" in content_type
+
+
+def _compress_stream(chunks, encoding: str):
+    process, finish = compressor(encoding)
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+async def _acompress_stream(chunks, encoding: str):
+    process, finish = compressor(encoding)
+    async for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
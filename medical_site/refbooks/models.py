@@ -1,6 +1,51 @@
-from django.core.exceptions import ObjectDoesNotExist
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+
+class DirectoryQuerySet(models.QuerySet):
+    def active_on(self, date):
+        """Справочники, у которых есть версия с датой начала не позже ``date``."""
+        return self.filter(
+            Exists(
+                Version.objects.filter(directory=OuterRef("pk"), start_date__lte=date)
+            )
+        )
 
+    def with_effective_version(self, date):
+        """Добавляет версию, действующую на ``date``, и дату её начала."""
+        effective = Version.objects.filter(
+            directory=OuterRef("pk"), start_date__lte=date
+        ).order_by("-start_date")
+        return self.annotate(
+            current_version=Subquery(effective.values("version")[:1]),
+            start_date=Subquery(effective.values("start_date")[:1]),
+        )
+
+    def listing(self, date=None, with_version=False, after=None):
+        """Строки списка справочников в порядке идентификаторов.
+
+        :param date: Оставить справочники с версиями, начавшими действовать
+            не позже этой даты
+        :param with_version: Добавить действующую на ``date`` (или сегодня)
+            версию и дату её начала
+        :param after: Идентификатор, после которого начинается выборка
+        """
+        directories = self.order_by("id")
+        fields = ["id", "code", "name"]
+        if date:
+            directories = directories.active_on(date)
+        if with_version:
+            directories = directories.with_effective_version(
+                date or timezone.localdate()
+            )
+            fields += ["current_version", "start_date"]
+        if after is not None:
+            directories = directories.filter(id__gt=after)
+        return directories.values(*fields)
 
 
 class Directory(models.Model):
@@ -12,6 +57,9 @@ class Directory(models.Model):
         max_length=300, blank=False, null=False, verbose_name="Наименование"
     )
     description = models.TextField(verbose_name="Описание", blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    objects = DirectoryQuerySet.as_manager()
 
     def get_latest_version(self):
         """Получает последнюю версию справочника.
@@ -21,11 +69,16 @@ class Directory(models.Model):
         :return: Объект последней версии справочника или None, если версий нет
         :rtype: Version or None
         """
-        try:
-            latest_version = self.version_set.latest("start_date")
-            return latest_version if latest_version else None
-        except ObjectDoesNotExist:
+        from .version_resolver import version_resolver
+
+        current = version_resolver.effective(self.pk)
+        if current is None:
             return None
+        return Version.from_db(
+            None,
+            ["id", "directory_id", *current._fields[1:]],
+            [current.id, self.pk, *current[1:]],
+        )
 
     def __str__(self):
         return self.name
@@ -38,7 +91,10 @@ class Directory(models.Model):
 class Version(models.Model):
     id = models.AutoField(primary_key=True, verbose_name="Идентификатор")
     directory = models.ForeignKey(
-        Directory, on_delete=models.CASCADE, verbose_name="Наименование справочника"
+        Directory,
+        on_delete=models.CASCADE,
+        db_index=False,
+        verbose_name="Наименование справочника",
     )
     version = models.CharField(
         max_length=50, blank=False, null=False, verbose_name="Версия"
@@ -46,6 +102,10 @@ class Version(models.Model):
     start_date = models.DateField(
         verbose_name="Дата начала версии", blank=True, null=True
     )
+    revision = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Ревизия элементов"
+    )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
 
     def __str__(self):
         return f"{self.directory} - {self.version}"
@@ -55,6 +115,14 @@ class Version(models.Model):
             ("directory", "version"),
             ("directory", "start_date"),
         ]
+        indexes = [
+            # Действующая версия: directory = ? AND start_date <= ?
+            # ORDER BY start_date DESC; version читается из индекса.
+            models.Index(
+                fields=["directory", "-start_date", "version"],
+                name="refbooks_version_effective",
+            ),
+        ]
         verbose_name = "Версия справочника"
         verbose_name_plural = "Версии справочника"
         ordering = ["directory", "version"]
@@ -65,6 +133,7 @@ class Element(models.Model):
     directory_version = models.ForeignKey(
         Version,
         on_delete=models.CASCADE,
+        db_index=False,
         verbose_name="Идентификатор Версии справочника",
     )
     element_code = models.CharField(
@@ -79,6 +148,133 @@ class Element(models.Model):
 
     class Meta:
         unique_together = ["directory_version", "element_code"]
+        indexes = [
+            # Проверка и выгрузка элементов версии: directory_version = ?
+            # [AND element_code ... AND element_value = ?] ORDER BY element_code.
+            models.Index(
+                fields=["directory_version", "element_code", "element_value"],
+                name="refbooks_element_lookup",
+            ),
+        ]
         verbose_name = "Элемент справочника"
         verbose_name_plural = "Элементы справочника"
         ordering = ["directory_version", "element_code"]
+
+
+class Change(models.Model):
+    """Запись журнала изменений справочников, версий и элементов.
+
+    Запись вставляется в транзакции изменения без номера; номер ``seq``
+    выдаётся после фиксации (refbooks.changes.sequence), растёт в порядке
+    фиксации и служит курсором ленты изменений (refbooks/changes?since=<seq>).
+    """
+
+    DIRECTORY = "directory"
+    VERSION = "version"
+    ELEMENT = "element"
+    MODELS = [
+        (DIRECTORY, "Справочник"),
+        (VERSION, "Версия справочника"),
+        (ELEMENT, "Элемент справочника"),
+    ]
+    SAVE = "save"
+    DELETE = "delete"
+    ACTIONS = [(SAVE, "Сохранение"), (DELETE, "Удаление")]
+
+    id = models.BigAutoField(primary_key=True, verbose_name="Идентификатор")
+    seq = models.BigIntegerField(
+        blank=True, null=True, unique=True, verbose_name="Номер изменения"
+    )
+    model = models.CharField(max_length=20, choices=MODELS, verbose_name="Объект")
+    action = models.CharField(max_length=10, choices=ACTIONS, verbose_name="Действие")
+    object_id = models.IntegerField(verbose_name="Идентификатор объекта")
+    data = models.JSONField(encoder=DjangoJSONEncoder, verbose_name="Данные")
+    created_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Дата изменения"
+    )
+
+    def __str__(self):
+        return f"{self.seq or '—'}: {self.action} {self.model} {self.object_id}"
+
+    class Meta:
+        verbose_name = "Изменение справочников"
+        verbose_name_plural = "Журнал изменений справочников"
+        ordering = ["seq"]
+
+
+class Job(models.Model):
+    """Фоновая задача: выгрузка или импорт версии, сравнение версий.
+
+    Параметры задачи, её состояние и итог хранятся в БД, поэтому задачу
+    может выполнить любой процесс (пул потоков приложения или refbook_worker),
+    а клиент — опрашивать её состояние на любом узле.
+    """
+
+    EXPORT = "export"
+    IMPORT = "import"
+    DIFF = "diff"
+    KINDS = [
+        (EXPORT, "Выгрузка элементов"),
+        (IMPORT, "Импорт версии"),
+        (DIFF, "Сравнение версий"),
+    ]
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [
+        (PENDING, "Ожидает"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Выполнена"),
+        (FAILED, "Ошибка"),
+    ]
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+        verbose_name="Идентификатор",
+    )
+    kind = models.CharField(max_length=10, choices=KINDS, verbose_name="Тип")
+    status = models.CharField(
+        max_length=10, choices=STATUSES, default=PENDING, verbose_name="Состояние"
+    )
+    params = models.JSONField(
+        encoder=DjangoJSONEncoder, default=dict, verbose_name="Параметры"
+    )
+    progress = models.PositiveBigIntegerField(
+        default=0, verbose_name="Обработано элементов"
+    )
+    total = models.PositiveBigIntegerField(
+        blank=True, null=True, verbose_name="Всего элементов"
+    )
+    result = models.JSONField(
+        encoder=DjangoJSONEncoder, blank=True, null=True, verbose_name="Итог"
+    )
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    artifact = models.CharField(
+        max_length=255, blank=True, verbose_name="Файл результата"
+    )
+    created_at = models.DateTimeField(
+        default=timezone.now, verbose_name="Дата создания"
+    )
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name="Начало")
+    heartbeat_at = models.DateTimeField(
+        blank=True, null=True, verbose_name="Последний сигнал исполнителя"
+    )
+    finished_at = models.DateTimeField(
+        blank=True, null=True, verbose_name="Завершение"
+    )
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.id} ({self.status})"
+
+    class Meta:
+        indexes = [
+            # Следующая задача для refbook_worker: status = 'pending'
+            # ORDER BY created_at.
+            models.Index(fields=["status", "created_at"], name="refbooks_job_queue"),
+        ]
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        ordering = ["-created_at"]
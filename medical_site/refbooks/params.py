@@ -0,0 +1,59 @@
+from datetime import date, datetime
+from typing import Optional
+
+from django.conf import settings
+
+from .export import STREAM_CONTENT_TYPES
+
+
+class InvalidParameter(ValueError):
+    """Некорректный параметр запроса; текст ошибки возвращается клиенту."""
+
+
+def parse_date(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise InvalidParameter("Дата должна быть в формате ГГГГ-ММ-ДД")
+
+
+def parse_limit(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    max_limit = getattr(settings, "REFBOOKS_ELEMENTS_MAX_PAGE_SIZE", 10_000)
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 0 < limit <= max_limit:
+        raise InvalidParameter(f"limit должен быть от 1 до {max_limit}")
+    return limit
+
+
+def parse_directory_cursor(value: Optional[str]) -> Optional[int]:
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidParameter("after должен быть идентификатором справочника")
+
+
+def parse_sequence(value: Optional[str]) -> int:
+    if not value:
+        return 0
+    try:
+        sequence = int(value)
+    except ValueError:
+        sequence = -1
+    if sequence < 0:
+        raise InvalidParameter("since должен быть номером изменения")
+    return sequence
+
+
+def parse_stream(value: Optional[str]) -> Optional[str]:
+    if value and value not in STREAM_CONTENT_TYPES:
+        raise InvalidParameter("Поддерживаются форматы выгрузки: ndjson, csv")
+    return value or None
@@ -0,0 +1,189 @@
+"""Общий кэш готовых JSON-ответов API справочников.
+
+Под gunicorn каждый процесс заново сериализует одни и те же списки элементов,
+поэтому отрисованные байты ответа хранятся в кэше Django (Redis, memcached,
+файловом или LocMem), общем для всех процессов.
+
+Ключ ответа — его ETag: он уже включает ревизию элементов версии, параметры
+запроса и формат. Сохранение справочника или версии увеличивает поколение
+кэша, которое передаётся как ``version`` ключа, поэтому прежние записи
+становятся недоступны во всех процессах сразу. По поколению строится и ETag
+списка справочников. Начальное поколение — текущее время в миллисекундах:
+если запись поколения потеряна (очистка или перезапуск кэша), новые ETag
+не совпадают с выданными ранее. На время построения ответа
+ключ блокируется через ``cache.add``, и одновременные запросы ждут готовый
+результат вместо повторного обращения к БД.
+"""
+import json
+import threading
+import time
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .compression import compress
+from .export import dump_json
+from .metrics import cache_result, timer
+
+GENERATION_KEY = "refbooks:payload:generation"
+
+
+class PayloadCache:
+    """Кэш отрисованных ответов с защитой от одновременного построения.
+
+    :param alias: Имя кэша в настройке CACHES
+    :param timeout: Время хранения ответа, секунды
+    :param lock_timeout: Время жизни блокировки построения, секунды
+    """
+
+    def __init__(self, alias: str, timeout: int, lock_timeout: float):
+        self.alias = alias
+        self.timeout = timeout
+        self.lock_timeout = lock_timeout
+        self._lock = threading.Lock()
+        self._stats = {"hit": 0, "miss": 0, "wait": 0}
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_or_build(self, key: str, build: Callable[[], bytes]) -> bytes:
+        """Готовый ответ из кэша или результат ``build()``, сохранённый в кэше."""
+        key = "refbooks:payload:" + key
+        generation = self.generation()
+        content = self.cache.get(key, version=generation)
+        if content is not None:
+            self._count("hit")
+            return content
+
+        self._count("miss")
+        lock_key = key + ":lock"
+        if not self.cache.add(lock_key, 1, self.lock_timeout, version=generation):
+            content = self._wait(key, generation)
+            if content is not None:
+                self._count("wait")
+                return content
+            # Построение в другом процессе не завершилось вовремя.
+            return build()
+
+        try:
+            content = build()
+            self.cache.set(key, content, self.timeout, version=generation)
+        finally:
+            self.cache.delete(lock_key, version=generation)
+        return content
+
+    def generation(self) -> int:
+        generation = self.cache.get(GENERATION_KEY)
+        if generation is None:
+            initial = time.time_ns() // 1_000_000
+            self.cache.add(GENERATION_KEY, initial, timeout=None)
+            generation = self.cache.get(GENERATION_KEY, initial)
+        return generation
+
+    def invalidate(self):
+        """Делает недоступными все сохранённые ответы во всех процессах."""
+        try:
+            self.cache.incr(GENERATION_KEY)
+        except ValueError:
+            self.cache.add(GENERATION_KEY, time.time_ns() // 1_000_000, timeout=None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = dict.fromkeys(self._stats, 0)
+
+    def _wait(self, key: str, generation: int):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            content = self.cache.get(key, version=generation)
+            if content is not None:
+                return content
+        return None
+
+    def _count(self, result: str):
+        with self._lock:
+            self._stats[result] += 1
+        cache_result("payload", result)
+
+
+class CachedResponse(Response):
+    """Ответ DRF с телом, уже отрисованным JSONRenderer.
+
+    ``data`` разбирается из тела только при обращении (например, в тестах).
+    """
+
+    def __init__(self, content: bytes, key: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.content_bytes = content
+        self.payload_key = key
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.content_bytes)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        self["Content-Type"] = self.accepted_renderer.media_type
+        return self.content_bytes
+
+    def encoded(self, encoding: str) -> bytes:
+        """Тело, сжатое кодировкой ``encoding``; хранится в кэше рядом с ответом."""
+
+        def build() -> bytes:
+            with timer("compress"):
+                return compress(self.content_bytes, encoding, precompress=True)
+
+        if self.payload_key is None:
+            return build()
+        return payload_cache.get_or_build(f"{self.payload_key}:{encoding}", build)
+
+
+def cached_response(request, key: str, build: Callable[[], dict]) -> Response:
+    """Ответ с данными ``build()``; JSON берётся из общего кэша.
+
+    Байты совпадают с теми, что отрисовал бы JSONRenderer; прочие форматы
+    (например, Browsable API) строятся как обычно.
+    """
+    renderer = request.accepted_renderer
+    if not isinstance(renderer, JSONRenderer):
+        return Response(build())
+    media_type = request.accepted_media_type
+
+    def render() -> bytes:
+        data = build()
+        with timer("serialize"):
+            if media_type == renderer.media_type:
+                # Наследники JSONRenderer могут изменять структуру ответа.
+                prepare = getattr(renderer, "prepare", None)
+                return dump_json(prepare(data) if prepare is not None else data)
+            # Параметры типа (например, indent) обрабатывает сам JSONRenderer.
+            return renderer.render(data, media_type)
+
+    key = payload_key(key, media_type)
+    content = payload_cache.get_or_build(key, render)
+    return CachedResponse(content, key=key)
+
+
+def payload_key(etag: str, media_type: str) -> str:
+    return f"{etag}:{media_type}"
+
+
+payload_cache = PayloadCache(
+    alias=getattr(settings, "REFBOOKS_PAYLOAD_CACHE", "default"),
+    timeout=getattr(settings, "REFBOOKS_PAYLOAD_CACHE_TIMEOUT", 3600),
+    lock_timeout=getattr(settings, "REFBOOKS_PAYLOAD_LOCK_TIMEOUT", 10),
+)
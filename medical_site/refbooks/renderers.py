@@ -0,0 +1,29 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """Компактный JSON со столбцами кодов и значений элементов.
+
+    Выбирается заголовком ``Accept: application/vnd.refbooks.columns+json``
+    или параметром ``format=columns``. Вместо списка объектов
+    ``{"element_code": ..., "element_value": ...}`` возвращаются списки
+    ``codes`` и ``values`` одинаковой длины; остальные ключи ответа
+    (например, ``next``) не меняются.
+    """
+
+    media_type = "application/vnd.refbooks.columns+json"
+    format = "columns"
+
+    def prepare(self, data):
+        if not isinstance(data, dict) or "elements" not in data:
+            return data
+        elements = data["elements"]
+        columns = {
+            "codes": [element["element_code"] for element in elements],
+            "values": [element["element_value"] for element in elements],
+        }
+        columns.update((key, value) for key, value in data.items() if key != "elements")
+        return columns
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(self.prepare(data), accepted_media_type, renderer_context)
@@ -0,0 +1,42 @@
+"""Маршрутизация чтения данных справочников на реплики БД.
+
+Запросы чтения API (GET, HEAD) не изменяют данные, поэтому обращения
+к моделям справочников при их обработке можно выполнять на репликах.
+ReadReplicaMiddleware отмечает такие запросы в контекстной переменной,
+а ReplicaRouter направляет чтение на одну из реплик
+REFBOOKS_READ_REPLICAS. Запись, миграции и чтение вне запросов GET
+(административный интерфейс, команды импорта) выполняются на default.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA_APPS = frozenset({"refbooks"})
+READ_METHODS = frozenset({"GET", "HEAD"})
+
+read_only_request: ContextVar[bool] = ContextVar(
+    "refbooks_read_only_request", default=False
+)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, "REFBOOKS_READ_REPLICAS", ())
+        if (
+            replicas
+            and model._meta.app_label in REPLICA_APPS
+            and read_only_request.get()
+        ):
+            return random.choice(replicas)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и default.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
@@ -0,0 +1,31 @@
+"""Описание API для drf_yasg, отключаемое на узлах только для чтения.
+
+Импорт drf_yasg (вместе с pkg_resources) заметно увеличивает время запуска
+процесса. Если REFBOOKS_API_SCHEMA выключена, схема на узле не строится,
+поэтому вместо drf_yasg подставляются заглушки с тем же интерфейсом:
+декоратор ``swagger_auto_schema`` не меняет представление, а параметры
+``openapi`` не создаются. Схему для таких узлов строят заранее командой
+``generate_swagger``.
+"""
+from django.conf import settings
+
+
+class _NoOpenAPI:
+    def __getattr__(self, name):
+        return _no_parameter
+
+
+def _no_parameter(*args, **kwargs):
+    return None
+
+
+def _no_schema(*args, **kwargs):
+    return lambda view: view
+
+
+if getattr(settings, "REFBOOKS_API_SCHEMA", True):
+    from drf_yasg import openapi
+    from drf_yasg.utils import swagger_auto_schema
+else:
+    openapi = _NoOpenAPI()
+    swagger_auto_schema = _no_schema
@@ -0,0 +1,264 @@
+"""Поиск элементов версии справочника по префиксу кода и словам значения.
+
+На PostgreSQL поиск выполняется в БД: полнотекстовый индекс по значению
+с русской морфологией и триграммный индекс по коду (создаются обработчиком
+post_migrate). На остальных СУБД используется индекс в памяти процесса:
+отсортированные коды для поиска по префиксу и инвертированный индекс по
+основам слов значения, полученным упрощённым стеммером русского языка.
+
+Результаты упорядочены по релевантности: совпадение кода, затем число слов
+запроса, совпавших с основой слова значения целиком, затем более короткие
+значения.
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Iterable
+
+from django.conf import settings
+from django.db import connection, connections
+
+from .export import ELEMENT_FIELDS, version_rows
+from .models import Element
+from .version_resolver import VersionRef
+
+WORD = re.compile(r"\w+")
+# Окончания русских слов.
+ENDINGS = frozenset(
+    "иями иях иям ями ами ией ием ии ого его ому ему ыми ими ая яя ое ее ие ые "
+    "ой ей ий ый ом ем ам ям ах ях ов ев ию ью ия ья ье им ым ую юю "
+    "а я о е ы и у ю ь".split()
+)
+ENDING_LENGTHS = sorted({len(ending) for ending in ENDINGS}, reverse=True)
+MIN_STEM = 3
+SEARCH_LIMIT = 50
+
+
+def normalize(text: str) -> str:
+    return text.casefold().replace("ё", "е")
+
+
+@lru_cache(maxsize=100_000)
+def stem(word: str) -> str:
+    """Основа слова: слово без самого длинного окончания, не короче MIN_STEM."""
+    word = normalize(word)
+    for length in ENDING_LENGTHS:
+        if len(word) - length >= MIN_STEM and word[-length:] in ENDINGS:
+            return word[:-length]
+    return word
+
+
+def words(text: str) -> list:
+    return WORD.findall(text)
+
+
+class SearchIndex:
+    """Индекс элементов одной версии справочника в памяти."""
+
+    def __init__(self, rows: Iterable[tuple[str, str]]):
+        self.rows = sorted(rows)
+        codes = sorted(
+            (normalize(code), number) for number, (code, _) in enumerate(self.rows)
+        )
+        self._codes = [code for code, _ in codes]
+        self._code_numbers = [number for _, number in codes]
+        postings = {}
+        for number, (_, value) in enumerate(self.rows):
+            for word in words(value):
+                postings.setdefault(stem(word), set()).add(number)
+        self._stems = sorted(postings)
+        self._postings = [postings[word] for word in self._stems]
+        self._lengths = [len(value) for _, value in self.rows]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def search(self, query: str, limit: int) -> list:
+        """Элементы, код которых начинается с ``query`` или значение которых
+        содержит все слова запроса (с точностью до окончаний).
+
+        :return: Пары (код, значение) в порядке релевантности
+        :rtype: list[tuple[str, str]]
+        """
+        prefix = normalize(query.strip())
+        codes = {}
+        for number in self._prefix(self._codes, prefix, self._code_numbers):
+            codes[number] = 100 if normalize(self.rows[number][0]) == prefix else 50
+
+        matched = set()
+        exact = []
+        stems = [stem(word) for word in words(query)]
+        for index, query_stem in enumerate(stems):
+            numbers = set()
+            start = bisect_left(self._stems, query_stem)
+            for position in range(start, len(self._stems)):
+                if not self._stems[position].startswith(query_stem):
+                    break
+                numbers |= self._postings[position]
+                if self._stems[position] == query_stem:
+                    exact.append(self._postings[position])
+            matched = numbers if index == 0 else matched & numbers
+            if not matched:
+                break
+
+        def rank(number):
+            score = codes.get(number, 0)
+            if number in matched:
+                score += 1 + sum(number in postings for postings in exact)
+            return -score, self._lengths[number], number
+
+        ranked = heapq.nsmallest(limit, matched.union(codes), key=rank)
+        return [self.rows[number] for number in ranked]
+
+    @staticmethod
+    def _prefix(keys: list, prefix: str, numbers: list) -> list:
+        if not prefix:
+            return []
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + "\U0010ffff", start)
+        return numbers[start:end]
+
+
+class SearchIndexCache:
+    """Индексы поиска последних версий, вытесняемые по принципу LRU.
+
+    Ключ включает ревизию версии, поэтому изменение элементов приводит
+    к построению нового индекса.
+    """
+
+    def __init__(self, max_elements: int):
+        self.max_elements = max_elements
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()
+        self._size = 0
+
+    def get(self, version: VersionRef) -> SearchIndex:
+        key = (version.id, version.revision)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        index = SearchIndex(version_rows(version))
+        with self._lock:
+            if key not in self._indexes and len(index) <= self.max_elements:
+                self._indexes[key] = index
+                self._size += len(index)
+                while self._size > self.max_elements:
+                    _, evicted = self._indexes.popitem(last=False)
+                    self._size -= len(evicted)
+        return index
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+            self._size = 0
+
+
+search_indexes = SearchIndexCache(
+    max_elements=getattr(settings, "REFBOOKS_SEARCH_INDEX_MAX_ELEMENTS", 1_000_000)
+)
+
+
+def search_elements(version: VersionRef, query: str, limit: int) -> list:
+    """Поиск элементов версии: в БД на PostgreSQL, иначе по индексу в памяти.
+
+    :return: Найденные элементы в порядке релевантности
+    :rtype: list[dict]
+    """
+    if connection.vendor == "postgresql":
+        rows = _search_postgresql(version.id, query, limit)
+    else:
+        rows = search_indexes.get(version).search(query, limit)
+    return [{"element_code": code, "element_value": value} for code, value in rows]
+
+
+# Выражение полнотекстового индекса по значению. SearchVector оборачивает
+# поле в COALESCE и передаёт конфигурацию параметром, и такое выражение не
+# совпадает с индексным, поэтому запрос и индекс строятся по одному шаблону.
+VALUE_VECTOR = "to_tsvector('russian'::regconfig, {})"
+
+
+def _search_postgresql(version_id: int, query: str, limit: int) -> list:
+    return list(search_queryset(version_id, query)[:limit])
+
+
+def value_vector():
+    """Вектор значения элемента по выражению индекса refbooks_element_value_fts."""
+    from django.contrib.postgres.search import SearchVectorField
+    from django.db.models import F, Func
+
+    return Func(
+        F("element_value"),
+        template=VALUE_VECTOR.format("%(expressions)s"),
+        output_field=SearchVectorField(),
+    )
+
+
+def search_queryset(version_id: int, query: str):
+    """Запрос поиска элементов версии в PostgreSQL.
+
+    :return: Коды и значения найденных элементов в порядке релевантности
+    :rtype: QuerySet
+    """
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+    from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+    from django.db.models.functions import Length
+
+    vector = value_vector()
+    conditions = Q(element_code__istartswith=query.strip())
+    rank = Value(0.0, output_field=FloatField())
+    terms = [word.replace("_", "") for word in words(query)]
+    terms = [term for term in terms if term]
+    if terms:
+        # Каждое слово запроса ищется как префикс основы (``слово:*``).
+        search = SearchQuery(
+            " & ".join(f"{term}:*" for term in terms),
+            config="russian",
+            search_type="raw",
+        )
+        conditions |= Q(search=search)
+        rank = SearchRank(vector, search)
+    elements = (
+        Element.objects.filter(directory_version_id=version_id)
+        .annotate(search=vector)
+        .filter(conditions)
+        .annotate(
+            code_match=Case(
+                When(element_code__iexact=query.strip(), then=Value(2)),
+                When(element_code__istartswith=query.strip(), then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            rank=rank,
+        )
+        .order_by("-code_match", "-rank", Length("element_value"), "element_code")
+        .values_list(*ELEMENT_FIELDS)
+    )
+    return elements
+
+
+SEARCH_INDEXES = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS refbooks_element_value_fts ON refbooks_element "
+    f"USING gin ({VALUE_VECTOR.format('element_value')})",
+    "CREATE INDEX IF NOT EXISTS refbooks_element_code_trgm ON refbooks_element "
+    "USING gin (upper(element_code) gin_trgm_ops)",
+)
+
+
+def create_search_indexes(sender, using: str, **kwargs):
+    """Обработчик post_migrate: индексы поиска для PostgreSQL.
+
+    Индексы не описаны в Meta.indexes, так как GIN-индексы не поддерживаются
+    остальными СУБД, а миграции создаются одинаковыми для всех.
+    """
+    database = connections[using]
+    if database.vendor != "postgresql":
+        return
+    with database.cursor() as cursor:
+        for statement in SEARCH_INDEXES:
+            cursor.execute(statement)
@@ -1,5 +1,11 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.urls import reverse
 from rest_framework import serializers
-from .models import Directory, Element
+from .export import STREAM_CONTENT_TYPES
+from .importer import FORMATS, RefbookImportError, detect_format
+from .models import Directory, Element, Job
 
 
 class DirectorySerializer(serializers.ModelSerializer):
@@ -18,3 +24,108 @@ class CheckElementSerializer(serializers.Serializer):
     code = serializers.CharField()
     value = serializers.CharField()
     version = serializers.CharField(required=False)
+
+
+class CheckElementBatchItemSerializer(CheckElementSerializer):
+    refbook = serializers.IntegerField(required=False)
+
+
+class CheckElementBatchSerializer(serializers.Serializer):
+    items = CheckElementBatchItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        max_items = getattr(settings, "REFBOOKS_CHECK_BATCH_MAX_ITEMS", 10_000)
+        if len(items) > max_items:
+            raise serializers.ValidationError(
+                f"Не более {max_items} элементов в одном запросе"
+            )
+        return items
+
+
+class ElementHistorySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    codes = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+
+    def validate_codes(self, codes):
+        max_items = getattr(settings, "REFBOOKS_CHECK_BATCH_MAX_ITEMS", 10_000)
+        if len(codes) > max_items:
+            raise serializers.ValidationError(
+                f"Не более {max_items} кодов в одном запросе"
+            )
+        return codes
+
+
+class JobCreateSerializer(serializers.Serializer):
+    REQUIRED = {
+        Job.EXPORT: ("refbook",),
+        Job.DIFF: ("refbook", "from"),
+        Job.IMPORT: ("directory", "version", "file"),
+    }
+
+    kind = serializers.ChoiceField(choices=Job.KINDS)
+    refbook = serializers.IntegerField(required=False)
+    version = serializers.CharField(required=False)
+    from_ = serializers.CharField(required=False)
+    to = serializers.CharField(required=False)
+    format = serializers.CharField(required=False)
+    directory = serializers.CharField(required=False)
+    name = serializers.CharField(required=False)
+    start_date = serializers.DateField(required=False)
+    file = serializers.FileField(required=False)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # from — ключевое слово Python, поэтому поле объявлено как from_.
+        fields["from"] = fields.pop("from_")
+        return fields
+
+    def validate(self, data):
+        kind = data["kind"]
+        missing = [field for field in self.REQUIRED[kind] if field not in data]
+        if missing:
+            raise serializers.ValidationError(
+                {field: "Обязательное поле для задачи этого типа" for field in missing}
+            )
+        if kind == Job.EXPORT:
+            data.setdefault("format", "ndjson")
+            if data["format"] not in STREAM_CONTENT_TYPES:
+                raise serializers.ValidationError(
+                    {"format": "Поддерживаются форматы выгрузки: ndjson, csv"}
+                )
+        if kind == Job.IMPORT:
+            try:
+                data.setdefault("format", detect_format(Path(data["file"].name)))
+            except RefbookImportError as error:
+                raise serializers.ValidationError({"format": str(error)})
+            if data["format"] not in FORMATS:
+                raise serializers.ValidationError(
+                    {"format": f"Поддерживаются форматы: {', '.join(FORMATS)}"}
+                )
+        return data
+
+
+class JobSerializer(serializers.ModelSerializer):
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = [
+            "id",
+            "kind",
+            "status",
+            "progress",
+            "total",
+            "result",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+            "download",
+        ]
+
+    def get_download(self, job):
+        if job.status != Job.DONE or not job.artifact:
+            return None
+        url = reverse("refbook-job-download", args=[job.pk])
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request is not None else url
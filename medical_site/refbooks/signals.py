@@ -0,0 +1,100 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import changes
+from .element_index import element_index
+from .metrics import install_execute_wrapper
+from .models import Change, Directory, Element, Version
+from .payload_cache import payload_cache
+from .snapshots import snapshot_store
+from .version_resolver import version_resolver
+
+
+def invalidate_on_commit(invalidate) -> None:
+    """Сбрасывает кэш сразу и ещё раз после фиксации транзакции.
+
+    Запрос, выполненный до фиксации (например, во время импорта), заполняет
+    кэш данными без изменений транзакции; повторный сброс их удаляет.
+    """
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+@receiver([post_save, post_delete], sender=Directory)
+def directory_changed(sender, instance, **kwargs):
+    element_index.invalidate_directory(instance.pk)
+    invalidate_on_commit(partial(version_resolver.invalidate, instance.pk))
+    invalidate_on_commit(payload_cache.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Version)
+def version_changed(sender, instance, **kwargs):
+    element_index.invalidate_directory(instance.directory_id)
+    element_index.invalidate_version(instance.pk)
+    invalidate_on_commit(partial(version_resolver.invalidate, instance.directory_id))
+    invalidate_on_commit(partial(version_resolver.invalidate_version, instance.pk))
+    invalidate_on_commit(payload_cache.invalidate)
+
+
+@receiver(post_delete, sender=Version)
+def version_deleted(sender, instance, **kwargs):
+    snapshot_store.remove(instance.pk)
+
+
+def deleted_with_version(origin) -> bool:
+    """Элемент удаляется каскадом вместе с версией или справочником.
+
+    Кэши такой версии сбрасывают обработчики удаления версии, а в журнал
+    записывается удаление версии, поэтому обработчики элементов пропускают
+    работу: иначе удаление версии выполняло бы по запросу на каждый элемент.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (Version, Directory)
+
+
+@receiver([post_save, post_delete], sender=Element)
+def element_changed(sender, instance, **kwargs):
+    if deleted_with_version(kwargs.get("origin")):
+        return
+    Version.objects.filter(pk=instance.directory_version_id).update(
+        revision=F("revision") + 1, updated_at=timezone.now()
+    )
+    element_index.invalidate_version(instance.directory_version_id)
+    invalidate_on_commit(
+        partial(version_resolver.invalidate_version, instance.directory_version_id)
+    )
+
+
+@receiver(post_save, sender=Directory)
+@receiver(post_save, sender=Version)
+@receiver(post_save, sender=Element)
+def record_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        changes.record([instance], Change.SAVE)
+
+
+@receiver(post_delete, sender=Directory)
+@receiver(post_delete, sender=Version)
+@receiver(post_delete, sender=Element)
+def record_deleted(sender, instance, origin=None, **kwargs):
+    if sender is Element and deleted_with_version(origin):
+        return
+    changes.record([instance], Change.DELETE)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install_execute_wrapper(connection)
+    if connection.vendor == "sqlite":
+        # Журнал WAL: чтение не блокируется записью, запись ждёт блокировку
+        # busy_timeout вместо немедленной ошибки «database is locked».
+        with connection.cursor() as cursor:
+            for name, value in getattr(settings, "REFBOOKS_SQLITE_PRAGMAS", {}).items():
+                cursor.execute(f"PRAGMA {name} = {value}")
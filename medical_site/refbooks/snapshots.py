@@ -0,0 +1,244 @@
+"""Снимки элементов опубликованных версий справочников.
+
+Версия, дата начала действия которой наступила, практически не меняется,
+поэтому её элементы записываются в неизменяемый файл и читаются через mmap:
+страницы файла находятся в страничном кэше ОС и общие для всех процессов
+gunicorn, а поиск элемента выполняется двоичным поиском без обращения к БД.
+
+Формат файла (little-endian)::
+
+    заголовок   magic, id версии, ревизия, число элементов
+    индекс      для каждого элемента: смещение, длина кода, длина значения
+    данные      код и значение в UTF-8, элементы упорядочены по коду
+
+Имя файла содержит id и ревизию версии (``<id>-<revision>.snap``), поэтому
+изменение элементов приводит к построению нового снимка, а не к изменению
+существующего.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Element
+from .version_resolver import VersionRef
+
+MAGIC = b"RBSNAP01"
+HEADER = struct.Struct("<8sQQQ")
+ENTRY = struct.Struct("<QII")
+
+
+class SnapshotError(Exception):
+    """Файл снимка повреждён или имеет неизвестный формат."""
+
+
+class Snapshot:
+    """Снимок версии справочника, отображённый в память."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise SnapshotError(f"Файл снимка {path.name} повреждён")
+        magic, self.version_id, self.revision, self.count = HEADER.unpack_from(
+            self._map
+        )
+        self._data = HEADER.size + ENTRY.size * self.count
+        if magic != MAGIC or len(self._map) < self._data:
+            raise SnapshotError(f"Файл снимка {path.name} повреждён")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def get(self, code: str) -> Optional[str]:
+        """Значение элемента с кодом ``code`` или None."""
+        encoded = code.encode()
+        position = self._bisect(encoded)
+        if position < self.count:
+            start, code_end, value_end = self._bounds(position)
+            if self._map[start:code_end] == encoded:
+                return self._map[code_end:value_end].decode()
+        return None
+
+    def contains(self, code: str, value: str) -> bool:
+        return self.get(code) == value
+
+    def rows(self, after: Optional[str] = None) -> Iterator[tuple[str, str]]:
+        """Пары (код, значение) в порядке кодов, начиная после ``after``."""
+        position = 0
+        if after is not None:
+            encoded = after.encode()
+            position = self._bisect(encoded)
+            if position < self.count and self._code(position) == encoded:
+                position += 1
+        for index in range(position, self.count):
+            start, code_end, value_end = self._bounds(index)
+            yield (
+                self._map[start:code_end].decode(),
+                self._map[code_end:value_end].decode(),
+            )
+
+    def _bisect(self, code: bytes) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._code(middle) < code:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _code(self, index: int) -> bytes:
+        start, code_end, _ = self._bounds(index)
+        return self._map[start:code_end]
+
+    def _bounds(self, index: int) -> tuple[int, int, int]:
+        offset, code_length, value_length = ENTRY.unpack_from(
+            self._map, HEADER.size + ENTRY.size * index
+        )
+        start = self._data + offset
+        return start, start + code_length, start + code_length + value_length
+
+
+def write_snapshot(
+    path: Path, version_id: int, revision: int, rows: Iterable[tuple[str, str]]
+) -> Path:
+    """Атомарно записывает снимок: файл сначала создаётся под временным именем."""
+    encoded = sorted((code.encode(), value.encode()) for code, value in rows)
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(HEADER.pack(MAGIC, version_id, revision, len(encoded)))
+            offset = 0
+            for code, value in encoded:
+                file.write(ENTRY.pack(offset, len(code), len(value)))
+                offset += len(code) + len(value)
+            for code, value in encoded:
+                file.write(code)
+                file.write(value)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return path
+
+
+class SnapshotStore:
+    """Каталог снимков и открытые в процессе снимки.
+
+    Снимок опубликованной версии строится при первом обращении. Каталог
+    задаётся настройкой REFBOOKS_SNAPSHOT_DIR; если она не задана, снимки
+    не используются и данные читаются из БД.
+    """
+
+    def __init__(self, max_open: int):
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._open = OrderedDict()
+
+    @property
+    def directory(self) -> Optional[Path]:
+        directory = getattr(settings, "REFBOOKS_SNAPSHOT_DIR", None)
+        return Path(directory) if directory else None
+
+    def get(self, version: VersionRef) -> Optional[Snapshot]:
+        """Снимок опубликованной версии или None, если снимки не используются.
+
+        :param version: Версия справочника из ``version_resolver``
+        """
+        if self.directory is None or not is_published(version):
+            return None
+        key = (version.id, version.revision)
+        snapshot = self._opened(key)
+        if snapshot is not None:
+            return snapshot
+        path = self.path(version.id, version.revision)
+        if not path.exists():
+            self.build(version.id, version.revision)
+        snapshot = Snapshot(path)
+        with self._lock:
+            self._open[key] = snapshot
+            # Файлы закрываются сборщиком мусора, когда их перестают читать.
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return snapshot
+
+    async def aget(self, version: VersionRef) -> Optional[Snapshot]:
+        """Асинхронная get(): в пуле потоков, только если снимок ещё не открыт."""
+        if self.directory is None or not is_published(version):
+            return None
+        snapshot = self._opened((version.id, version.revision))
+        if snapshot is not None:
+            return snapshot
+        return await sync_to_async(self.get)(version)
+
+    def _opened(self, key: tuple) -> Optional[Snapshot]:
+        with self._lock:
+            snapshot = self._open.get(key)
+            if snapshot is not None:
+                self._open.move_to_end(key)
+            return snapshot
+
+    def path(self, version_id: int, revision: int) -> Path:
+        return self.directory / f"{version_id}-{revision}.snap"
+
+    def build(self, version_id: int, revision: int) -> Path:
+        """Записывает снимок версии из БД и удаляет снимки прежних ревизий.
+
+        Снимки более новых ревизий не удаляются: процесс, в котором ревизия
+        версии ещё не обновилась, не должен мешать остальным.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        rows = (
+            Element.objects.filter(directory_version_id=version_id)
+            .order_by()
+            .values_list("element_code", "element_value")
+        )
+        path = self.path(version_id, revision)
+        write_snapshot(path, version_id, revision, rows)
+        for stale in self.files(version_id):
+            if _revision(stale) < revision:
+                stale.unlink(missing_ok=True)
+        return path
+
+    def files(self, version_id: Optional[int] = None) -> list:
+        if self.directory is None or not self.directory.exists():
+            return []
+        pattern = f"{version_id}-*.snap" if version_id is not None else "*.snap"
+        return sorted(self.directory.glob(pattern))
+
+    def remove(self, version_id: int) -> None:
+        with self._lock:
+            for key in [key for key in self._open if key[0] == version_id]:
+                del self._open[key]
+        for path in self.files(version_id):
+            path.unlink(missing_ok=True)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._open.clear()
+
+
+def _revision(path: Path) -> int:
+    return int(path.stem.rpartition("-")[2])
+
+
+def is_published(version: VersionRef) -> bool:
+    """Версия уже действует; у черновика без даты начала снимков нет."""
+    if version.start_date is None:
+        return False
+    return version.start_date <= timezone.localdate()
+
+
+snapshot_store = SnapshotStore(
+    max_open=getattr(settings, "REFBOOKS_SNAPSHOT_OPEN_FILES", 128)
+)
@@ -1,17 +1,86 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
-from datetime import datetime
-from .models import Directory, Version, Element
+from datetime import date, datetime, timedelta, timezone
+from .activation import ActivationScheduler
+from .admin import DirectoryAdmin
+from .async_views import AsyncCheckElementView, AsyncDirectoryView, AsyncElementView
+from .changes import sequence
+from .compression import compress, negotiate
+from .element_index import ElementIndex, element_index
+from . import jobs
+from .export import dump_json
+from .history import history_index
+from .metrics import registry
+from .middleware import ReadReplicaMiddleware
+from .importer import RefbookImportError, import_version, read_elements
+from .models import Change, Directory, Job, Version, Element
+from .payload_cache import payload_cache
+from .renderers import ColumnarJSONRenderer
+from .routers import ReplicaRouter
+from .schema import _NoOpenAPI, _no_schema
+from .search import SEARCH_INDEXES, search_indexes, stem, value_vector
+from .snapshots import Snapshot, snapshot_store, write_snapshot
+from .throttling import local_buckets, parse_rate
+from .version_resolver import version_resolver
+
+
+@override_settings(REFBOOKS_THROTTLE_RATES={})
+class RefbookTestCase(TestCase):
+    """Тесты без ограничения частоты запросов.
 
+    Вёдра клиентов общие для всех тестов процесса, поэтому лимиты задают
+    только тесты, которые их проверяют (ThrottlingTestCase). Кэши процесса
+    очищаются перед каждым тестом: идентификаторы версий в откаченных
+    транзакциях выдаются повторно. Общая фикстура — справочник с кодом "1"
+    и его версия "1.0".
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.directory = Directory.objects.create(code="1", name="Справочник1")
+        cls.version = Version.objects.create(
+            directory=cls.directory, version="1.0", start_date=date(2020, 1, 1)
+        )
 
-class RefbookAPITestCase(TestCase):
     def setUp(self):
+        cache.clear()
+        element_index.clear()
+        version_resolver.clear()
+        search_indexes.clear()
+        history_index.clear()
         self.client = APIClient()
-        self.directory = Directory.objects.create(code="1", name="Справочник1")
-        self.version = Version.objects.create(
-            directory=self.directory, version="1.0", start_date=datetime.now()
-        )
+
+
+class RefbookAPITestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
         self.element = Element.objects.create(
             directory_version=self.version, element_code="E01", element_value="Хирург"
         )
@@ -39,3 +108,1869 @@ class RefbookAPITestCase(TestCase):
             },
         )
         self.assertEqual(response.status_code, 200)
+
+
+class ElementIndexTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        Element.objects.create(
+            directory_version=self.version, element_code="E01", element_value="Хирург"
+        )
+        self.url = reverse("check-element", args=[self.directory.id])
+
+    def test_warm_check_does_not_query_database(self):
+        data = {"code": "E01", "value": "Хирург", "version": "1.0"}
+        self.assertEqual(self.client.get(self.url, data=data).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, data=data)
+        self.assertEqual(response.status_code, 200)
+
+    def test_element_change_invalidates_index(self):
+        data = {"code": "E02", "value": "Терапевт", "version": "1.0"}
+        self.assertEqual(self.client.get(self.url, data=data).status_code, 400)
+        Element.objects.create(
+            directory_version=self.version, element_code="E02", element_value="Терапевт"
+        )
+        self.assertEqual(self.client.get(self.url, data=data).status_code, 200)
+
+    def test_unknown_version(self):
+        data = {"code": "E01", "value": "Хирург", "version": "2.0"}
+        response = self.client.get(self.url, data=data)
+        self.assertEqual(response.status_code, 404)
+
+    def test_least_recently_used_version_is_evicted(self):
+        other = Version.objects.create(directory=self.directory, version="2.0")
+        Element.objects.create(
+            directory_version=other, element_code="E01", element_value="Хирург"
+        )
+        index = ElementIndex(max_elements=1)
+        index.get(self.directory.id, "1.0")
+        index.get(self.directory.id, "2.0")
+        with self.assertNumQueries(0):
+            index.get(self.directory.id, "2.0")
+        with self.assertNumQueries(2):
+            index.get(self.directory.id, "1.0")
+
+
+class CheckElementBatchTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Directory.objects.create(code="2", name="Справочник2")
+        Version.objects.create(directory=self.other, version="1.0")
+        Element.objects.create(
+            directory_version=self.version, element_code="E01", element_value="Хирург"
+        )
+        self.url = reverse("check-element", args=[self.directory.id])
+
+    def test_batch_check(self):
+        items = [
+            {"code": "E01", "value": "Хирург"},
+            {"code": "E01", "value": "Терапевт", "version": "1.0"},
+            {"code": "E01", "value": "Хирург", "version": "2.0"},
+            {"code": "E01", "value": "Хирург", "refbook": self.other.id},
+            {"code": "E01", "value": "Хирург", "refbook": 0},
+        ]
+        with self.assertNumQueries(5):
+            response = self.client.post(self.url, {"items": items}, format="json")
+        self.assertEqual(response.status_code, 200)
+        results = response.data["results"]
+        self.assertEqual(
+            [result["found"] for result in results], [True, False, False, False, False]
+        )
+        self.assertEqual(results[0]["version"], "1.0")
+        self.assertEqual(results[2]["error"], "Версия не найдена")
+        self.assertEqual(
+            results[3]["error"], "Не найдено версий для указанного справочника"
+        )
+        self.assertEqual(results[4]["error"], "Справочник не найден")
+
+    def test_batch_check_validates_items(self):
+        response = self.client.post(
+            self.url, {"items": [{"code": "E01"}]}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("items", response.data)
+
+
+class VersionResolverTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        today = date.today()
+        for version, start_date in [
+            ("10.0", today - timedelta(days=1)),
+            ("9.0", today + timedelta(days=1)),
+        ]:
+            Version.objects.create(
+                directory=self.directory, version=version, start_date=start_date
+            )
+
+    def test_effective_version_by_date(self):
+        today = date.today()
+        self.assertEqual(version_resolver.effective(self.directory.id).version, "10.0")
+        self.assertEqual(
+            version_resolver.effective(
+                self.directory.id, today - timedelta(days=5)
+            ).version,
+            "1.0",
+        )
+        self.assertIsNone(
+            version_resolver.effective(self.directory.id, date(2019, 12, 31))
+        )
+
+    def test_timeline_loaded_before_commit_is_not_reused(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            version = Version.objects.create(
+                directory=self.directory, version="11.0", start_date=date.today()
+            )
+            # Шкала, загруженная до фиксации, и изменение после её загрузки.
+            effective = version_resolver.effective(self.directory.id)
+            self.assertEqual(effective.version, "11.0")
+            Version.objects.filter(pk=version.pk).update(version="11.1")
+        effective = version_resolver.effective(self.directory.id)
+        self.assertEqual(effective.version, "11.1")
+
+    def test_current_version_is_consistent(self):
+        admin = DirectoryAdmin(Directory, None)
+        self.assertEqual(admin.get_current_version(self.directory), "10.0")
+        self.assertEqual(self.directory.get_latest_version().version, "10.0")
+
+    def test_warm_resolution_does_not_query_database(self):
+        version_resolver.effective(self.directory.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.directory.get_latest_version().version, "10.0")
+
+    def test_version_change_refreshes_timeline(self):
+        version_resolver.effective(self.directory.id)
+        Version.objects.filter(version="9.0").get().delete()
+        Version.objects.create(
+            directory=self.directory, version="11.0", start_date=date.today()
+        )
+        self.assertEqual(version_resolver.effective(self.directory.id).version, "11.0")
+
+
+class ElementExportTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        for code, value in [("E03", "Терапевт"), ("E01", "Хирург"), ("E02", "ЛОР")]:
+            Element.objects.create(
+                directory_version=self.version, element_code=code, element_value=value
+            )
+        self.url = reverse("refbook-elements", args=[self.directory.id])
+
+    def test_keyset_pagination(self):
+        response = self.client.get(self.url, data={"limit": 2})
+        self.assertEqual(
+            [element["element_code"] for element in response.data["elements"]],
+            ["E01", "E02"],
+        )
+        self.assertEqual(response.data["next"], "E02")
+
+        response = self.client.get(self.url, data={"limit": 2, "after": "E02"})
+        self.assertEqual(
+            [element["element_code"] for element in response.data["elements"]],
+            ["E03"],
+        )
+        self.assertIsNone(response.data["next"])
+
+    def test_invalid_limit(self):
+        response = self.client.get(self.url, data={"limit": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_ndjson(self):
+        response = self.client.get(self.url, data={"stream": "ndjson"})
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            json.loads(lines[0]), {"element_code": "E01", "element_value": "Хирург"}
+        )
+        self.assertEqual(len(lines), 3)
+
+    def test_stream_csv(self):
+        response = self.client.get(self.url, data={"stream": "csv"})
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.reader(content.splitlines()))
+        self.assertEqual(rows[0], ["element_code", "element_value"])
+        self.assertEqual(
+            rows[1:], [["E01", "Хирург"], ["E02", "ЛОР"], ["E03", "Терапевт"]]
+        )
+
+
+class ConditionalGetTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        Element.objects.create(
+            directory_version=self.version, element_code="E01", element_value="Хирург"
+        )
+        self.url = reverse("refbook-elements", args=[self.directory.id])
+
+    def test_versioned_elements_not_modified(self):
+        response = self.client.get(self.url, data={"version": "1.0"})
+        self.assertIn("max-age=86400", response["Cache-Control"])
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(
+            self.url, data={"version": "1.0"}, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_element_change_changes_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        Element.objects.create(
+            directory_version=self.version, element_code="E02", element_value="ЛОР"
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_representations_have_different_etags(self):
+        page = self.client.get(self.url, data={"limit": 1})
+        full = self.client.get(self.url)
+        self.assertNotEqual(page["ETag"], full["ETag"])
+
+    def test_directories_not_modified(self):
+        url = reverse("refbook-directory")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Directory.objects.create(code="2", name="Справочник2")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class DirectoryListTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("refbook-directory")
+        for code in ("2", "3"):
+            directory = Directory.objects.create(code=code, name=f"Справочник{code}")
+            Version.objects.create(
+                directory=directory, version="1.0", start_date=date(2020, 1, 1)
+            )
+        for directory in Directory.objects.all():
+            Version.objects.create(
+                directory=directory, version="2.0", start_date=date(2023, 1, 1)
+            )
+        Directory.objects.create(code="4", name="Справочник4")
+
+    def test_filter_by_date_is_single_query_without_duplicates(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, data={"date": "2023-06-01"})
+        self.assertEqual(
+            [directory["code"] for directory in response.data["refbooks"]],
+            ["1", "2", "3"],
+        )
+
+    def test_effective_version(self):
+        response = self.client.get(
+            self.url, data={"date": "2022-06-01", "with_version": "1"}
+        )
+        refbook = response.data["refbooks"][0]
+        self.assertEqual(refbook["current_version"], "1.0")
+        self.assertEqual(refbook["start_date"], "2020-01-01")
+
+    def test_pagination(self):
+        response = self.client.get(self.url, data={"limit": 3})
+        self.assertEqual(len(response.data["refbooks"]), 3)
+        response = self.client.get(
+            self.url, data={"limit": 3, "after": response.data["next"]}
+        )
+        self.assertEqual(
+            [directory["code"] for directory in response.data["refbooks"]], ["4"]
+        )
+        self.assertIsNone(response.data["next"])
+
+    def test_invalid_date(self):
+        response = self.client.get(self.url, data={"date": "01.10.2022"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImportRefbookTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.tmpdir.name) / name
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    def test_import_csv(self):
+        path = self.write("v2.csv", "code,value\nE02,ЛОР\nE01,Хирург\n")
+        out = StringIO()
+        call_command(
+            "import_refbook",
+            path,
+            directory="1",
+            refbook_version="2.0",
+            start_date="2023-01-01",
+            batch_size=1,
+            stdout=out,
+        )
+        version = Version.objects.get(directory=self.directory, version="2.0")
+        self.assertEqual(version.start_date, date(2023, 1, 1))
+        self.assertEqual(
+            list(version.element_set.values_list("element_code", "element_value")),
+            [("E01", "Хирург"), ("E02", "ЛОР")],
+        )
+        self.assertIn("строк/с", out.getvalue())
+
+    def test_import_json_and_xml(self):
+        elements = [
+            {"element_code": f"E{number:03}", "element_value": "Хирург"}
+            for number in range(50)
+        ]
+        path = self.write("v2.json", json.dumps({"elements": elements}))
+        call_command(
+            "import_refbook",
+            path,
+            directory="1",
+            refbook_version="2.0",
+            stdout=StringIO(),
+        )
+        path = self.write(
+            "v3.xml",
+            '<elements><element code="E01" value="Хирург"/>'
+            "<element><code>E02</code><value>ЛОР</value></element></elements>",
+        )
+        call_command(
+            "import_refbook",
+            path,
+            directory="1",
+            refbook_version="3.0",
+            stdout=StringIO(),
+        )
+        counts = {
+            version.version: version.element_set.count()
+            for version in self.directory.version_set.all()
+        }
+        self.assertEqual(counts, {"1.0": 0, "2.0": 50, "3.0": 2})
+
+    def test_dry_run_does_not_write(self):
+        path = self.write("v2.ndjson", '{"code": "E01", "value": "Хирург"}\n')
+        call_command(
+            "import_refbook",
+            path,
+            directory="2",
+            name="Справочник2",
+            refbook_version="1.0",
+            dry_run=True,
+            stdout=StringIO(),
+        )
+        self.assertFalse(Directory.objects.filter(code="2").exists())
+
+    def test_duplicate_code_rolls_back(self):
+        path = self.write("v2.csv", "code,value\nE01,Хирург\nE01,ЛОР\n")
+        with self.assertRaises(CommandError):
+            call_command(
+                "import_refbook",
+                path,
+                directory="1",
+                refbook_version="2.0",
+                stdout=StringIO(),
+            )
+        self.assertFalse(Version.objects.filter(version="2.0").exists())
+
+    def test_missing_and_null_fields(self):
+        path = self.write(
+            "v2.ndjson",
+            '{"code": "E01", "element_value": null, "value": "Хирург"}\n'
+            '{"code": "E02", "value": null}\n',
+        )
+        with self.assertRaisesMessage(RefbookImportError, "Запись 2: пустой код"):
+            import_version(self.directory, "2.0", read_elements(Path(path), "ndjson"))
+        path = self.write("v3.csv", "code,value\nE01\n")
+        with self.assertRaisesMessage(RefbookImportError, "Запись 1: пустой код"):
+            import_version(self.directory, "3.0", read_elements(Path(path), "csv"))
+
+    def test_malformed_files_report_line(self):
+        path = self.write("v2.ndjson", '{"code": "E01", "value": "Хирург"}\n{"code":\n')
+        message = "Строка 2: некорректный JSON"
+        with self.assertRaisesMessage(RefbookImportError, message):
+            list(read_elements(Path(path), "ndjson"))
+        path = self.write(
+            "v3.xml", '<elements>\n<element code="E01" value="Хирург"/>\n<element>'
+        )
+        message = "Строка 3: некорректный XML"
+        with self.assertRaisesMessage(RefbookImportError, message):
+            list(read_elements(Path(path), "xml"))
+        with self.assertRaises(CommandError):
+            call_command(
+                "import_refbook",
+                path,
+                directory="1",
+                refbook_version="3.0",
+                stdout=StringIO(),
+            )
+
+
+class GenerateRefbooksTestCase(RefbookTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Без общей фикстуры: команда проверяется на пустой БД."""
+
+    def test_generates_directories_versions_and_elements(self):
+        call_command(
+            "generate_refbooks",
+            directories=2,
+            versions=3,
+            elements=20,
+            stdout=StringIO(),
+        )
+        self.assertEqual(Directory.objects.count(), 2)
+        self.assertEqual(Version.objects.count(), 6)
+        self.assertEqual(Element.objects.count(), 120)
+        directory = Directory.objects.get(code="bench-0")
+        self.assertEqual(directory.get_latest_version().version, "3.0")
+        with self.assertRaises(CommandError):
+            call_command("generate_refbooks", directories=1, stdout=StringIO())
+        call_command(
+            "generate_refbooks", directories=1, clear=True, stdout=StringIO()
+        )
+        self.assertEqual(Directory.objects.count(), 1)
+
+
+class VersionDiffTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        old = self.version
+        new = Version.objects.create(
+            directory=self.directory, version="2.0", start_date=date(2023, 1, 1)
+        )
+        for version, code, value in [
+            (old, "E01", "Хирург"),
+            (old, "E02", "ЛОР"),
+            (old, "E03", "Терапевт"),
+            (new, "E01", "Хирург"),
+            (new, "E02", "Оториноларинголог"),
+            (new, "E04", "Кардиолог"),
+        ]:
+            Element.objects.create(
+                directory_version=version, element_code=code, element_value=value
+            )
+        self.url = reverse("refbook-diff", args=[self.directory.id])
+
+    def test_diff(self):
+        response = self.client.get(self.url, data={"from": "1.0", "to": "2.0"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data["added"],
+            [{"element_code": "E04", "element_value": "Кардиолог"}],
+        )
+        self.assertEqual(
+            response.data["removed"],
+            [{"element_code": "E03", "element_value": "Терапевт"}],
+        )
+        self.assertEqual(
+            response.data["changed"],
+            [
+                {
+                    "element_code": "E02",
+                    "old_value": "ЛОР",
+                    "new_value": "Оториноларинголог",
+                }
+            ],
+        )
+
+    def test_diff_is_cached_per_version_pair(self):
+        self.client.get(self.url, data={"from": "1.0"})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, data={"from": "1.0", "to": "2.0"})
+        self.assertEqual(len(response.data["added"]), 1)
+
+    def test_unknown_version(self):
+        response = self.client.get(self.url, data={"from": "3.0"})
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncViewsTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = AsyncRequestFactory()
+        Element.objects.create(
+            directory_version=self.version, element_code="E01", element_value="Хирург"
+        )
+
+    async def test_directories(self):
+        request = self.factory.get("/refbooks/", {"with_version": "1"})
+        response = await AsyncDirectoryView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["refbooks"][0]["code"], "1")
+
+    async def test_elements(self):
+        request = self.factory.get("/")
+        response = await AsyncElementView.as_view()(request, id=self.directory.id)
+        self.assertEqual(
+            json.loads(response.content),
+            {"elements": [{"element_code": "E01", "element_value": "Хирург"}]},
+        )
+        request = self.factory.get("/", headers={"If-None-Match": response["ETag"]})
+        response = await AsyncElementView.as_view()(request, id=self.directory.id)
+        self.assertEqual(response.status_code, 304)
+
+    async def test_stream_elements(self):
+        request = self.factory.get("/", {"stream": "ndjson"})
+        response = await AsyncElementView.as_view()(request, id=self.directory.id)
+        content = b"".join([chunk async for chunk in response])
+        self.assertEqual(
+            json.loads(content), {"element_code": "E01", "element_value": "Хирург"}
+        )
+
+    async def test_check_element(self):
+        view = AsyncCheckElementView.as_view()
+        request = self.factory.get("/", {"code": "E01", "value": "Хирург"})
+        response = await view(request, id=self.directory.id)
+        self.assertEqual(response.status_code, 200)
+
+        request = self.factory.post(
+            "/",
+            {"items": [{"code": "E01", "value": "ЛОР"}]},
+            content_type="application/json",
+        )
+        response = await view(request, id=self.directory.id)
+        self.assertFalse(json.loads(response.content)["results"][0]["found"])
+
+    async def test_columnar_format(self):
+        view = AsyncElementView.as_view()
+        request = self.factory.get("/", {"format": "columns"})
+        response = await view(request, id=self.directory.id)
+        self.assertEqual(
+            response["Content-Type"], "application/vnd.refbooks.columns+json"
+        )
+        self.assertEqual(
+            json.loads(response.content), {"codes": ["E01"], "values": ["Хирург"]}
+        )
+        request = self.factory.get(
+            "/", {"limit": 1}, headers={"Accept": ColumnarJSONRenderer.media_type}
+        )
+        page = await view(request, id=self.directory.id)
+        self.assertEqual(json.loads(page.content)["codes"], ["E01"])
+        plain = await view(self.factory.get("/"), id=self.directory.id)
+        self.assertNotEqual(plain["ETag"], response["ETag"])
+
+    async def test_views_use_snapshots(self):
+        snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(snapshot_dir.cleanup)
+        self.addCleanup(snapshot_store.clear)
+        with self.settings(REFBOOKS_SNAPSHOT_DIR=snapshot_dir.name):
+            response = await AsyncElementView.as_view()(
+                self.factory.get("/"), id=self.directory.id
+            )
+            self.assertEqual(len(snapshot_store.files(self.version.id)), 1)
+            self.assertEqual(
+                json.loads(response.content)["elements"][0]["element_code"], "E01"
+            )
+            request = self.factory.get("/", {"code": "E01", "value": "Хирург"})
+            with mock.patch.object(element_index, "acontains") as acontains:
+                response = await AsyncCheckElementView.as_view()(
+                    request, id=self.directory.id
+                )
+            self.assertEqual(response.status_code, 200)
+            acontains.assert_not_called()
+
+
+class QueryPlanTestCase(RefbookTestCase):
+    """Число запросов представлений и отсутствие полных сканирований таблиц."""
+
+    def setUp(self):
+        super().setUp()
+        self.directories = []
+        for number in range(5):
+            directory = Directory.objects.create(
+                code=f"Q{number}", name=f"Справочник{number}"
+            )
+            for version_number in range(3):
+                version = Version.objects.create(
+                    directory=directory,
+                    version=f"{version_number}.0",
+                    start_date=date(2020 + version_number, 1, 1),
+                )
+                Element.objects.bulk_create(
+                    Element(
+                        directory_version=version,
+                        element_code=f"E{code:02}",
+                        element_value=f"Значение {code}",
+                    )
+                    for code in range(10)
+                )
+            self.directories.append(directory)
+
+    def explain(self, sql: str) -> list:
+        with connection.cursor() as cursor:
+            if connection.vendor == "postgresql":
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("EXPLAIN " + sql)
+                return [row[0] for row in cursor.fetchall()]
+            cursor.execute("EXPLAIN QUERY PLAN " + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScans(self, queries, allowed=()):
+        tables = {"refbooks_directory", "refbooks_version", "refbooks_element"}
+        for query in queries:
+            for line in self.explain(query["sql"]):
+                match = re.search(r"(?:^SCAN|Seq Scan on) (\w+)", line.strip())
+                if match and match.group(1) in tables - set(allowed):
+                    self.fail(f"Полное сканирование {match.group(1)}: {query['sql']}")
+
+    def capture(self, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data=data)
+        self.assertEqual(response.status_code, 200)
+        return context.captured_queries
+
+    def test_element_view(self):
+        url = reverse("refbook-elements", args=[self.directories[0].id])
+        queries = self.capture(url, data={"version": "1.0"})
+        self.assertEqual(len(queries), 2)
+        self.assertNoFullScans(queries)
+        self.assertNoFullScans(self.capture(url, data={"limit": 5, "after": "E02"}))
+
+    def test_check_element_view(self):
+        url = reverse("check-element", args=[self.directories[0].id])
+        queries = self.capture(url, data={"code": "E01", "value": "Значение 1"})
+        self.assertLessEqual(len(queries), 3)
+        self.assertNoFullScans(queries)
+
+    def test_batch_check_has_no_n_plus_one(self):
+        url = reverse("check-element", args=[self.directories[0].id])
+        items = [
+            {"code": f"E{code:02}", "value": f"Значение {code}"} for code in range(10)
+        ]
+        with CaptureQueriesContext(connection) as context:
+            self.client.post(url, {"items": items}, format="json")
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertNoFullScans(context.captured_queries)
+
+    def test_directory_view_query_count_does_not_grow(self):
+        url = reverse("refbook-directory")
+        data = {"date": "2021-06-01", "with_version": "1"}
+        queries = self.capture(url, data=data)
+        self.assertEqual(len(queries), 1)
+        self.assertNoFullScans(queries, allowed=("refbooks_directory",))
+        Directory.objects.create(code="new", name="Новый справочник")
+        self.assertEqual(len(self.capture(url, data=data)), 1)
+
+    def test_effective_version_subquery_uses_index(self):
+        with CaptureQueriesContext(connection) as context:
+            list(Directory.objects.listing(date(2021, 6, 1), with_version=True))
+        self.assertNoFullScans(
+            context.captured_queries, allowed=("refbooks_directory",)
+        )
+
+
+class PayloadCacheTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        payload_cache.reset_stats()
+        Element.objects.create(
+            directory_version=self.version, element_code="A", element_value="Один"
+        )
+        self.url = reverse("refbook-elements", args=[self.directory.id])
+
+    def test_repeated_request_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second["Content-Type"], "application/json")
+        self.assertEqual(
+            second.json(),
+            {"elements": [{"element_code": "A", "element_value": "Один"}]},
+        )
+        self.assertEqual(payload_cache.stats()["hit"], 1)
+        self.assertEqual(payload_cache.stats()["miss"], 1)
+
+    def test_element_change_invalidates_payload(self):
+        self.client.get(self.url)
+        Element.objects.create(
+            directory_version=self.version, element_code="B", element_value="Два"
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.json()["elements"]), 2)
+
+    def test_payload_built_before_commit_is_not_reused(self):
+        url = reverse("refbook-directory")
+        with self.captureOnCommitCallbacks(execute=True):
+            Directory.objects.create(code="2", name="Справочник2")
+            # Ответ, построенный до фиксации импорта.
+            during = self.client.get(url)
+            self.assertEqual(self.client.get(url)["ETag"], during["ETag"])
+        misses = payload_cache.stats()["miss"]
+        after = self.client.get(url)
+        self.assertNotEqual(after["ETag"], during["ETag"])
+        self.assertEqual(payload_cache.stats()["miss"], misses + 1)
+
+    def test_version_change_invalidates_directory_listing(self):
+        url = reverse("refbook-directory")
+        data = {"date": "2021-01-01", "with_version": "1"}
+        self.client.get(url, data=data)
+        self.version.version = "1.1"
+        self.version.save()
+        response = self.client.get(url, data=data)
+        self.assertEqual(response.json()["refbooks"][0]["current_version"], "1.1")
+
+    def test_file_based_cache(self):
+        with tempfile.TemporaryDirectory() as location:
+            caches = {
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": location,
+                }
+            }
+            with override_settings(CACHES=caches):
+                first = self.client.get(self.url)
+                second = self.client.get(self.url)
+                self.assertTrue(any(Path(location).iterdir()))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(payload_cache.stats()["hit"], 1)
+
+    def test_concurrent_miss_waits_for_builder(self):
+        generation = payload_cache.generation()
+        key = "refbooks:payload:key"
+        cache.add(key + ":lock", 1, version=generation)
+        timer = threading.Timer(
+            0.05, lambda: cache.set(key, b"built", version=generation)
+        )
+        timer.start()
+        content = payload_cache.get_or_build("key", lambda: self.fail("build"))
+        timer.join()
+        self.assertEqual(content, b"built")
+        self.assertEqual(payload_cache.stats()["wait"], 1)
+
+
+class FastSerializationTestCase(RefbookTestCase):
+    data = {
+        "elements": [
+            {"element_code": "J00", "element_value": 'Хирург "главный"\u2028\u2029'},
+            {"element_code": "</script>", "element_value": "\x01 \U0001f600"},
+        ],
+        "start_date": date(2022, 1, 1),
+        "updated_at": datetime(2022, 1, 1, 12, 30, 15, 123456),
+        "next": None,
+    }
+
+    def test_matches_json_renderer(self):
+        self.assertEqual(dump_json(self.data), JSONRenderer().render(self.data))
+
+    def test_matches_json_renderer_without_orjson(self):
+        with mock.patch("refbooks.export.orjson", None):
+            self.assertEqual(dump_json(self.data), JSONRenderer().render(self.data))
+
+    def test_element_view_response_shape(self):
+        elements = [("B", "Второй"), ("A", "Первый")]
+        Element.objects.bulk_create(
+            Element(
+                directory_version=self.version, element_code=code, element_value=value
+            )
+            for code, value in elements
+        )
+        response = self.client.get(
+            reverse("refbook-elements", args=[self.directory.id])
+        )
+        expected = {
+            "elements": [
+                {"element_code": code, "element_value": value}
+                for code, value in sorted(elements)
+            ]
+        }
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+
+class RequestMetricsTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+        Element.objects.create(
+            directory_version=self.version, element_code="A", element_value="Один"
+        )
+        self.url = reverse("refbook-elements", args=[self.directory.id])
+
+    def test_server_timing_header(self):
+        response = self.client.get(self.url)
+        timing = response["Server-Timing"]
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="2 queries"')
+        self.assertIn("serialize;dur=", timing)
+        self.assertIn("cache;desc=payload-miss", timing)
+        response = self.client.get(self.url)
+        self.assertIn('desc="0 queries"', response["Server-Timing"])
+        self.assertIn("cache;desc=payload-hit", response["Server-Timing"])
+
+    def test_metrics_endpoint(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        content = response.content.decode()
+        labels = 'endpoint="refbooks/<int:id>/elements/",method="GET"'
+        self.assertIn(f'refbooks_requests_total{{{labels},status="200"}} 2', content)
+        self.assertIn(
+            f'refbooks_request_duration_seconds_count{{{labels}}} 2', content
+        )
+        self.assertIn(f'refbooks_request_queries_bucket{{{labels},le="2"}} 2', content)
+        self.assertIn(
+            'refbooks_cache_requests_total{cache="payload",result="hit"} 1', content
+        )
+        self.assertIn(f"refbooks_response_bytes_count{{{labels}}} 2", content)
+
+    @override_settings(REFBOOKS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_request_log_includes_sql(self):
+        with self.assertLogs("refbooks.slow", level="WARNING") as logs:
+            self.client.get(self.url)
+        self.assertIn("SQL-запросов 2", logs.output[0])
+        self.assertIn('FROM "refbooks_element"', logs.output[0])
+        self.assertEqual(
+            registry.value(
+                "refbooks_slow_requests_total",
+                endpoint="refbooks/<int:id>/elements/",
+            ),
+            1,
+        )
+
+
+class SnapshotTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        snapshot_store.clear()
+        self.snapshot_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.snapshot_dir.cleanup)
+        settings = override_settings(REFBOOKS_SNAPSHOT_DIR=self.snapshot_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(snapshot_store.clear)
+
+        elements = [("B", "Бета"), ("A", "Альфа"), ("Я", "Последний")]
+        Element.objects.bulk_create(
+            Element(
+                directory_version=self.version, element_code=code, element_value=value
+            )
+            for code, value in elements
+        )
+
+    def test_file_lookup_and_rows(self):
+        path = Path(self.snapshot_dir.name) / "snapshot.snap"
+        write_snapshot(path, 1, 0, [("b", "2"), ("a", "1"), ("в", "Три")])
+        snapshot = Snapshot(path)
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(snapshot.get("в"), "Три")
+        self.assertIsNone(snapshot.get("c"))
+        self.assertTrue(snapshot.contains("a", "1"))
+        self.assertFalse(snapshot.contains("a", "2"))
+        self.assertEqual(list(snapshot.rows(after="a")), [("b", "2"), ("в", "Три")])
+        self.assertEqual(list(snapshot.rows(after="aa")), [("b", "2"), ("в", "Три")])
+
+    def test_views_serve_from_snapshot_without_queries(self):
+        elements_url = reverse("refbook-elements", args=[self.directory.id])
+        check_url = reverse("check-element", args=[self.directory.id])
+        self.client.get(elements_url)
+        self.assertEqual(len(snapshot_store.files(self.version.id)), 1)
+        cache.clear()
+        element_index.clear()
+        with self.assertNumQueries(0):
+            response = self.client.get(elements_url)
+            page = self.client.get(elements_url, data={"limit": 1, "after": "A"})
+            found = self.client.get(check_url, data={"code": "Я", "value": "Последний"})
+            missing = self.client.get(check_url, data={"code": "A", "value": "Бета"})
+        self.assertEqual(
+            [element["element_code"] for element in response.json()["elements"]],
+            ["A", "B", "Я"],
+        )
+        self.assertEqual(page.json()["elements"][0]["element_code"], "B")
+        self.assertEqual(found.status_code, 200)
+        self.assertEqual(missing.status_code, 400)
+
+    def test_check_without_code_is_rejected(self):
+        self.client.get(reverse("refbook-elements", args=[self.directory.id]))
+        self.assertEqual(len(snapshot_store.files(self.version.id)), 1)
+        response = self.client.get(
+            reverse("check-element", args=[self.directory.id]), data={"value": "Бета"}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("code", response.json())
+        view = async_to_sync(AsyncCheckElementView.as_view())
+        request = AsyncRequestFactory().get("/", {"value": "Бета"})
+        response = view(request, id=self.directory.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("code", json.loads(response.content))
+
+    def test_future_version_is_not_snapshotted(self):
+        version = Version.objects.create(
+            directory=self.directory,
+            version="2.0",
+            start_date=date.today() + timedelta(days=30),
+        )
+        self.client.get(
+            reverse("refbook-elements", args=[self.directory.id]),
+            data={"version": "2.0"},
+        )
+        self.assertEqual(snapshot_store.files(version.id), [])
+
+    def test_version_without_start_date_is_served_from_db(self):
+        version = Version.objects.create(directory=self.directory, version="draft")
+        Element.objects.create(
+            directory_version=version, element_code="D", element_value="Черновик"
+        )
+        response = self.client.get(
+            reverse("refbook-elements", args=[self.directory.id]),
+            data={"version": "draft"},
+        )
+        found = self.client.get(
+            reverse("check-element", args=[self.directory.id]),
+            data={"code": "D", "value": "Черновик", "version": "draft"},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["elements"][0]["element_code"], "D")
+        self.assertEqual(found.status_code, 200)
+        self.assertEqual(snapshot_store.files(version.id), [])
+
+    def test_element_change_builds_new_revision(self):
+        url = reverse("refbook-elements", args=[self.directory.id])
+        self.client.get(url)
+        Element.objects.create(
+            directory_version=self.version, element_code="C", element_value="Гамма"
+        )
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()["elements"]), 4)
+        self.assertEqual(
+            [path.name for path in snapshot_store.files(self.version.id)],
+            [f"{self.version.id}-1.snap"],
+        )
+
+    def test_version_delete_removes_snapshot(self):
+        self.client.get(reverse("refbook-elements", args=[self.directory.id]))
+        self.version.delete()
+        self.assertEqual(snapshot_store.files(), [])
+
+    def test_command_rebuild_verify_prune(self):
+        out = StringIO()
+        call_command("refbook_snapshots", "rebuild", stdout=out)
+        call_command("refbook_snapshots", "verify", stdout=out)
+        self.assertIn("Проверено снимков: 1", out.getvalue())
+
+        Element.objects.filter(element_code="A").update(element_value="Изменено")
+        with self.assertRaises(CommandError):
+            call_command("refbook_snapshots", "verify", stdout=out, stderr=StringIO())
+        call_command("refbook_snapshots", "rebuild", stdout=out)
+        call_command("refbook_snapshots", "verify", stdout=out)
+
+        stale = Path(self.snapshot_dir.name) / f"{self.version.id + 100}-0.snap"
+        stale.write_bytes(b"")
+        call_command("refbook_snapshots", "prune", stdout=out)
+        self.assertFalse(stale.exists())
+        self.assertEqual(len(snapshot_store.files()), 1)
+
+
+class ElementSearchTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        elements = [
+            ("J00", "Хирург"),
+            ("J01", "Главный хирург"),
+            ("J02", "Хирургическое отделение"),
+            ("J10", "Терапевт"),
+            ("K00", "Врач-хирург детский"),
+            ("J0", "Ёлочная игрушка"),
+        ]
+        Element.objects.bulk_create(
+            Element(
+                directory_version=self.version, element_code=code, element_value=value
+            )
+            for code, value in elements
+        )
+        self.url = reverse("refbook-element-search", args=[self.directory.id])
+
+    def search(self, **params):
+        response = self.client.get(self.url, data=params)
+        self.assertEqual(response.status_code, 200)
+        return [element["element_code"] for element in response.json()["elements"]]
+
+    def test_stem(self):
+        self.assertEqual(stem("Хирурга"), "хирург")
+        self.assertEqual(stem("хирургический"), stem("Хирургическая"))
+        self.assertEqual(stem("ёлка"), "елк")
+        self.assertEqual(stem("редакции"), stem("редакция"))
+
+    def test_code_prefix(self):
+        self.assertEqual(self.search(q="j0"), ["J0", "J00", "J01", "J02"])
+
+    def test_words_ignore_endings(self):
+        # Точное совпадение основы выше совпадения по префиксу основы.
+        self.assertEqual(self.search(q="хирурга"), ["J00", "J01", "K00", "J02"])
+        self.assertEqual(self.search(q="главные хирурги"), ["J01"])
+        # Повтор первого слова не сбрасывает условия остальных слов.
+        self.assertEqual(self.search(q="хирург главный хирург"), ["J01"])
+        self.assertEqual(self.search(q="елочные"), ["J0"])
+        self.assertEqual(self.search(q="стоматолог"), [])
+
+    def test_limit_and_validation(self):
+        self.assertEqual(self.search(q="хирург", limit=2), ["J00", "J01"])
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        response = self.client.get(self.url, data={"q": "J", "version": "9.0"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_index_follows_element_changes(self):
+        self.assertEqual(self.search(q="педиатр"), [])
+        Element.objects.create(
+            directory_version=self.version, element_code="P00", element_value="Педиатр"
+        )
+        self.assertEqual(self.search(q="педиатры"), ["P00"])
+
+    def test_query_vector_matches_index(self):
+        # PostgreSQL использует индекс по выражению, только если выражение в
+        # запросе совпадает с индексным (без COALESCE, конфигурация литералом).
+        index = re.search(r"USING gin \((.*)\)$", SEARCH_INDEXES[1]).group(1)
+        queryset = Element.objects.annotate(search=value_vector()).values("search")
+        sql, params = queryset.order_by().query.sql_with_params()
+        vector = re.search(r"SELECT (.*) AS", sql).group(1)
+        vector = vector.replace('"refbooks_element".', "").replace('"', "")
+        self.assertEqual(params, ())
+        self.assertEqual(vector, index)
+
+
+class ElementHistoryTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+        self.add_elements(self.version, {"J00": "Хирург", "J01": "Терапевт"})
+        self.add_version("2.0", date(2021, 1, 1), {"J00": "Хирург", "J01": "Педиатр"})
+        self.url = reverse("refbook-history", args=[self.directory.id])
+
+    def add_version(self, name, start_date, elements):
+        version = Version.objects.create(
+            directory=self.directory, version=name, start_date=start_date
+        )
+        return self.add_elements(version, elements)
+
+    def add_elements(self, version, elements):
+        Element.objects.bulk_create(
+            Element(directory_version=version, element_code=code, element_value=value)
+            for code, value in elements.items()
+        )
+        version_resolver.clear()
+        return version
+
+    def lookup(self, on_date, codes):
+        response = self.client.post(
+            self.url, {"date": on_date, "codes": codes}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def values(self, on_date, codes):
+        return [
+            element["element_value"]
+            for element in self.lookup(on_date, codes)["elements"]
+        ]
+
+    def test_value_on_date(self):
+        data = self.lookup("2020-06-01", ["J01", "J00", "X99"])
+        self.assertEqual(data["version"], "1.0")
+        self.assertEqual(
+            data["elements"],
+            [
+                {
+                    "element_code": "J01",
+                    "element_value": "Терапевт",
+                    "found": True,
+                    "since": "2020-01-01",
+                },
+                {
+                    "element_code": "J00",
+                    "element_value": "Хирург",
+                    "found": True,
+                    "since": "2020-01-01",
+                },
+                {
+                    "element_code": "X99",
+                    "element_value": None,
+                    "found": False,
+                    "since": None,
+                },
+            ],
+        )
+        self.assertEqual(self.values("2021-01-01", ["J01"]), ["Педиатр"])
+        data = self.lookup("2019-12-31", ["J00"])
+        self.assertIsNone(data["version"])
+        self.assertFalse(data["elements"][0]["found"])
+
+    def test_removed_code(self):
+        self.add_version("3.0", date(2022, 1, 1), {"J00": "Хирург"})
+        self.assertEqual(self.values("2022-02-01", ["J00", "J01"]), ["Хирург", None])
+        self.assertEqual(self.values("2021-12-31", ["J01"]), ["Педиатр"])
+
+    def test_timeline_extended_with_new_versions(self):
+        self.assertEqual(self.values("2030-01-01", ["J01"]), ["Педиатр"])
+        self.add_version("3.0", date(2022, 1, 1), {"J01": "Педиатр", "J02": "Лор"})
+        with self.assertNumQueries(2):
+            # Версии справочника и элементы только новой версии.
+            self.assertEqual(self.values("2030-01-01", ["J00", "J02"]), [None, "Лор"])
+        self.assertEqual(self.values("2021-06-01", ["J00"]), ["Хирург"])
+        self.assertEqual(
+            registry.value(
+                "refbooks_cache_requests_total", cache="history", result="extend"
+            ),
+            1,
+        )
+
+    def test_timeline_rebuilt_when_elements_change(self):
+        self.assertEqual(self.values("2020-06-01", ["J01"]), ["Терапевт"])
+        Element.objects.filter(element_value="Терапевт").update(
+            element_value="Терапевт участковый"
+        )
+        Version.objects.get(version="1.0").save()
+        self.assertEqual(self.values("2020-06-01", ["J01"]), ["Терапевт участковый"])
+
+    def test_validation(self):
+        response = self.client.post(
+            self.url, {"date": "2020-13-01", "codes": []}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {"date", "codes"})
+        response = self.client.post(
+            reverse("refbook-history", args=[999]),
+            {"date": "2020-01-01", "codes": ["J00"]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class DatabaseRoutingTestCase(RefbookTestCase):
+    def route(self, method):
+        router = ReplicaRouter()
+        middleware = ReadReplicaMiddleware(
+            lambda request: (router.db_for_read(Element), router.db_for_read(User))
+        )
+        return middleware(getattr(RequestFactory(), method)("/refbooks/"))
+
+    @override_settings(REFBOOKS_READ_REPLICAS=["replica_0"])
+    def test_get_requests_read_refbooks_from_replica(self):
+        self.assertEqual(self.route("get"), ("replica_0", "default"))
+        self.assertEqual(self.route("post"), ("default", "default"))
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Element), "default")
+        self.assertEqual(router.db_for_write(Element), "default")
+        self.assertFalse(router.allow_migrate("replica_0", "refbooks"))
+
+    def test_without_replicas(self):
+        self.assertEqual(self.route("get"), ("default", "default"))
+
+    def test_sqlite_pragmas(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite")
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_production_settings(self):
+        environ = {
+            "DJANGO_SECRET_KEY": "secret",
+            "DJANGO_ALLOWED_HOSTS": "refbooks.example, localhost",
+            "DJANGO_DB_HOST": "db",
+            "DJANGO_DB_REPLICA_HOSTS": "replica1,replica2:6432",
+        }
+        with mock.patch.dict("os.environ", environ):
+            production = importlib.import_module("medical_site.settings_production")
+            production = importlib.reload(production)
+        self.assertFalse(production.DEBUG)
+        self.assertEqual(production.ALLOWED_HOSTS, ["refbooks.example", "localhost"])
+        default = production.DATABASES["default"]
+        self.assertEqual(default["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(default["CONN_MAX_AGE"], 600)
+        self.assertTrue(default["CONN_HEALTH_CHECKS"])
+        self.assertEqual(production.REFBOOKS_READ_REPLICAS, ["replica_0", "replica_1"])
+        self.assertEqual(production.DATABASES["replica_1"]["PORT"], "6432")
+        self.assertIn(
+            "refbooks.middleware.ReadReplicaMiddleware", production.MIDDLEWARE
+        )
+
+
+class AdminQueryTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(self.user)
+
+    def create_directories(self, count):
+        for number in range(Directory.objects.count(), count):
+            directory = Directory.objects.create(
+                code=f"D{number}", name=f"Справочник {number}"
+            )
+            for version in ("1.0", "2.0"):
+                Version.objects.create(
+                    directory=directory,
+                    version=version,
+                    start_date=date(2020 + int(version[0]), 1, 1),
+                )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_query_per_row(self):
+        for name in ("directory", "version", "element"):
+            url = reverse(f"admin:refbooks_{name}_changelist")
+            self.create_directories(2)
+            Element.objects.create(
+                directory_version=Version.objects.last(),
+                element_code=f"{name}1",
+                element_value="Хирург",
+            )
+            few = self.count_queries(url)
+            self.create_directories(20)
+            for version in Version.objects.all()[:10]:
+                Element.objects.create(
+                    directory_version=version, element_code=name, element_value="Врач"
+                )
+            self.assertEqual(self.count_queries(url), few, name)
+
+    def test_directory_changelist_shows_current_version(self):
+        self.create_directories(2)
+        response = self.client.get(reverse("admin:refbooks_directory_changelist"))
+        self.assertContains(response, "2.0")
+        self.assertContains(response, "1 января 2022")
+
+    @override_settings(REFBOOKS_ADMIN_INLINE_PER_PAGE=10)
+    def test_element_inline_is_paginated(self):
+        self.create_directories(1)
+        version = Version.objects.first()
+        Element.objects.bulk_create(
+            Element(
+                directory_version=version,
+                element_code=f"{number:03}",
+                element_value=f"Значение {number}",
+            )
+            for number in range(25)
+        )
+        url = reverse("admin:refbooks_version_change", args=[version.id])
+        response = self.client.get(url, {"elements_page": 3})
+        formset = response.context["inline_admin_formsets"][0].formset
+        self.assertEqual(
+            [form.instance.element_code for form in formset.forms],
+            ["020", "021", "022", "023", "024"],
+        )
+        self.assertContains(response, "Страница 3 из 3")
+
+        data = {
+            "directory": version.directory_id,
+            "version": version.version,
+            "start_date": version.start_date.isoformat(),
+            "element_set-TOTAL_FORMS": 5,
+            "element_set-INITIAL_FORMS": 5,
+        }
+        for number, form in enumerate(formset.forms):
+            data[f"element_set-{number}-id"] = form.instance.id
+            data[f"element_set-{number}-directory_version"] = version.id
+            data[f"element_set-{number}-element_code"] = form.instance.element_code
+            data[f"element_set-{number}-element_value"] = "Изменено"
+        response = self.client.post(f"{url}?elements_page=3", data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Element.objects.filter(element_value="Изменено").count(), 5)
+
+
+class ActivationTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = datetime(2024, 5, 31, 23, 0, tzinfo=timezone.utc)
+        version = Version.objects.create(
+            directory=self.directory, version="2.0", start_date=date(2024, 6, 1)
+        )
+        for version, value in ((self.version, "Хирург"), (version, "Хирург-онколог")):
+            Element.objects.create(
+                directory_version=version, element_code="J00", element_value=value
+            )
+        self.url = reverse("refbook-elements", args=[self.directory.id])
+
+    def at(self, moment):
+        return mock.patch("django.utils.timezone.now", return_value=moment)
+
+    def test_prewarmed_version_is_served_from_cache_after_activation(self):
+        scheduler = ActivationScheduler(lead=timedelta(hours=2), interval=300)
+        with self.at(self.now):
+            scheduler.run_once()
+            response = self.client.get(self.url)
+        self.assertEqual(response.json()["elements"][0]["element_value"], "Хирург")
+        self.assertEqual(len(scheduler.prepared), 1)
+
+        payload_cache.reset_stats()
+        with self.at(self.now + timedelta(hours=1, seconds=1)):
+            response = self.client.get(self.url)
+        self.assertEqual(payload_cache.stats()["hit"], 1)
+        self.assertEqual(
+            response.json()["elements"],
+            [{"element_code": "J00", "element_value": "Хирург-онколог"}],
+        )
+        prewarmed = response.content
+        cache.clear()
+        with self.at(self.now + timedelta(hours=1, seconds=1)):
+            self.assertEqual(self.client.get(self.url).content, prewarmed)
+
+    def test_scheduler_sleeps_until_lead_time(self):
+        scheduler = ActivationScheduler(lead=timedelta(minutes=10), interval=3600)
+        delay = scheduler.run_once(self.now)
+        self.assertEqual(scheduler.prepared, set())
+        self.assertEqual(delay, 50 * 60)
+        scheduler.run_once(self.now + timedelta(minutes=55))
+        self.assertEqual(len(scheduler.prepared), 1)
+
+    def test_current_max_age_ends_at_activation(self):
+        with self.at(self.now + timedelta(minutes=59, seconds=30)):
+            response = self.client.get(self.url)
+            versioned = self.client.get(self.url, {"version": "1.0"})
+        self.assertIn("max-age=30", response["Cache-Control"])
+        self.assertIn("max-age=86400", versioned["Cache-Control"])
+
+    def test_command(self):
+        out = StringIO()
+        with self.at(self.now):
+            call_command("refbook_activations", "--lead", "7200", stdout=out)
+        self.assertIn("Подготовлено версий: 1", out.getvalue())
+
+
+class ChangesFeedTestCase(RefbookTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        """Без общей фикстуры: журнал изменений проверяется на пустой БД."""
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("refbook-changes")
+
+    def feed(self, since=0, **params):
+        response = self.client.get(self.url, {"since": since, **params})
+        self.assertEqual(response.status_code, 200)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        return [json.loads(line) for line in lines], int(response["X-Changes-Until"])
+
+    def test_writes_are_logged_in_order(self):
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            directory = Directory.objects.create(code="1", name="Специальности")
+            version = Version.objects.create(
+                directory=directory, version="1.0", start_date=date(2020, 1, 1)
+            )
+            element = Element.objects.create(
+                directory_version=version, element_code="J00", element_value="Хирург"
+            )
+        changes, until = self.feed()
+        self.assertEqual(
+            [(change["model"], change["action"]) for change in changes],
+            [("directory", "save"), ("version", "save"), ("element", "save")],
+        )
+        self.assertEqual(
+            changes[1]["data"],
+            {"directory": directory.id, "version": "1.0", "start_date": "2020-01-01"},
+        )
+        self.assertEqual(until, changes[-1]["seq"])
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            element.element_value = "Врач-хирург"
+            element.save()
+            element.delete()
+        changes, next_until = self.feed(since=until)
+        self.assertEqual(
+            [(change["action"], change["data"]["element_value"]) for change in changes],
+            [("save", "Врач-хирург"), ("delete", "Врач-хирург")],
+        )
+        self.assertEqual(self.feed(since=next_until), ([], next_until))
+
+    def test_import_and_rolled_back_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            directory = Directory.objects.create(code="1", name="Специальности")
+            import_version(
+                directory, "1.0", [(f"{n:03}", f"Значение {n}") for n in range(50)]
+            )
+            with self.assertRaises(ValueError), transaction.atomic():
+                Directory.objects.create(code="2", name="Отменённый")
+                raise ValueError
+        changes, _ = self.feed()
+        self.assertEqual(len(changes), 52)
+        self.assertEqual(changes[2]["data"]["element_code"], "000")
+
+        with CaptureQueriesContext(connection) as queries:
+            changes, until = self.feed(since=changes[-5]["seq"], limit=3)
+        self.assertEqual(len(changes), 3)
+        self.assertEqual(until, changes[-1]["seq"])
+        # Граница ленты, граница страницы и изменения после курсора: чтение
+        # ленты ничего не изменяет.
+        self.assertEqual(len(queries), 3)
+        self.assertTrue(
+            all(query["sql"].startswith("SELECT") for query in queries.captured_queries)
+        )
+
+    def test_later_commit_is_not_skipped(self):
+        # Запись журнала, вставленная в транзакции, которая началась раньше,
+        # а зафиксирована позже, имеет меньший id, но получает номер больше
+        # уже отданного курсора.
+        def change(id):
+            return Change.objects.create(
+                id=id, model=Change.DIRECTORY, action=Change.SAVE, object_id=id, data={}
+            )
+
+        change(10)
+        sequence()
+        changes, until = self.feed()
+        self.assertEqual([item["id"] for item in changes], [10])
+        change(5)
+        sequence()
+        changes, until = self.feed(since=until)
+        self.assertEqual([item["id"] for item in changes], [5])
+        self.assertEqual(self.feed(since=until), ([], until))
+        self.assertEqual(
+            list(Change.objects.values_list("id", flat=True)), [10, 5]
+        )
+
+    def test_unsequenced_changes_survive_until_maintenance(self):
+        # Записи журнала фиксируются вместе с данными; если процесс
+        # завершился до нумерации, номер выдаёт обслуживание очереди задач.
+        Directory.objects.create(code="1", name="Специальности")
+        self.assertEqual(Change.objects.get().seq, None)
+        self.assertEqual(self.feed(), ([], 0))
+        self.assertEqual(jobs.maintain()["sequenced"], 1)
+        changes, until = self.feed()
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(Change.objects.get().seq, until)
+
+    def test_version_delete_is_logged_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            directory = Directory.objects.create(code="1", name="Специальности")
+            import_version(
+                directory, "1.0", [(f"{n:03}", f"Значение {n}") for n in range(500)]
+            )
+        _, until = self.feed()
+        version = Version.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as queries:
+                version.delete()
+        # Без запросов на каждый элемент: ревизия удаляемой версии не
+        # увеличивается, в журнал пишется только удаление версии.
+        self.assertLess(len(queries), 10)
+        changes, _ = self.feed(since=until)
+        self.assertEqual(
+            [(change["model"], change["action"]) for change in changes],
+            [("version", "delete")],
+        )
+        self.assertFalse(Element.objects.exists())
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"since": "-1"})
+        self.assertEqual(response.status_code, 400)
+
+
+class CompressionTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        Element.objects.bulk_create(
+            Element(
+                directory_version=self.version,
+                element_code=f"{number:04}",
+                element_value=f"Врач-специалист {number}",
+            )
+            for number in range(200)
+        )
+        self.url = reverse("refbook-elements", args=[self.directory.id])
+
+    def test_negotiate(self):
+        self.assertEqual(negotiate("gzip, deflate"), "gzip")
+        self.assertEqual(negotiate("gzip;q=0, identity"), None)
+        self.assertEqual(negotiate("*"), negotiate("zstd, br, gzip"))
+        self.assertIsNone(negotiate(""))
+
+    def test_gzip_response_is_precompressed_once(self):
+        plain = self.client.get(self.url)
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        with mock.patch("refbooks.payload_cache.compress", wraps=compress) as mocked:
+            for _ in range(3):
+                response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+                self.assertEqual(response["Content-Encoding"], "gzip")
+                self.assertEqual(gzip.decompress(response.content), plain.content)
+        mocked.assert_called_once()
+        self.assertLess(len(response.content), len(plain.content) / 4)
+        self.assertEqual(response["ETag"], "W/" + plain["ETag"])
+
+        response = self.client.get(
+            self.url,
+            HTTP_ACCEPT_ENCODING="gzip",
+            HTTP_IF_NONE_MATCH=response["ETag"],
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_small_and_streaming_responses(self):
+        response = self.client.get(
+            reverse("refbook-directory"), HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertNotIn("Content-Encoding", response)
+
+        plain = self.client.get(self.url, {"stream": "ndjson"})
+        response = self.client.get(
+            self.url, {"stream": "ndjson"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(
+            gzip.decompress(b"".join(response.streaming_content)),
+            b"".join(plain.streaming_content),
+        )
+
+    def test_columnar_format(self):
+        response = self.client.get(
+            self.url,
+            {"limit": 2},
+            HTTP_ACCEPT="application/vnd.refbooks.columns+json",
+        )
+        self.assertEqual(
+            response["Content-Type"], "application/vnd.refbooks.columns+json"
+        )
+        self.assertEqual(
+            response.json(),
+            {
+                "codes": ["0000", "0001"],
+                "values": ["Врач-специалист 0", "Врач-специалист 1"],
+                "next": "0001",
+            },
+        )
+        full = self.client.get(self.url, {"format": "columns"}).json()
+        self.assertEqual(len(full["codes"]), 200)
+        self.assertNotEqual(
+            self.client.get(self.url, {"format": "columns"})["ETag"],
+            self.client.get(self.url)["ETag"],
+        )
+
+
+class ApiProfileTestCase(RefbookTestCase):
+    def test_api_profile_does_not_import_schema_generator(self):
+        code = (
+            "import sys, django; django.setup(); "
+            "from django.core.wsgi import get_wsgi_application; "
+            "get_wsgi_application(); "
+            "from django.urls import resolve; resolve('/'); "
+            "import refbooks.views; "
+            "print('drf_yasg' in sys.modules)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=Path(__file__).resolve().parent.parent,
+            env={
+                **{k: v for k, v in os.environ.items() if k != "DJANGO_SECRET_KEY"},
+                "DJANGO_SETTINGS_MODULE": "medical_site.settings_api",
+            },
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip(), "False")
+
+    def test_schema_shims(self):
+        view = object()
+        self.assertIs(_no_schema(operation_description="...")(view), view)
+        self.assertIsNone(_NoOpenAPI().Parameter("code", "query"))
+
+    @override_settings(ROOT_URLCONF="medical_site.urls_api")
+    def test_api_urls(self):
+        self.assertEqual(self.client.get(reverse("refbook-directory")).status_code, 200)
+        self.assertEqual(self.client.get("/admin/").status_code, 404)
+        self.assertEqual(self.client.get("/swagger.json").status_code, 404)
+        self.assertEqual(self.client.post("/refbooks/jobs").status_code, 404)
+
+        with tempfile.NamedTemporaryFile(suffix=".json") as schema:
+            schema.write(b'{"swagger": "2.0"}')
+            schema.flush()
+            with self.settings(REFBOOKS_SCHEMA_FILE=schema.name):
+                response = self.client.get("/swagger.json")
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response["Content-Type"], "application/json")
+                self.assertEqual(
+                    b"".join(response.streaming_content), b'{"swagger": "2.0"}'
+                )
+
+
+@override_settings(REFBOOKS_THROTTLE_RATES={"check": "2/min"})
+class ThrottlingTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        local_buckets.clear()
+        registry.clear()
+        Element.objects.create(
+            directory_version=self.version, element_code="J00", element_value="Хирург"
+        )
+        self.url = reverse("check-element", args=[self.directory.id])
+        self.params = {"code": "J00", "value": "Хирург"}
+
+    def test_token_bucket(self):
+        self.assertEqual(parse_rate("2/min"), (2, 2 / 60))
+        self.assertIsNone(parse_rate(None))
+
+        for remaining in ("1", "0"):
+            response = self.client.get(self.url, self.params)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-RateLimit-Limit"], "2")
+            self.assertEqual(response["X-RateLimit-Remaining"], remaining)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response["X-RateLimit-Remaining"], "0")
+        self.assertIn(response["Retry-After"], ("29", "30"))
+        self.assertEqual(
+            registry.value("refbooks_throttled_requests_total", scope="check"), 1
+        )
+
+        # Другие группы представлений и клиенты с другим адресом не затронуты.
+        response = self.client.get(reverse("refbook-directory"))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-RateLimit-Limit", response)
+        response = self.client.get(self.url, self.params, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(response.status_code, 200)
+
+    def test_forwarded_for_is_trusted_only_behind_proxies(self):
+        def status(forwarded, remote="10.0.0.1"):
+            return self.client.get(
+                self.url,
+                self.params,
+                REMOTE_ADDR=remote,
+                HTTP_X_FORWARDED_FOR=forwarded,
+            ).status_code
+
+        # Без прокси подменённый X-Forwarded-For не даёт нового ведра.
+        statuses = [status(f"192.0.2.{n}") for n in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        with self.settings(REFBOOKS_THROTTLE_NUM_PROXIES=1):
+            # За прокси адрес клиента — последняя запись, добавленная прокси.
+            self.assertEqual(status("192.0.2.9, 198.51.100.1"), 200)
+            self.assertEqual(status("192.0.2.8, 198.51.100.1"), 200)
+            self.assertEqual(status("198.51.100.1"), 429)
+
+    def test_refill(self):
+        with mock.patch("refbooks.throttling.time.monotonic", return_value=1000.0):
+            for _ in range(2):
+                self.client.get(self.url, self.params)
+            self.assertEqual(self.client.get(self.url, self.params).status_code, 429)
+        with mock.patch("refbooks.throttling.time.monotonic", return_value=1030.0):
+            response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-RateLimit-Reset"], "60")
+
+    @override_settings(
+        REFBOOKS_THROTTLE_API_KEYS={"secret": "lab"},
+        REFBOOKS_THROTTLE_CLIENT_RATES={"lab": {"check": "3/min"}},
+        REFBOOKS_THROTTLE_CACHE="default",
+    )
+    def test_client_quota_in_shared_cache(self):
+        cache.clear()
+        statuses = [
+            self.client.get(self.url, self.params, HTTP_X_API_KEY="secret").status_code
+            for _ in range(4)
+        ]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        # Неизвестный ключ не даёт отдельного ведра: клиент определяется по IP.
+        statuses = [
+            self.client.get(self.url, self.params, HTTP_X_API_KEY="other").status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertFalse(local_buckets._buckets)
+
+    async def test_async_view(self):
+        view = AsyncCheckElementView.as_view()
+        factory = AsyncRequestFactory()
+        for _ in range(2):
+            response = await view(factory.get("/", self.params), id=self.directory.id)
+            self.assertEqual(response.status_code, 200)
+        response = await view(factory.get("/", self.params), id=self.directory.id)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("detail", json.loads(response.content))
+        self.assertEqual(response["X-RateLimit-Remaining"], "0")
+
+
+class JobsTestCase(RefbookTestCase):
+    def setUp(self):
+        super().setUp()
+        self.jobs_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.jobs_dir.cleanup)
+        settings = override_settings(
+            REFBOOKS_JOBS_BACKEND="worker", REFBOOKS_JOBS_DIR=self.jobs_dir.name
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        new = Version.objects.create(
+            directory=self.directory, version="2.0", start_date=date(2021, 1, 1)
+        )
+        for version, values in (
+            (self.version, ("Хирург", "Терапевт")),
+            (new, ("Хирург",)),
+        ):
+            for number, value in enumerate(values):
+                Element.objects.create(
+                    directory_version=version,
+                    element_code=f"J0{number}",
+                    element_value=value,
+                )
+        self.url = reverse("refbook-jobs")
+
+    def create(self, data, **kwargs):
+        response = self.client.post(self.url, data, **kwargs)
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response["Location"], f"/refbooks/jobs/{response.data['id']}")
+        return response.data
+
+    def test_export_job(self):
+        job = self.create(
+            {"kind": "export", "refbook": self.directory.id, "format": "csv"},
+            format="json",
+        )
+        self.assertEqual(job["status"], "pending")
+        self.assertIsNone(job["download"])
+        response = self.client.get(reverse("refbook-job-download", args=[job["id"]]))
+        self.assertEqual(response.status_code, 409)
+
+        call_command("refbook_worker", "--once", stdout=StringIO())
+
+        job = self.client.get(reverse("refbook-job", args=[job["id"]])).data
+        self.assertEqual(job["status"], "done")
+        self.assertEqual((job["progress"], job["total"]), (1, 1))
+        self.assertEqual(job["result"], {"version": "2.0", "rows": 1})
+        response = self.client.get(job["download"])
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        self.assertIn("attachment", response["Content-Disposition"])
+        stream = self.client.get(
+            reverse("refbook-elements", args=[self.directory.id]), {"stream": "csv"}
+        )
+        self.assertEqual(
+            b"".join(response.streaming_content), b"".join(stream.streaming_content)
+        )
+
+    def test_diff_job(self):
+        job = self.create(
+            {"kind": "diff", "refbook": self.directory.id, "from": "1.0"},
+            format="json",
+        )
+        self.assertEqual(jobs.run(job["id"]).status, Job.DONE)
+        self.assertIsNone(jobs.run(job["id"]))
+
+        job = self.client.get(reverse("refbook-job", args=[job["id"]])).data
+        self.assertEqual(job["result"], {"added": 0, "removed": 1, "changed": 0})
+        response = self.client.get(job["download"])
+        diff = self.client.get(
+            reverse("refbook-diff", args=[self.directory.id]), {"from": "1.0"}
+        )
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), diff.json())
+
+    def test_import_job(self):
+        upload = StringIO("element_code,element_value\nA01,Анестезиолог\n")
+        upload.name = "specialities.csv"
+        data = {
+            "kind": "import",
+            "directory": "2",
+            "name": "Должности",
+            "version": "1.0",
+            "start_date": "2022-01-01",
+            "file": upload,
+        }
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 403)
+
+        upload.seek(0)
+        self.client.force_authenticate(
+            User.objects.create_superuser("admin", "admin@example.com", "pw")
+        )
+        job = self.create(data)
+        self.assertEqual(len(os.listdir(self.jobs_dir.name)), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.run(job["id"])
+
+        job = Job.objects.get(pk=job["id"])
+        self.assertEqual(job.status, Job.DONE, job.error)
+        self.assertEqual(job.progress, 1)
+        version = Version.objects.get(directory__code="2", version="1.0")
+        self.assertEqual(version.start_date, date(2022, 1, 1))
+        self.assertEqual(version.element_set.get().element_value, "Анестезиолог")
+        self.assertEqual(os.listdir(self.jobs_dir.name), [])
+
+    def test_invalid_jobs(self):
+        response = self.client.post(
+            self.url, {"kind": "diff", "refbook": self.directory.id}, format="json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("from", response.data)
+        response = self.client.post(
+            self.url,
+            {"kind": "export", "refbook": self.directory.id, "version": "9.9"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse("refbook-job", args=["00000000-0000-0000-0000-000000000000"])
+        )
+        self.assertEqual(response.status_code, 404)
+
+        job = self.create(
+            {"kind": "export", "refbook": self.directory.id, "version": "1.0"},
+            format="json",
+        )
+        Version.objects.filter(version="1.0").delete()
+        version_resolver.clear()
+        job = jobs.run(job["id"])
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.error, "Версия 1.0 справочника не найдена")
+
+    def test_thread_backend_and_purge(self):
+        with self.settings(REFBOOKS_JOBS_BACKEND="thread"):
+            with mock.patch("refbooks.jobs.executor") as executor:
+                with self.captureOnCommitCallbacks(execute=True):
+                    job = jobs.submit(Job.DIFF, {"refbook": self.directory.id})
+        executor().submit.assert_any_call(jobs._run_in_thread, job.pk)
+        jobs._queued.clear()
+
+        job = jobs.submit(
+            Job.EXPORT,
+            {"refbook": self.directory.id, "version": "2.0", "format": "ndjson"},
+        )
+        job = jobs.run(job.pk)
+        artifact = jobs.artifact_path(job)
+        self.assertTrue(artifact.is_file())
+        self.assertEqual(jobs.purge(timedelta(days=1)), 0)
+        Job.objects.filter(pk=job.pk).update(
+            finished_at=job.finished_at - timedelta(days=2)
+        )
+        self.assertEqual(jobs.purge(timedelta(days=1)), 1)
+        self.assertFalse(artifact.exists())
+
+    def test_maintenance_reclaims_and_requeues(self):
+        stale = datetime.now(timezone.utc) - timedelta(hours=1)
+        running = Job.objects.create(
+            kind=Job.DIFF, status=Job.RUNNING, started_at=stale, heartbeat_at=stale
+        )
+        alive = Job.objects.create(
+            kind=Job.DIFF, status=Job.RUNNING, heartbeat_at=datetime.now(timezone.utc)
+        )
+        pending = Job.objects.create(kind=Job.DIFF, created_at=stale)
+        # Журнал изменений фикстуры: on_commit в транзакции теста не вызывается.
+        sequence()
+        with self.settings(REFBOOKS_JOBS_BACKEND="thread"):
+            with mock.patch("refbooks.jobs.executor") as executor:
+                self.addCleanup(jobs._queued.clear)
+                self.assertEqual(
+                    jobs.maintain(),
+                    {"reclaimed": 1, "requeued": 1, "purged": 0, "sequenced": 0},
+                )
+                # Задача уже в очереди пула и не передаётся ему повторно.
+                self.assertEqual(jobs.maintain()["requeued"], 0)
+        executor().submit.assert_called_once_with(jobs._run_in_thread, pending.pk)
+        running.refresh_from_db()
+        self.assertEqual(running.status, Job.FAILED)
+        self.assertEqual(running.error, "Исполнитель задачи прекратил работу")
+        alive.refresh_from_db()
+        self.assertEqual(alive.status, Job.RUNNING)
+
+    def test_progress_is_kept_in_job_row(self):
+        job = jobs.submit(
+            Job.EXPORT,
+            {"refbook": self.directory.id, "version": "1.0", "format": "ndjson"},
+        )
+        with self.settings(REFBOOKS_EXPORT_CHUNK_SIZE=1):
+            job = jobs.run(job.pk)
+        self.assertEqual(Job.objects.get(pk=job.pk).progress, 2)
+        self.assertIsNotNone(job.heartbeat_at)
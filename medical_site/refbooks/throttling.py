@@ -0,0 +1,197 @@
+"""Ограничение частоты запросов клиентов (token bucket).
+
+У каждого клиента своё «ведро» на каждую группу представлений
+(REFBOOKS_THROTTLE_RATES): проверка элементов, выгрузка элементов, список
+справочников. Ведро вмещает N токенов и пополняется со скоростью N за
+период; запрос забирает один токен. Для ведра хранятся только число токенов
+и время последнего пополнения, поэтому проверка выполняется за O(1) без
+обращения к БД, а кратковременные всплески до N запросов не отклоняются.
+
+Клиент определяется по ключу из заголовка X-API-Key, если ключ известен
+(REFBOOKS_THROTTLE_API_KEYS), иначе по IP-адресу. Адрес берётся из
+REMOTE_ADDR; заголовок X-Forwarded-For задаёт сам клиент, поэтому он
+учитывается, только если приложение работает за доверенными
+прокси-серверами (REFBOOKS_THROTTLE_NUM_PROXIES): тогда адресом клиента
+считается запись, добавленная самым дальним из них. Для отдельных клиентов
+можно задать собственные лимиты (REFBOOKS_THROTTLE_CLIENT_RATES).
+
+Вёдра хранятся в памяти процесса (лимит действует на каждый процесс
+отдельно) или, если задан REFBOOKS_THROTTLE_CACHE, в общем кэше. Кэш не
+обновляет ведро атомарно, поэтому при одновременных запросах клиента лимит
+может быть превышен на несколько запросов.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import registry
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate: Optional[str]) -> Optional[tuple[int, float]]:
+    """Ёмкость ведра и скорость пополнения (токенов в секунду) для «100/min».
+
+    :return: (ёмкость, скорость) или None, если ограничения нет
+    :rtype: tuple or None
+    """
+    if rate is None:
+        return None
+    number, period = rate.split("/")
+    capacity = int(number)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+def take(state: Optional[tuple], capacity: int, refill: float, now: float):
+    """Забирает токен из ведра.
+
+    :param state: (токены, время пополнения) или None для нового ведра
+    :return: новое состояние и признак, что токен получен
+    :rtype: tuple
+    """
+    if state is None:
+        tokens = float(capacity)
+    else:
+        tokens, updated = state
+        tokens = min(capacity, tokens + (now - updated) * refill)
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    return (tokens, now), allowed
+
+
+class LocalBuckets:
+    """Вёдра в памяти процесса; давно не использованные вытесняются."""
+
+    def __init__(self, max_clients: int):
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, refill: float) -> tuple:
+        with self._lock:
+            state, allowed = take(
+                self._buckets.get(key), capacity, refill, time.monotonic()
+            )
+            self._buckets[key] = state
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return state[0], allowed
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBuckets:
+    """Вёдра в общем кэше Django, общие для всех процессов."""
+
+    def __init__(self, alias: str):
+        self.alias = alias
+
+    def take(self, key: str, capacity: int, refill: float) -> tuple:
+        cache = caches[self.alias]
+        key = f"refbooks:throttle:{key}"
+        state, allowed = take(cache.get(key), capacity, refill, time.time())
+        # Пополненное до конца ведро не отличается от отсутствующего, поэтому
+        # запись хранится только до этого момента.
+        cache.set(key, state, math.ceil(capacity / refill) + 1)
+        return state[0], allowed
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Ограничение частоты для группы представлений ``view.throttle_scope``.
+
+    Представления без throttle_scope или с группой без лимита не ограничены.
+    """
+
+    def allow_request(self, request, view) -> bool:
+        scope = getattr(view, "throttle_scope", None)
+        client, ident = self.get_client(request)
+        rate = parse_rate(client_rates(client).get(scope)) if scope else None
+        if rate is None:
+            return True
+        self.capacity, self.refill = rate
+        self.tokens, allowed = buckets().take(f"{scope}:{ident}", *rate)
+        # Состояние для заголовков X-RateLimit-* (HttpRequest, а не Request DRF).
+        getattr(request, "_request", request).rate_limit = self
+        if not allowed:
+            registry.inc("refbooks_throttled_requests_total", {"scope": scope})
+        return allowed
+
+    def get_client(self, request) -> tuple[Optional[str], str]:
+        """Имя клиента по ключу API (или None) и идентификатор для ведра."""
+        keys = getattr(settings, "REFBOOKS_THROTTLE_API_KEYS", {})
+        client = keys.get(request.META.get("HTTP_X_API_KEY"))
+        if client is not None:
+            return client, f"key:{client}"
+        return None, f"ip:{client_address(request)}"
+
+    def wait(self) -> float:
+        return max(0.0, (1 - self.tokens) / self.refill)
+
+    def headers(self) -> dict:
+        return {
+            "X-RateLimit-Limit": str(self.capacity),
+            "X-RateLimit-Remaining": str(int(self.tokens)),
+            # Через сколько секунд ведро наполнится полностью.
+            "X-RateLimit-Reset": str(
+                math.ceil((self.capacity - self.tokens) / self.refill)
+            ),
+        }
+
+
+def client_address(request) -> str:
+    """IP-адрес клиента с учётом REFBOOKS_THROTTLE_NUM_PROXIES прокси."""
+    proxies = getattr(settings, "REFBOOKS_THROTTLE_NUM_PROXIES", 0)
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR")
+    if proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(",")]
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def client_rates(client: Optional[str]) -> dict:
+    rates = getattr(settings, "REFBOOKS_THROTTLE_RATES", {})
+    if client is None:
+        return rates
+    overrides = getattr(settings, "REFBOOKS_THROTTLE_CLIENT_RATES", {})
+    return {**rates, **overrides.get(client, {})}
+
+
+def set_rate_limit_headers(request, response) -> None:
+    throttle = getattr(getattr(request, "_request", request), "rate_limit", None)
+    if throttle is not None:
+        for header, value in throttle.headers().items():
+            response.headers[header] = value
+
+
+class RateLimitMixin:
+    """Ограничение частоты для APIView и заголовки X-RateLimit-* в ответе."""
+
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        set_rate_limit_headers(request, response)
+        return response
+
+
+local_buckets = LocalBuckets(
+    getattr(settings, "REFBOOKS_THROTTLE_MAX_CLIENTS", 100_000)
+)
+
+
+def buckets():
+    alias = getattr(settings, "REFBOOKS_THROTTLE_CACHE", None)
+    if alias is not None:
+        return CacheBuckets(alias)
+    return local_buckets
@@ -1,9 +1,58 @@
+from django.conf import settings
 from django.urls import path
-from .views import DirectoryView, ElementView, CheckElementView, index
+from .views import (
+    ChangesView,
+    CheckElementView,
+    DiffView,
+    DirectoryView,
+    ElementHistoryView,
+    ElementSearchView,
+    ElementView,
+    JobDownloadView,
+    JobView,
+    JobsView,
+    index,
+    metrics,
+)
 
-urlpatterns = [
+if getattr(settings, "REFBOOKS_ASYNC_VIEWS", False):
+    from .async_views import (
+        AsyncCheckElementView as CheckElementView,
+        AsyncDirectoryView as DirectoryView,
+        AsyncElementView as ElementView,
+    )
+
+# Чтение справочников: их обслуживают и узлы только для чтения (urls_api).
+read_urlpatterns = [
     path("", index, name="refbook-directory"),
     path("refbooks/", DirectoryView.as_view(), name="refbook-directory"),
+    path("refbooks/changes", ChangesView.as_view(), name="refbook-changes"),
     path("refbooks/<int:id>/elements/", ElementView.as_view(), name="refbook-elements"),
+    path(
+        "refbooks/<int:id>/elements/search",
+        ElementSearchView.as_view(),
+        name="refbook-element-search",
+    ),
     path("refbooks/<int:id>/check_element", CheckElementView.as_view(), name="check-element"),
+    path(
+        "refbooks/<int:id>/history",
+        ElementHistoryView.as_view(),
+        name="refbook-history",
+    ),
+    path("refbooks/<int:id>/diff", DiffView.as_view(), name="refbook-diff"),
+    path("metrics", metrics, name="metrics"),
+]
+
+# Фоновые задачи: импорт изменяет справочники, а задачи и их файлы
+# создаются на узле, который их выполняет.
+job_urlpatterns = [
+    path("refbooks/jobs", JobsView.as_view(), name="refbook-jobs"),
+    path("refbooks/jobs/<uuid:job_id>", JobView.as_view(), name="refbook-job"),
+    path(
+        "refbooks/jobs/<uuid:job_id>/download",
+        JobDownloadView.as_view(),
+        name="refbook-job-download",
+    ),
 ]
+
+urlpatterns = read_urlpatterns + job_urlpatterns
@@ -0,0 +1,101 @@
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from .element_index import element_index
+from .models import Element
+from .snapshots import snapshot_store
+from .version_resolver import VersionRef, version_resolver
+
+# Ограничение числа параметров в одном запросе ``IN (...)`` (SQLite — 999).
+CODES_CHUNK_SIZE = 500
+
+
+def check_elements(items: Iterable[dict], directory_id: Optional[int] = None) -> list:
+    """Пакетная валидация элементов справочников.
+
+    Каждый элемент ``items`` содержит ``code``, ``value`` и, при необходимости,
+    ``version`` и ``refbook`` (идентификатор справочника, по умолчанию
+    ``directory_id``). Версии определяются через ``version_resolver``,
+    а элементы одной версии проверяются одним запросом по множеству кодов.
+
+    :return: Список результатов в порядке входных элементов
+    :rtype: list[dict]
+    """
+    items = list(items)
+    requested = [
+        (item.get("refbook", directory_id), item.get("version")) for item in items
+    ]
+    existing = {
+        refbook
+        for refbook, _ in set(requested)
+        if refbook is not None and version_resolver.directory_exists(refbook)
+    }
+    versions = {}
+    for refbook, version in set(requested):
+        if refbook in existing:
+            ref = (
+                version_resolver.get(refbook, version)
+                if version
+                else version_resolver.effective(refbook)
+            )
+            if ref is not None:
+                versions[(refbook, version)] = ref
+
+    codes = defaultdict(set)
+    refs = {}
+    for item, key in zip(items, requested):
+        if key in versions:
+            codes[versions[key].id].add(item["code"])
+            refs[versions[key].id] = versions[key]
+    found = {
+        version_id: _load_elements(refs[version_id], version_codes)
+        for version_id, version_codes in codes.items()
+    }
+
+    results = []
+    for item, (refbook, version) in zip(items, requested):
+        result = {
+            "refbook": refbook,
+            "code": item["code"],
+            "value": item["value"],
+            "version": version,
+        }
+        if refbook not in existing:
+            result.update(found=False, error="Справочник не найден")
+        elif (refbook, version) not in versions:
+            result.update(
+                found=False,
+                error="Версия не найдена"
+                if version
+                else "Не найдено версий для указанного справочника",
+            )
+        else:
+            ref = versions[(refbook, version)]
+            result.update(
+                version=ref.version,
+                found=(item["code"], item["value"]) in found[ref.id],
+            )
+        results.append(result)
+    return results
+
+
+def _load_elements(version: VersionRef, codes: set) -> set:
+    snapshot = snapshot_store.get(version)
+    if snapshot is not None:
+        return {(code, snapshot.get(code)) for code in codes}
+    version_id = version.id
+    elements = element_index.peek(version_id)
+    if elements is not None:
+        return elements
+    codes = list(codes)
+    loaded = set()
+    for start in range(0, len(codes), CODES_CHUNK_SIZE):
+        loaded.update(
+            Element.objects.filter(
+                directory_version_id=version_id,
+                element_code__in=codes[start : start + CODES_CHUNK_SIZE],
+            )
+            .order_by()
+            .values_list("element_code", "element_value")
+        )
+    return loaded
@@ -0,0 +1,201 @@
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, datetime
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .metrics import cache_result
+from .models import Directory, Version
+
+
+class VersionRef(NamedTuple):
+    id: int
+    version: str
+    start_date: Optional[date]
+    revision: int
+    updated_at: datetime
+
+
+class _Timeline(NamedTuple):
+    dates: list
+    versions: list
+    by_name: dict
+
+
+class VersionResolver:
+    """Определение действующей версии справочника без запросов к БД.
+
+    Для каждого справочника в памяти процесса хранится упорядоченная по дате
+    начала действия шкала версий. Действующей на дату D считается версия
+    с наибольшей датой начала, не превышающей D; она находится бинарным
+    поиском. Шкала загружается одним запросом при первом обращении и
+    сбрасывается сигналами при изменении версий, а также по истечении ``ttl``.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self._timelines: dict[int, tuple[float, Optional[_Timeline]]] = {}
+        self._directories: dict[int, int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def effective(
+        self, directory_id: int, on_date: Optional[date] = None
+    ) -> Optional[VersionRef]:
+        """Возвращает версию справочника, действующую на дату.
+
+        :param on_date: Дата, по умолчанию текущая
+        :return: Действующая версия или None, если справочника или версий нет
+        :rtype: VersionRef or None
+        """
+        return _effective(self._timeline(directory_id), on_date)
+
+    def get(self, directory_id: int, version: str) -> Optional[VersionRef]:
+        """Возвращает версию справочника по её наименованию."""
+        timeline = self._timeline(directory_id)
+        return timeline.by_name.get(version) if timeline is not None else None
+
+    def versions(self, directory_id: int) -> Optional[list]:
+        """Версии справочника с датой начала действия в порядке этих дат.
+
+        :return: Список версий или None, если справочника нет
+        :rtype: list[VersionRef] or None
+        """
+        timeline = self._timeline(directory_id)
+        return timeline.versions if timeline is not None else None
+
+    def next_activation(
+        self, directory_id: int, on_date: Optional[date] = None
+    ) -> Optional[date]:
+        """Ближайшая дата после ``on_date``, с которой начнёт действовать
+        другая версия справочника, или None, если таких версий нет."""
+        return _next_activation(self._timeline(directory_id), on_date)
+
+    def directory_exists(self, directory_id: int) -> bool:
+        return self._timeline(directory_id) is not None
+
+    async def aeffective(
+        self, directory_id: int, on_date: Optional[date] = None
+    ) -> Optional[VersionRef]:
+        return _effective(await self._atimeline(directory_id), on_date)
+
+    async def aget(self, directory_id: int, version: str) -> Optional[VersionRef]:
+        timeline = await self._atimeline(directory_id)
+        return timeline.by_name.get(version) if timeline is not None else None
+
+    async def anext_activation(
+        self, directory_id: int, on_date: Optional[date] = None
+    ) -> Optional[date]:
+        return _next_activation(await self._atimeline(directory_id), on_date)
+
+    async def adirectory_exists(self, directory_id: int) -> bool:
+        return await self._atimeline(directory_id) is not None
+
+    def invalidate(self, directory_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            self._timelines.pop(directory_id, None)
+
+    def invalidate_version(self, version_id: int) -> None:
+        with self._lock:
+            self._generation += 1
+            directory_id = self._directories.pop(version_id, None)
+            if directory_id is not None:
+                self._timelines.pop(directory_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._timelines.clear()
+            self._directories.clear()
+
+    def _timeline(self, directory_id: int) -> Optional[_Timeline]:
+        found, timeline, generation = self._cached(directory_id)
+        if found:
+            return timeline
+        refs = list(_versions(directory_id))
+        if not refs and not Directory.objects.filter(id=directory_id).exists():
+            return self._remember(directory_id, generation, None)
+        return self._remember(directory_id, generation, _build(refs))
+
+    async def _atimeline(self, directory_id: int) -> Optional[_Timeline]:
+        found, timeline, generation = self._cached(directory_id)
+        if found:
+            return timeline
+        refs = [ref async for ref in _versions(directory_id)]
+        if not refs and not await Directory.objects.filter(id=directory_id).aexists():
+            return self._remember(directory_id, generation, None)
+        return self._remember(directory_id, generation, _build(refs))
+
+    def _cached(self, directory_id: int) -> tuple[bool, Optional[_Timeline], int]:
+        with self._lock:
+            if directory_id in self._timelines:
+                loaded_at, timeline = self._timelines[directory_id]
+                if self.ttl is None or time.monotonic() - loaded_at <= self.ttl:
+                    cache_result("version_resolver", "hit")
+                    return True, timeline, self._generation
+            generation = self._generation
+        cache_result("version_resolver", "miss")
+        return False, None, generation
+
+    def _remember(
+        self, directory_id: int, generation: int, timeline: Optional[_Timeline]
+    ) -> Optional[_Timeline]:
+        with self._lock:
+            if generation == self._generation:
+                self._timelines[directory_id] = (time.monotonic(), timeline)
+                if timeline is not None:
+                    for ref in timeline.by_name.values():
+                        self._directories[ref.id] = directory_id
+        return timeline
+
+
+def _versions(directory_id: int):
+    return (
+        Version.objects.filter(directory_id=directory_id)
+        .order_by()
+        .values_list(*VersionRef._fields)
+    )
+
+
+def _build(refs: list) -> _Timeline:
+    refs = [VersionRef(*ref) for ref in refs]
+    dated = sorted(
+        (ref for ref in refs if ref.start_date is not None),
+        key=lambda ref: ref.start_date,
+    )
+    return _Timeline(
+        dates=[ref.start_date for ref in dated],
+        versions=dated,
+        by_name={ref.version: ref for ref in refs},
+    )
+
+
+def _effective(
+    timeline: Optional[_Timeline], on_date: Optional[date]
+) -> Optional[VersionRef]:
+    if timeline is None:
+        return None
+    position = bisect_right(timeline.dates, on_date or timezone.localdate())
+    return timeline.versions[position - 1] if position else None
+
+
+def _next_activation(
+    timeline: Optional[_Timeline], on_date: Optional[date]
+) -> Optional[date]:
+    if timeline is None:
+        return None
+    position = bisect_right(timeline.dates, on_date or timezone.localdate())
+    return timeline.dates[position] if position < len(timeline.dates) else None
+
+
+def activation_time(start_date: date) -> datetime:
+    """Момент, с которого версия с датой начала ``start_date`` становится
+    действующей: начало этих суток в часовом поясе TIME_ZONE."""
+    return timezone.make_aware(datetime.combine(start_date, datetime.min.time()))
+
+
+version_resolver = VersionResolver(ttl=getattr(settings, "REFBOOKS_RESOLVER_TTL", 300))
@@ -1,17 +1,59 @@
-from django.core.exceptions import ObjectDoesNotExist
-from django.http import HttpResponse
-from django.utils import timezone
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 
-from drf_yasg import openapi
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Directory, Version, Element
-from .serializers import DirectorySerializer, ElementSerializer
+from . import jobs
+from .changes import changes_until, stream_changes
+from .conditional import (
+    diff_cache_validators,
+    directory_cache_validators,
+    element_cache_validators,
+    not_modified,
+    set_cache_headers,
+)
+from .diff import version_diff
+from .element_index import element_index
+from .export import (
+    STREAM_CONTENT_TYPES,
+    element_list,
+    element_page,
+    split_page,
+    stream_elements,
+)
+from .history import history_index
+from .metrics import registry
+from .models import Directory, Job
+from .payload_cache import cached_response
+from .params import (
+    InvalidParameter,
+    parse_date,
+    parse_directory_cursor,
+    parse_limit,
+    parse_sequence,
+    parse_stream,
+)
+from .renderers import ColumnarJSONRenderer
+from .search import SEARCH_LIMIT, search_elements
+from .snapshots import snapshot_store
+from .serializers import (
+    CheckElementBatchSerializer,
+    CheckElementSerializer,
+    DirectorySerializer,
+    ElementHistorySerializer,
+    ElementSerializer,
+    JobCreateSerializer,
+    JobSerializer,
+)
+from .throttling import RateLimitMixin
+from .validation import check_elements
+from .version_resolver import version_resolver
 from rest_framework import status
-from drf_yasg.utils import swagger_auto_schema
+from .schema import openapi, swagger_auto_schema
 
 
-class DirectoryView(APIView):
+class DirectoryView(RateLimitMixin, APIView):
     """
     Получение списка справочников
     Метод: refbooks/[?date=<date>]
@@ -21,12 +63,23 @@ class DirectoryView(APIView):
             Если указана, то возвратятся только те справочники,
             в которых имеются Версии с Датой начала действия раннее
             или равной указанной.
+    - with_version: Если указан, для каждого справочника возвращается
+            версия, действующая на дату date (по умолчанию текущую).
+    - limit: Размер страницы. Если указан, справочники возвращаются
+            постранично в порядке идентификаторов.
+    - after: Идентификатор справочника, после которого начинается страница
+            (значение next из предыдущего ответа).
     Формат ответа:
     - refbooks: Список объектов справочников
         - id: Идентификатор справочника
         - code: Код справочника
         - name: Наименование справочника
+        - current_version: Действующая версия (только при with_version)
+        - start_date: Дата начала действующей версии (только при with_version)
+    - next: Курсор следующей страницы (только при указании limit)
     Пример запроса: GET /refbooks/?date=2022-10-01"""
+    throttle_scope = "directory"
+
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter(
@@ -36,28 +89,58 @@ class DirectoryView(APIView):
                 type=openapi.TYPE_STRING,
                 format="YYYY-MM-DD",
             ),
+            openapi.Parameter(
+                "with_version",
+                openapi.IN_QUERY,
+                description="Добавить действующую версию справочника",
+                type=openapi.TYPE_BOOLEAN,
+                required=False,
+            ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                description="Размер страницы",
+                type=openapi.TYPE_INTEGER,
+                required=False,
+            ),
+            openapi.Parameter(
+                "after",
+                openapi.IN_QUERY,
+                description="Идентификатор, после которого начинается страница",
+                type=openapi.TYPE_INTEGER,
+                required=False,
+            ),
         ],
         responses={200: DirectorySerializer(many=True)},
     )
     def get(self, request) -> Response:
-        date = self.request.query_params.get("date")
+        with_version = "with_version" in self.request.query_params
+        try:
+            date = parse_date(self.request.query_params.get("date"))
+            limit = parse_limit(self.request.query_params.get("limit"))
+            after = parse_directory_cursor(self.request.query_params.get("after"))
+        except InvalidParameter as error:
+            return Response({"error": str(error)}, status=400)
 
-        if date:
-            directories = Directory.objects.filter(version__start_date__lte=date)
-        else:
-            directories = Directory.objects.all()
+        etag, last_modified, max_age = directory_cache_validators(request)
+        response = not_modified(request, etag, last_modified, max_age)
+        if response is not None:
+            return response
 
-        directory_data = []
-        for directory in directories:
-            serializer = DirectorySerializer(directory)
-            data = serializer.data
-            if not any(entry["id"] == data["id"] for entry in directory_data):
-                directory_data.append(data)
+        def listing() -> dict:
+            directories = Directory.objects.listing(date, with_version, after)
+            if limit is None:
+                return {"refbooks": list(directories)}
+            directory_data, next_cursor = split_page(
+                list(directories[: limit + 1]), limit, cursor=lambda row: row["id"]
+            )
+            return {"refbooks": directory_data, "next": next_cursor}
 
-        return Response({"refbooks": directory_data})
+        response = cached_response(request, etag, listing)
+        return set_cache_headers(response, etag, last_modified, max_age)
 
 
-class ElementView(APIView):
+class ElementView(RateLimitMixin, APIView):
     """
     Получение элементов заданного справочника
     Метод: refbooks/<id>/elements[?version=<version>]
@@ -68,13 +151,26 @@ class ElementView(APIView):
                 Если не указана, то возвращаются элементы текущей версии.
                 Текущая версия, дата начала действия которой позже всех
                 остальных версий данного справочника, но не позже текущей даты.
+        - limit: Размер страницы. Если указан, элементы возвращаются
+                постранично в порядке кодов.
+        - after: Код элемента, после которого начинается страница
+                (значение next из предыдущего ответа).
+        - stream: Потоковая выгрузка всех элементов версии: ndjson или csv.
     Формат ответа:
         - elements: Список элементов в версии справочника
         - code: Код элемента
         - value: Значение элемента
+        - next: Курсор следующей страницы (только при указании limit)
+    Компактный формат (Accept: application/vnd.refbooks.columns+json):
+        - codes, values: Коды и значения элементов в одном порядке
     Пример запроса:
     GET /refbooks/1/elements?version=1.0
+    GET /refbooks/1/elements?limit=1000&after=J00
+    GET /refbooks/1/elements?stream=ndjson
     """
+    throttle_scope = "export"
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
+
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter(
@@ -91,46 +187,97 @@ class ElementView(APIView):
                 type=openapi.TYPE_STRING,
                 required=False,
             ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                description="Размер страницы",
+                type=openapi.TYPE_INTEGER,
+                required=False,
+            ),
+            openapi.Parameter(
+                "after",
+                openapi.IN_QUERY,
+                description="Код элемента, после которого начинается страница",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+            openapi.Parameter(
+                "stream",
+                openapi.IN_QUERY,
+                description="Потоковая выгрузка",
+                type=openapi.TYPE_STRING,
+                enum=list(STREAM_CONTENT_TYPES),
+                required=False,
+            ),
         ],
         responses={200: ElementSerializer(many=True)},
     )
     def get(self, request, id) -> Response:
         version_param = self.request.query_params.get("version")
-
+        after = self.request.query_params.get("after")
         try:
-            directory = Directory.objects.get(id=id)
-        except ObjectDoesNotExist:
+            limit = parse_limit(self.request.query_params.get("limit"))
+            stream = parse_stream(self.request.query_params.get("stream"))
+        except InvalidParameter as error:
+            return Response({"error": str(error)}, status=400)
+
+        if not version_resolver.directory_exists(id):
             return Response({"error": "Справочник не найден"}, status=404)
 
         if version_param:
-            try:
-                version = Version.objects.get(
-                    directory=directory, version=version_param
-                )
-            except ObjectDoesNotExist:
+            version = version_resolver.get(id, version_param)
+            if version is None:
                 return Response(
                     {"error": "Версия не найдена для указанного справочника"},
                     status=404,
                 )
         else:
-            latest_version = directory.version_set.filter(
-                start_date__lte=timezone.now()
-            ).latest("start_date")
-
-            if not latest_version:
+            version = version_resolver.effective(id)
+            if version is None:
                 return Response(
                     {"error": "Не найдено версий для указанного справочника"},
                     status=404,
                 )
-            version = latest_version
 
-        elements = Element.objects.filter(directory_version=version)
-        element_data = ElementSerializer(elements, many=True).data
+        etag, last_modified, max_age = element_cache_validators(
+            request,
+            version,
+            explicit=bool(version_param),
+            expires=None if version_param else version_resolver.next_activation(id),
+        )
+        response = not_modified(request, etag, last_modified, max_age)
+        if response is not None:
+            return response
 
-        return Response({"elements": element_data})
+        snapshot = snapshot_store.get(version)
+        if stream:
+            response = StreamingHttpResponse(
+                stream_elements(version.id, stream, after, snapshot),
+                content_type=STREAM_CONTENT_TYPES[stream],
+            )
+            response["Content-Disposition"] = (
+                f'attachment; filename="refbook-{id}-{version.version}.{stream}"'
+            )
+        elif limit is not None:
 
+            def page() -> dict:
+                element_data, next_cursor = element_page(
+                    version.id, limit, after, snapshot
+                )
+                return {"elements": element_data, "next": next_cursor}
 
-class CheckElementView(APIView):
+            response = cached_response(request, etag, page)
+        else:
+            response = cached_response(
+                request,
+                etag,
+                lambda: {"elements": element_list(version.id, snapshot)},
+            )
+
+        return set_cache_headers(response, etag, last_modified, max_age)
+
+
+class CheckElementView(RateLimitMixin, APIView):
     """Валидация элемента справочника
     Метод:refbooks/<id>/check_element?code=<code>&value=<value>[&version=<version>]
     Тип запроса HTTP: GET
@@ -148,7 +295,26 @@ class CheckElementView(APIView):
         Если элемент не найден, возвращается статус 404 "Элемент не найден в
         указанной версии".
     Пример запроса:
-    GET /refbooks/1/check_element?code=J00&value=Хирург[&version=1.0]"""
+    GET /refbooks/1/check_element?code=J00&value=Хирург[&version=1.0]
+
+    Пакетная валидация
+    Тип запроса HTTP: POST
+    Тело запроса:
+        - items: Список проверяемых элементов
+            - code: Код элемента справочника
+            - value: Значение элемента справочника
+            - version: Версия справочника (необязательно)
+            - refbook: Идентификатор справочника (необязательно,
+                    по умолчанию <id> из адреса)
+    Ответ:
+        - results: Результаты проверки в порядке элементов запроса
+            - refbook, code, value, version: Проверенный элемент
+            - found: Найден ли элемент в версии справочника
+            - error: Причина, если справочник или версия не найдены
+    Пример запроса:
+    POST /refbooks/1/check_element {"items": [{"code": "J00", "value": "Хирург"}]}"""
+    throttle_scope = "check"
+
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter(
@@ -183,36 +349,481 @@ class CheckElementView(APIView):
         responses={200: "Элемент найден", 404: "Элемент не найден"},
     )
     def get(self, request, id, *args, **kwargs) -> Response:
-        code = self.request.query_params.get("code")
-        value = self.request.query_params.get("value")
-        version = self.request.query_params.get("version")
+        serializer = CheckElementSerializer(data=self.request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        code = serializer.validated_data["code"]
+        value = serializer.validated_data["value"]
+        version = serializer.validated_data.get("version")
 
-        try:
-            directory = Directory.objects.get(id=id)
-        except ObjectDoesNotExist:
+        if not version_resolver.directory_exists(id):
             return Response(
                 {"error": "Справочник не найден"}, status=status.HTTP_404_NOT_FOUND
             )
 
         if version:
-            try:
-                version = directory.version_set.get(version=version)
-            except ObjectDoesNotExist:
+            current_version = version_resolver.get(id, version)
+            if current_version is None:
                 return Response(
                     {"error": "Версия не найдена"}, status=status.HTTP_404_NOT_FOUND
                 )
         else:
-            version = directory.get_latest_version()
+            current_version = version_resolver.effective(id)
+            if current_version is None:
+                return Response(
+                    {"error": "Не найдено версий для указанного справочника"},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+
+        snapshot = snapshot_store.get(current_version)
+        if snapshot is not None:
+            found = snapshot.contains(code, value)
+        else:
+            found = element_index.contains(id, current_version.version, code, value)
+        if found:
+            return Response({"message": "Элемент найден"}, status=status.HTTP_200_OK)
+        return Response(
+            {"error": "Элемент не найден в указанной версии"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    @swagger_auto_schema(
+        request_body=CheckElementBatchSerializer,
+        responses={200: "Результаты проверки", 400: "Некорректный запрос"},
+    )
+    def post(self, request, id, *args, **kwargs) -> Response:
+        serializer = CheckElementBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        results = check_elements(serializer.validated_data["items"], directory_id=id)
+        return Response({"results": results}, status=status.HTTP_200_OK)
 
+
+class ElementSearchView(RateLimitMixin, APIView):
+    """
+    Поиск элементов справочника
+    Метод: refbooks/<id>/elements/search?q=<query>[&version=<version>]
+    Тип запроса HTTP: GET
+    Параметры запроса:
+        - id: Идентификатор справочника
+        - q: Начало кода элемента или слова из значения элемента.
+                Слова значения сравниваются без учёта окончаний
+                (хирург, хирурга, хирургический).
+        - version: Версия справочника. Если не указана, то поиск выполняется
+                в текущей версии.
+        - limit: Максимальное число результатов (по умолчанию 50).
+    Формат ответа:
+        - elements: Найденные элементы в порядке релевантности: сначала
+                совпадение кода, затем значения со всеми словами запроса.
+    Пример запроса:
+    GET /refbooks/1/elements/search?q=J0
+    GET /refbooks/1/elements/search?q=хирург&limit=10
+    """
+    throttle_scope = "check"
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, ColumnarJSONRenderer]
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "id",
+                openapi.IN_PATH,
+                description="Идентификатор справочника",
+                type=openapi.TYPE_INTEGER,
+                required=True,
+            ),
+            openapi.Parameter(
+                "q",
+                openapi.IN_QUERY,
+                description="Начало кода или слова значения элемента",
+                type=openapi.TYPE_STRING,
+                required=True,
+            ),
+            openapi.Parameter(
+                "version",
+                openapi.IN_QUERY,
+                description="Версия справочника",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                description="Максимальное число результатов",
+                type=openapi.TYPE_INTEGER,
+                required=False,
+            ),
+        ],
+        responses={200: ElementSerializer(many=True)},
+    )
+    def get(self, request, id) -> Response:
+        query = self.request.query_params.get("q", "").strip()
+        version_param = self.request.query_params.get("version")
+        if not query:
+            return Response({"error": "Не указан поисковый запрос q"}, status=400)
         try:
-            element = version.element_set.get(element_code=code, element_value=value)
-            return Response({"message": "Элемент найден"}, status=status.HTTP_200_OK)
-        except ObjectDoesNotExist:
+            limit = parse_limit(self.request.query_params.get("limit")) or SEARCH_LIMIT
+        except InvalidParameter as error:
+            return Response({"error": str(error)}, status=400)
+
+        if not version_resolver.directory_exists(id):
+            return Response({"error": "Справочник не найден"}, status=404)
+        if version_param:
+            version = version_resolver.get(id, version_param)
+        else:
+            version = version_resolver.effective(id)
+        if version is None:
             return Response(
-                {"error": "Элемент не найден в указанной версии"},
-                status=status.HTTP_400_BAD_REQUEST,
+                {"error": "Версия не найдена для указанного справочника"}, status=404
             )
 
+        etag, last_modified, max_age = element_cache_validators(
+            request,
+            version,
+            explicit=bool(version_param),
+            expires=None if version_param else version_resolver.next_activation(id),
+        )
+        response = not_modified(request, etag, last_modified, max_age)
+        if response is not None:
+            return response
+
+        response = cached_response(
+            request,
+            etag,
+            lambda: {"elements": search_elements(version, query, limit)},
+        )
+        return set_cache_headers(response, etag, last_modified, max_age)
+
+
+class ElementHistoryView(RateLimitMixin, APIView):
+    """
+    Значения элементов справочника на дату
+    Метод: refbooks/<id>/history
+    Тип запроса HTTP: POST
+    Тело запроса:
+        - date: Дата в формате ГГГГ-ММ-ДД
+        - codes: Список кодов элементов
+    Формат ответа:
+        - date: Дата из запроса
+        - version: Версия справочника, действующая на дату (null, если нет)
+        - elements: Значения в порядке кодов запроса
+            - element_code: Код элемента
+            - element_value: Значение на дату (null, если кода на дату нет)
+            - found: Существовал ли элемент на дату
+            - since: Дата начала действия версии, с которой действует значение
+    Пример запроса:
+    POST /refbooks/1/history {"date": "2021-06-01", "codes": ["J00", "J01"]}
+    """
+    throttle_scope = "check"
+
+    @swagger_auto_schema(
+        request_body=ElementHistorySerializer,
+        responses={200: "Значения элементов на дату", 404: "Справочник не найден"},
+    )
+    def post(self, request, id) -> Response:
+        serializer = ElementHistorySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        on_date = serializer.validated_data["date"]
+        elements = history_index.lookup(
+            id, serializer.validated_data["codes"], on_date
+        )
+        if elements is None:
+            return Response({"error": "Справочник не найден"}, status=404)
+        version = version_resolver.effective(id, on_date)
+        return Response(
+            {
+                "date": on_date,
+                "version": version.version if version is not None else None,
+                "elements": elements,
+            }
+        )
+
+
+class ChangesView(RateLimitMixin, APIView):
+    """
+    Лента изменений справочников, версий и элементов
+    Метод: refbooks/changes[?since=<seq>]
+    Тип запроса HTTP: GET
+    Параметры запроса:
+        - since: Номер последнего полученного изменения (по умолчанию 0 —
+                все изменения).
+        - limit: Наибольшее число изменений в ответе. Если не указан,
+                возвращаются все изменения после since.
+    Формат ответа: NDJSON, по одному изменению в строке в порядке номеров
+        - seq: Номер изменения
+        - model: directory, version или element
+        - action: save или delete
+        - id: Идентификатор объекта
+        - data: Поля объекта (для элемента — version, element_code,
+                element_value; для версии — directory, version, start_date)
+    Заголовок X-Changes-Until содержит номер, который следует передать
+    в since следующего запроса. Изменения записываются в транзакции вместе
+    с данными, а номера получают после фиксации в порядке фиксации, поэтому
+    изменение, зафиксированное после ответа, получит номер больше
+    X-Changes-Until и придёт в следующем ответе. Номера идут с пропусками.
+    Пример запроса:
+    GET /refbooks/changes?since=1500
+    """
+    throttle_scope = "export"
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "since",
+                openapi.IN_QUERY,
+                description="Номер последнего полученного изменения",
+                type=openapi.TYPE_INTEGER,
+                required=False,
+            ),
+            openapi.Parameter(
+                "limit",
+                openapi.IN_QUERY,
+                description="Наибольшее число изменений",
+                type=openapi.TYPE_INTEGER,
+                required=False,
+            ),
+        ],
+        responses={200: "Изменения в формате NDJSON"},
+    )
+    def get(self, request) -> StreamingHttpResponse:
+        try:
+            since = parse_sequence(self.request.query_params.get("since"))
+            limit = parse_limit(self.request.query_params.get("limit"))
+        except InvalidParameter as error:
+            return Response({"error": str(error)}, status=400)
+
+        until = changes_until(since, limit)
+        response = StreamingHttpResponse(
+            stream_changes(since, until),
+            content_type=STREAM_CONTENT_TYPES["ndjson"],
+        )
+        response["X-Changes-Until"] = until
+        response["Cache-Control"] = "no-cache"
+        return response
+
+
+class DiffView(RateLimitMixin, APIView):
+    """
+    Различия между двумя версиями справочника
+    Метод: refbooks/<id>/diff?from=<version>[&to=<version>]
+    Тип запроса HTTP: GET
+    Параметры запроса:
+        - id: Идентификатор справочника
+        - from: Исходная версия справочника
+        - to: Целевая версия справочника. Если не указана, то используется
+                текущая версия.
+    Формат ответа:
+        - from, to: Сравниваемые версии
+        - added: Элементы, появившиеся в версии to
+        - removed: Элементы, отсутствующие в версии to
+        - changed: Элементы с изменённым значением
+            - element_code: Код элемента
+            - old_value, new_value: Значения в версиях from и to
+    Пример запроса:
+    GET /refbooks/1/diff?from=1.0&to=2.0
+    """
+    throttle_scope = "export"
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "id",
+                openapi.IN_PATH,
+                description="Идентификатор справочника",
+                type=openapi.TYPE_INTEGER,
+                required=True,
+            ),
+            openapi.Parameter(
+                "from",
+                openapi.IN_QUERY,
+                description="Исходная версия справочника",
+                type=openapi.TYPE_STRING,
+                required=True,
+            ),
+            openapi.Parameter(
+                "to",
+                openapi.IN_QUERY,
+                description="Целевая версия справочника",
+                type=openapi.TYPE_STRING,
+                required=False,
+            ),
+        ],
+        responses={200: "Различия между версиями", 404: "Версия не найдена"},
+    )
+    def get(self, request, id) -> Response:
+        from_param = self.request.query_params.get("from")
+        to_param = self.request.query_params.get("to")
+
+        if not from_param:
+            return Response({"error": "Не указана исходная версия"}, status=400)
+        if not version_resolver.directory_exists(id):
+            return Response({"error": "Справочник не найден"}, status=404)
+
+        from_version = version_resolver.get(id, from_param)
+        if to_param:
+            to_version = version_resolver.get(id, to_param)
+        else:
+            to_version = version_resolver.effective(id)
+        if from_version is None or to_version is None:
+            return Response(
+                {"error": "Версия не найдена для указанного справочника"}, status=404
+            )
+
+        etag, last_modified, max_age = diff_cache_validators(
+            request,
+            from_version,
+            to_version,
+            explicit=bool(to_param),
+            expires=None if to_param else version_resolver.next_activation(id),
+        )
+        response = not_modified(request, etag, last_modified, max_age)
+        if response is not None:
+            return response
+
+        diff = version_diff(from_version, to_version)
+        response = Response(
+            {"from": from_version.version, "to": to_version.version, **diff}
+        )
+        return set_cache_headers(response, etag, last_modified, max_age)
+
+
+class JobsView(RateLimitMixin, APIView):
+    """
+    Создание фоновой задачи
+    Метод: refbooks/jobs
+    Тип запроса HTTP: POST
+    Тело запроса (JSON, для импорта — multipart/form-data):
+        - kind: export, diff или import
+        - export: refbook, version (по умолчанию текущая), format (ndjson, csv)
+        - diff: refbook, from, to (по умолчанию текущая версия)
+        - import: directory (код справочника), name (если справочник нужно
+                создать), version, start_date, format (по расширению), file.
+                Доступен только администраторам.
+    Ответ 202: задача в формате JobView, адрес задачи в заголовке Location.
+    Пример запроса:
+    POST /refbooks/jobs {"kind": "export", "refbook": 1, "format": "csv"}
+    """
+    throttle_scope = "export"
+
+    @swagger_auto_schema(
+        request_body=JobCreateSerializer,
+        responses={202: JobSerializer, 404: "Справочник или версия не найдены"},
+    )
+    def post(self, request) -> Response:
+        serializer = JobCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+
+        if data["kind"] == Job.IMPORT:
+            if not getattr(request.user, "is_staff", False):
+                return Response(
+                    {"error": "Импорт доступен только администраторам"}, status=403
+                )
+            params = {
+                "directory": data["directory"],
+                "name": data.get("name"),
+                "version": data["version"],
+                "start_date": data.get("start_date"),
+                "format": data["format"],
+                "upload": jobs.save_upload(data["file"], data["format"]),
+            }
+        else:
+            refbook = data["refbook"]
+            if not version_resolver.directory_exists(refbook):
+                return Response({"error": "Справочник не найден"}, status=404)
+            if data["kind"] == Job.EXPORT:
+                versions = {"version": data.get("version")}
+            else:
+                versions = {"from": data["from"], "to": data.get("to")}
+            for key, name in versions.items():
+                if name:
+                    version = version_resolver.get(refbook, name)
+                else:
+                    version = version_resolver.effective(refbook)
+                if version is None:
+                    return Response(
+                        {"error": "Версия не найдена для указанного справочника"},
+                        status=404,
+                    )
+                # Версия по умолчанию фиксируется на момент создания задачи.
+                versions[key] = version.version
+            params = {"refbook": refbook, **versions}
+            if data["kind"] == Job.EXPORT:
+                params["format"] = data["format"]
+
+        job = jobs.submit(data["kind"], params)
+        return Response(
+            JobSerializer(job, context={"request": request}).data,
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": reverse("refbook-job", args=[job.pk])},
+        )
+
+
+class JobView(APIView):
+    """
+    Состояние фоновой задачи
+    Метод: refbooks/jobs/<job_id>
+    Тип запроса HTTP: GET
+    Формат ответа:
+        - id, kind: Идентификатор и тип задачи
+        - status: pending, running, done или failed
+        - progress: Число обработанных элементов
+        - total: Общее число элементов, если известно
+        - result: Итог выполненной задачи (число элементов, версия и т. п.)
+        - error: Причина ошибки
+        - download: Адрес файла результата (когда задача выполнена)
+    Пример запроса:
+    GET /refbooks/jobs/5b0c1c1e-8d8c-4f6a-9a0e-3f1d2c4b5a69
+    """
+
+    @swagger_auto_schema(responses={200: JobSerializer, 404: "Задача не найдена"})
+    def get(self, request, job_id) -> Response:
+        job = Job.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({"error": "Задача не найдена"}, status=404)
+        jobs.schedule_maintenance()
+        return Response(JobSerializer(job, context={"request": request}).data)
+
+
+class JobDownloadView(APIView):
+    """
+    Файл результата фоновой задачи
+    Метод: refbooks/jobs/<job_id>/download
+    Тип запроса HTTP: GET
+    Ответ: файл выгрузки (NDJSON, CSV) или различий версий (JSON);
+        409, если задача ещё не выполнена.
+    """
+
+    @swagger_auto_schema(
+        responses={200: "Файл результата", 404: "Задача не найдена", 409: "Не готово"}
+    )
+    def get(self, request, job_id):
+        job = Job.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({"error": "Задача не найдена"}, status=404)
+        path = jobs.artifact_path(job)
+        if job.status != Job.DONE or path is None:
+            return Response({"error": "Результат задачи ещё не готов"}, status=409)
+        if not path.is_file():
+            return Response({"error": "Файл результата удалён"}, status=404)
+        file_format = path.suffix.lstrip(".")
+        return FileResponse(
+            path.open("rb"),
+            as_attachment=True,
+            filename=f"refbook-{job.kind}-{job.pk}.{file_format}",
+            content_type=jobs.CONTENT_TYPES[file_format],
+        )
+
+
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus."""
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 
 def index(request):
     return HttpResponse("<h1>Cервис терминологий</h1>")
\ No newline at end of file